@@ -0,0 +1,507 @@
+# async_database.py
+"""Асинхронный доступ к данным аудиотеки для сервисов и пакетных заданий.
+
+AsyncDatabase повторяет запросы Database (списки носителей, артистов и
+релизов, статистика, отчеты, изменения), но выполняет их на асинхронных
+соединениях psycopg2 в цикле событий asyncio: одно приложение может
+держать много одновременных запросов без потока на каждый.
+
+    async with AsyncDatabase() as db:
+        stats, page = await asyncio.gather(
+            db.get_collection_statistics(),
+            db.get_media_items_page(page_size=50))
+
+Асинхронные соединения psycopg2 работают в режиме autocommit, поэтому
+изменения из нескольких запросов выполняются через transaction().
+Серверные курсоры и COPY в этом режиме недоступны: потоковое чтение идет
+страницами по ключу. Схему приводит к актуальной версии Database
+(миграции здесь не применяются).
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import psycopg2
+from psycopg2 import extensions, sql
+from psycopg2.pool import PoolError
+
+from config import DB_CONFIG, DB_POOL, PAGE_SIZE
+from database import (Database, REPORT_VIEWS, REPORT_VIEWS_LOCK_ID, _list_query, _page_query, _page_result, _window_query,
+                      _window_result, _count_query, _collection_statistics, _release_links)
+
+
+async def _wait(conn):
+    """Дождаться готовности асинхронного соединения без блокировки цикла"""
+    loop = asyncio.get_running_loop()
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            add, remove = loop.add_reader, loop.remove_reader
+        elif state == extensions.POLL_WRITE:
+            add, remove = loop.add_writer, loop.remove_writer
+        else:
+            raise psycopg2.OperationalError(f"Неожиданное состояние соединения: {state}")
+
+        ready = loop.create_future()
+        fd = conn.fileno()
+        add(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            remove(fd)
+
+
+class AsyncConnectionPool:
+    """Пул асинхронных соединений для одного цикла событий.
+    Параметры и метрики те же, что у ConnectionPool."""
+
+    def __init__(self, params, min_size=1, max_size=10, timeout=30, health_check_interval=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Неверные размеры пула соединений")
+
+        self.params = params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = asyncio.Condition()
+        self._idle = []  # (соединение, время последнего использования)
+        self._in_use = set()
+        self._size = 0
+        self._closed = False
+
+        # Метрики
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._reconnects = 0
+
+    async def open(self):
+        """Открыть min_size соединений"""
+        results = await asyncio.gather(*(self._open() for _ in range(self.min_size)), return_exceptions=True)
+        connections = [result for result in results if not isinstance(result, BaseException)]
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            # Пул не открыт: открывшиеся соединения не должны остаться висеть
+            for conn in connections:
+                conn.close()
+            raise errors[0]
+        now = time.monotonic()
+        self._idle.extend((conn, now) for conn in connections)
+        self._size += len(connections)
+
+    async def _open(self):
+        conn = psycopg2.connect(**self.params, async_=True)
+        try:
+            await _wait(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def _is_alive(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            await _execute(conn, "SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    async def getconn(self, timeout=None):
+        """Взять соединение, при необходимости дождавшись освобождения"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        async with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise PoolError("Пул соединений закрыт")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolError(f"Нет свободных соединений в пуле ({self.max_size}) за {timeout} с")
+                waited = True
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            self._waits += waited
+
+        reconnected = False
+        try:
+            if conn is None:
+                conn = await self._open()
+            elif not await self._is_alive(conn, last_used):
+                conn.close()
+                conn = await self._open()
+                reconnected = True
+        except BaseException:
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        self._in_use.add(conn)
+        self._checkouts += 1
+        self._reconnects += reconnected
+        return conn
+
+    async def putconn(self, conn, broken=False):
+        """Вернуть соединение; сломанное или занятое запросом закрывается"""
+        broken = (broken or bool(conn.closed) or conn.isexecuting()
+                  or conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE)
+        async with self._cond:
+            self._in_use.discard(conn)
+            if broken or self._closed:
+                self._size -= 1
+                conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Соединение на время одной операции.
+        Если операцию отменили посреди запроса, запрос прерывается на сервере,
+        а соединение закрывается."""
+        conn = await self.getconn()
+        broken = False
+        try:
+            yield conn
+        except asyncio.CancelledError:
+            if conn.isexecuting():
+                try:
+                    conn.cancel()
+                except psycopg2.Error:
+                    pass
+            broken = True
+            raise
+        finally:
+            await self.putconn(conn, broken)
+
+    def stats(self):
+        return {
+            'size': self._size,
+            'in_use': len(self._in_use),
+            'idle': len(self._idle),
+            'max_size': self.max_size,
+            'checkouts': self._checkouts,
+            'waits': self._waits,
+            'timeouts': self._timeouts,
+            'reconnects': self._reconnects,
+        }
+
+    async def close(self):
+        async with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+
+async def _execute(conn, query, params=None, fetch=None):
+    """Выполнить запрос на асинхронном соединении.
+    fetch: None - ничего не возвращать, 'one' - первая строка, 'all' - все строки."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        await _wait(conn)
+        if fetch == 'all':
+            return cursor.fetchall()
+        if fetch == 'one':
+            return cursor.fetchone()
+        return None
+    finally:
+        cursor.close()
+
+
+async def _execute_values(conn, query, argslist, page_size=1000, fetch=False):
+    """Аналог psycopg2.extras.execute_values для асинхронного соединения:
+    VALUES %s в query раскрывается в строки argslist порциями по page_size.
+    fetch=True - вернуть строки всех порций (например, RETURNING)."""
+    result = []
+    for start in range(0, len(argslist), page_size):
+        page = [tuple(args) for args in argslist[start:start + page_size]]
+        values = ", ".join("(" + ", ".join(["%s"] * len(args)) + ")" for args in page)
+        rows = await _execute(conn, query % values, [value for args in page for value in args],
+                              'all' if fetch else None)
+        if fetch:
+            result.extend(rows)
+    return result
+
+
+class Transaction:
+    """Запросы одной транзакции (см. AsyncDatabase.transaction)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def execute(self, query, params=None):
+        await _execute(self.conn, query, params)
+
+    async def fetchone(self, query, params=None):
+        return await _execute(self.conn, query, params, 'one')
+
+    async def fetchall(self, query, params=None):
+        return await _execute(self.conn, query, params, 'all')
+
+
+class AsyncDatabase:
+    """Асинхронный аналог Database с собственным пулом соединений.
+    Методы - корутины с теми же именами и результатами."""
+
+    def __init__(self, params=None, **pool_options):
+        self.pool = AsyncConnectionPool(params or DB_CONFIG, **{**DB_POOL, **pool_options})
+
+    async def open(self):
+        await self.pool.open()
+        return self
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    # ===== Выполнение запросов =====
+    async def _fetchall(self, query, params=None):
+        async with self.pool.connection() as conn:
+            return await _execute(conn, query, params, 'all')
+
+    async def _fetchone(self, query, params=None):
+        async with self.pool.connection() as conn:
+            return await _execute(conn, query, params, 'one')
+
+    async def _execute(self, query, params=None):
+        async with self.pool.connection() as conn:
+            await _execute(conn, query, params)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Транзакция: коммит при успехе, откат при ошибке"""
+        async with self.pool.connection() as conn:
+            await _execute(conn, "BEGIN")
+            try:
+                yield Transaction(conn)
+            except BaseException:
+                if not conn.closed and not conn.isexecuting():
+                    await _execute(conn, "ROLLBACK")
+                raise
+            await _execute(conn, "COMMIT")
+
+    # ===== Списки с ключом сортировки (см. Database) =====
+    async def _list(self, query, params, key_count):
+        return [row[:-key_count] for row in await self._fetchall(_list_query(query, key_count), params)]
+
+    async def _page(self, query, params, key_count, page_size=None, after=None):
+        page_size = page_size or PAGE_SIZE
+        query, params = _page_query(query, params, key_count, page_size, after)
+        return _page_result(await self._fetchall(query, params), key_count, page_size)
+
+    async def _stream(self, query, params, key_count, page_size=None):
+        """Все строки списка страницами по ключу (вместо серверного курсора)"""
+        after = None
+        while True:
+            rows, after = await self._page(query, params, key_count, page_size, after)
+            for row in rows:
+                yield row
+            if after is None:
+                return
+
+    async def _window(self, query, params, key_count, columns, offset=0, limit=None, order=None, after=None):
+        query, params = _window_query(query, params, key_count, columns,
+                                      offset, limit or PAGE_SIZE, order, after)
+        return _window_result(await self._fetchall(query, params), key_count, order)
+
+    async def _window_rows(self, query, params, key_count, columns, ids, order=None):
+        if not ids:
+            return []
+        query = f"SELECT * FROM ({query}) AS f WHERE {columns[0]} = ANY(%s)"
+        return await self._window(query, list(params) + [list(ids)], key_count, columns, 0, len(ids), order)
+
+    async def _count(self, query, params):
+        return (await self._fetchone(_count_query(query), params))[0]
+
+    # ===== Носители =====
+    async def get_all_media_items(self, search=None):
+        return await self._list(*Database._media_items_query(search))
+
+    def iter_media_items(self, search=None, page_size=None):
+        """Носители по мере чтения: async for row in db.iter_media_items()"""
+        return self._stream(*Database._media_items_query(search), page_size)
+
+    async def get_media_items_page(self, search=None, page_size=None, after=None):
+        return await self._page(*Database._media_items_query(search), page_size, after)
+
+    async def get_media_items_window(self, search=None, offset=0, limit=None, order=None, after=None):
+        return await self._window(*Database._media_items_query(search), Database._MEDIA_ITEMS_SORT,
+                                  offset, limit, order, after)
+
+    async def count_media_items(self, search=None):
+        return await self._count(*Database._media_items_query(search)[:2])
+
+    async def get_media_items_rows(self, search=None, ids=(), order=None):
+        return await self._window_rows(*Database._media_items_query(search), Database._MEDIA_ITEMS_SORT, ids, order)
+
+    async def changed_media_items(self, among, ids=(), release_ids=(), artist_ids=()):
+        return {row[0] for row in await self._fetchall(
+            Database._CHANGED_MEDIA_ITEMS, (list(among), list(ids), list(release_ids), list(artist_ids)))}
+
+    async def add_media_item(self, data):
+        return (await self._fetchone(Database._ADD_MEDIA_ITEM, data))[0]
+
+    async def update_media_item(self, item_id, data):
+        await self._execute(Database._UPDATE_MEDIA_ITEM, data + (item_id,))
+
+    async def delete_media_item(self, item_id):
+        await self._execute(Database._DELETE_MEDIA_ITEM, (item_id,))
+
+    # ===== Артисты =====
+    async def get_all_artists(self, search=None):
+        return await self._list(*Database._artists_query(search))
+
+    def iter_artists(self, search=None, page_size=None):
+        return self._stream(*Database._artists_query(search), page_size)
+
+    async def get_artists_page(self, search=None, page_size=None, after=None):
+        return await self._page(*Database._artists_query(search), page_size, after)
+
+    async def get_artists_window(self, search=None, offset=0, limit=None, order=None, after=None):
+        return await self._window(*Database._artists_query(search), Database._ARTISTS_SORT,
+                                  offset, limit, order, after)
+
+    async def count_artists(self, search=None):
+        return await self._count(*Database._artists_query(search)[:2])
+
+    async def get_artists_rows(self, search=None, ids=(), order=None):
+        return await self._window_rows(*Database._artists_query(search), Database._ARTISTS_SORT, ids, order)
+
+    async def get_all_artists_for_select(self):
+        return await self._fetchall(Database._ARTISTS_FOR_SELECT)
+
+    async def add_artist(self, name, artist_type, country):
+        return (await self._fetchone(Database._ADD_ARTIST, (name, artist_type, country)))[0]
+
+    async def update_artist(self, artist_id, name, artist_type, country):
+        await self._execute(Database._UPDATE_ARTIST, (name, artist_type, country, artist_id))
+
+    async def delete_artist(self, artist_id):
+        await self._execute(Database._DELETE_ARTIST, (artist_id,))
+
+    # ===== Релизы =====
+    async def get_all_releases(self, search=None):
+        return await self._list(*Database._releases_query(search))
+
+    def iter_releases(self, search=None, page_size=None):
+        return self._stream(*Database._releases_query(search), page_size)
+
+    async def get_releases_page(self, search=None, page_size=None, after=None):
+        return await self._page(*Database._releases_query(search), page_size, after)
+
+    async def get_releases_window(self, search=None, offset=0, limit=None, order=None, after=None):
+        return await self._window(*Database._releases_query(search), Database._RELEASES_SORT,
+                                  offset, limit, order, after)
+
+    async def count_releases(self, search=None):
+        return await self._count(*Database._releases_query(search)[:2])
+
+    async def add_release(self, data):
+        return (await self._fetchone(Database._ADD_RELEASE, data))[0]
+
+    async def get_releases_rows(self, search=None, ids=(), order=None):
+        return await self._window_rows(*Database._releases_query(search), Database._RELEASES_SORT, ids, order)
+
+    async def changed_releases(self, among, ids=(), artist_ids=()):
+        return {row[0] for row in await self._fetchall(
+            Database._CHANGED_RELEASES, (list(among), list(ids), list(artist_ids)))}
+
+    async def get_all_releases_for_select(self):
+        return await self._fetchall(Database._RELEASES_FOR_SELECT)
+
+    async def add_release_with_artists_and_genres(self, release_data, artist_ids, genre_ids):
+        """Добавить релиз с артистами и жанрами в одной транзакции"""
+        return (await self.add_releases_bulk([(release_data, artist_ids, genre_ids)]))[0]
+
+    async def add_releases_bulk(self, releases, page_size=1000):
+        """Добавить много релизов с артистами и жанрами в одной транзакции
+        (см. Database.add_releases_bulk)"""
+        if not releases:
+            return []
+        async with self.transaction() as tx:
+            rows = await _execute_values(tx.conn, Database._ADD_RELEASES,
+                                         [tuple(release_data) for release_data, _, _ in releases],
+                                         page_size, fetch=True)
+            release_ids = [row[0] for row in rows]
+            artist_links, genre_links = _release_links(release_ids, releases)
+            await _execute_values(tx.conn, Database._ADD_RELEASE_ARTISTS, artist_links, page_size)
+            await _execute_values(tx.conn, Database._ADD_RELEASE_GENRES, genre_links, page_size)
+        return release_ids
+
+    # ===== Справочники =====
+    async def get_all_genres(self):
+        return await self._fetchall(Database._GENRES)
+
+    async def get_all_genres_for_select(self):
+        return await self._fetchall(Database._GENRES_FOR_SELECT)
+
+    async def get_all_media_types(self):
+        return await self._fetchall(Database._MEDIA_TYPES)
+
+    # ===== Отчеты =====
+    async def get_collection_statistics(self):
+        return _collection_statistics(await self._fetchall(Database._COLLECTION_STATISTICS))
+
+    async def get_artist_report(self, artist_id=None):
+        if artist_id:
+            return await self._fetchall(Database._ARTIST_ITEMS_REPORT, (artist_id,))
+        return await self._fetchall(Database._ARTISTS_REPORT)
+
+    async def iter_artist_report(self, artist_id=None):
+        """То же, что get_artist_report, построчно (строки читаются одним
+        запросом: серверных курсоров у асинхронных соединений нет)"""
+        for row in await self.get_artist_report(artist_id):
+            yield row
+
+    async def get_format_report(self):
+        return await self._fetchall(Database._FORMAT_REPORT)
+
+    async def get_report_freshness(self):
+        return dict(await self._fetchall(Database._REPORT_FRESHNESS))
+
+    async def refresh_report_views(self, views=None, ages=None):
+        refreshed = []
+        for view in views or REPORT_VIEWS:
+            async with self.transaction() as tx:
+                if not (await tx.fetchone(Database._REPORT_VIEW_LOCK, (REPORT_VIEWS_LOCK_ID, view)))[0]:
+                    continue
+                if ages and view in ages:
+                    row = await tx.fetchone(Database._REPORT_VIEW_FRESH, (ages[view], view))
+                    if row and row[0]:
+                        refreshed.append(view)
+                        continue
+                await tx.execute(Database._REPORT_VIEW_REFRESH.format(sql.Identifier(view)))
+                await tx.execute(Database._REPORT_VIEW_REFRESHED, (view,))
+            refreshed.append(view)
+        return refreshed
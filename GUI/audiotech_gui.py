@@ -3,8 +3,19 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from tkinter import scrolledtext
 from database import Database
+from config import (CHANGES_DELAY_MS, DIAGNOSTICS_REFRESH_MS, REPORT_VIEWS_AUTO_REFRESH, REPORT_VIEWS_REFRESH,
+                    REPORT_CHUNK_LINES)
+from cache import REFERENCE_CHANNEL
+from widgets import TreeBinding, VirtualTable, WindowedSource
+from notify import CHANGES_CHANNEL, parse_change
+from executor import DbExecutor, DebouncedSearch
+from importer import CollectionImporter
+from exporter import CollectionExporter
+from reports import REPORTS, stream_report, stream_artist_report, artist_report
+from report_model import export_report
+from report_views import ReportViewRefresher
 from datetime import datetime
-import csv
+import json
 import os
 
 COLORS = {
@@ -23,6 +34,12 @@ COLORS = {
 }
 
 
+def enable_widget(widget):
+    """Снова разрешить кнопку, если ее окно еще открыто"""
+    if widget.winfo_exists():
+        widget.state(['!disabled'])
+
+
 class AudiotechApp:
     def __init__(self, root):
         self.root = root
@@ -32,12 +49,42 @@ class AudiotechApp:
 
         # Инициализация БД
         self.db = Database()
-        if not self.db.connection:
+        if not self.db.pool:
             messagebox.showerror("Ошибка", "Не удалось подключиться к базе данных")
             self.root.destroy()
             return
 
+        # Фоновое выполнение запросов
+        self.db_executor = DbExecutor(self.root, self.db)
+
+        # Лента изменений в БД: точечное обновление списков и статистики.
+        # Уведомления приходят в фоновом потоке и передаются в поток Tk.
+        self.pending_changes = {}
+        self.pending_moves = set()
+        self.changes_after_id = None
+        self.db.listener.subscribe(
+            CHANGES_CHANNEL, lambda payload: self.db_executor.call_soon(self.on_db_change, payload))
+        self.db.listener.subscribe_reconnect(lambda: self.db_executor.call_soon(self.refresh_all))
+
+        # Представления отчетов пересчитываются после изменений; плановый
+        # пересчет - отдельным процессом (report_views.py), а не в каждом окне
+        self.report_views = ReportViewRefresher(
+            self.db, **REPORT_VIEWS_REFRESH,
+            on_error=lambda e: self.db_executor.call_soon(
+                self.show_background_error, "Ошибка обновления данных отчетов", e))
+        self.db.listener.subscribe(
+            CHANGES_CHANNEL, lambda payload: self.report_views.mark_changed(parse_change(payload)[0]))
+        self.db.listener.subscribe(REFERENCE_CHANNEL, self.report_views.mark_changed)
+        self.db.listener.subscribe_reconnect(self.report_views.mark_changed)
+        if REPORT_VIEWS_AUTO_REFRESH:
+            self.report_views.start()
+        self.db.start_listener()
+
         # Текущие данные
+        self.media_search_term = None
+        self.report_task = None
+        self.report_build = None
+        self.statistics_task = None
         self.current_artist_id = None
         self.current_media_item_id = None
         self.current_release_id = None
@@ -47,6 +94,7 @@ class AudiotechApp:
 
         # Создание интерфейса
         self.create_widgets()
+        self.db_executor.subscribe_activity(self.show_activity)
 
         # Загрузка начальных данных
         self.load_media_items()
@@ -111,6 +159,7 @@ class AudiotechApp:
         self.create_releases_tab()
         self.create_reports_tab()
         self.create_statistics_tab()
+        self.create_diagnostics_tab()
 
     def create_header(self):
         header = tk.Frame(self.root, bg=COLORS['primary'], height=70)
@@ -132,6 +181,13 @@ class AudiotechApp:
                                 command=self.export_all_data)
         export_btn.pack(side='right', padx=20, pady=10)
 
+        # Кнопка импорта
+        import_btn = ttk.Button(header,
+                                text="📥 Импорт данных",
+                                style='Primary.TButton',
+                                command=self.import_data)
+        import_btn.pack(side='right', pady=10)
+
         # Статус подключения
         self.status_label = tk.Label(header,
                                      text="✅ Подключено к БД",
@@ -140,6 +196,41 @@ class AudiotechApp:
                                      fg=COLORS['success'])
         self.status_label.pack(side='right', padx=20)
 
+        # Индикатор выполняемых операций с кнопкой отмены (виден, пока они идут)
+        self.busy_frame = tk.Frame(header, bg=COLORS['primary'])
+        self.busy_progress = ttk.Progressbar(self.busy_frame, mode='indeterminate', length=120)
+        self.busy_progress.pack(side='left', padx=5)
+        ttk.Button(self.busy_frame,
+                   text="✖ Отмена",
+                   style='Secondary.TButton',
+                   command=self.db_executor.cancel_active).pack(side='left')
+
+    def show_activity(self, tasks):
+        """Показать в заголовке выполняемые в фоне операции"""
+        if not tasks:
+            self.status_label.config(text="✅ Подключено к БД", fg=COLORS['success'])
+            self.busy_progress.stop()
+            self.busy_frame.pack_forget()
+            return
+
+        task = tasks[-1]
+        text = f"⏳ {task.description}"
+        if task.progress:
+            text += f": {task.progress}"
+        if len(tasks) > 1:
+            text += f" (+{len(tasks) - 1})"
+        self.status_label.config(text=text, fg=COLORS['accent'])
+        if not self.busy_frame.winfo_ismapped():
+            self.busy_frame.pack(side='right', padx=5)
+            self.busy_progress.start(15)
+
+    def show_background_error(self, text, error):
+        """Показать в заголовке ошибку фоновой операции (без окна сообщения)"""
+        self.status_label.config(text=f"⚠ {text}: {error}", fg=COLORS['error'])
+
+    def show_list_error(self, error):
+        self.show_background_error("Ошибка загрузки списка", error)
+
     # ===== ВКЛАДКА КОЛЛЕКЦИЯ =====
     def create_collection_tab(self):
         self.collection_tab = tk.Frame(self.notebook, bg=COLORS['background'])
@@ -155,8 +246,18 @@ class AudiotechApp:
                  bg=COLORS['secondary_light'],
                  fg=COLORS['text']).pack(side='left', padx=10)
 
+        # Поиск выполняется в фоне после паузы ввода
+        self.media_search = DebouncedSearch(
+            self.root, self.db_executor,
+            lambda term: (self.db.count_media_items(term or None),
+                          self.db.get_media_items_window(term or None, 0,
+                                                         self.collection_source.block_size,
+                                                         self.collection_source.order)),
+            self.show_media_search_results,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка поиска: {str(e)}"))
+
         self.search_var = tk.StringVar()
-        self.search_var.trace('w', lambda *args: self.load_media_items())
+        self.search_var.trace('w', lambda *args: self.media_search.schedule(self.search_var.get()))
         search_entry = ttk.Entry(filter_frame,
                                  textvariable=self.search_var,
                                  width=40,
@@ -207,10 +308,13 @@ class AudiotechApp:
         self.collection_tree.column('Исполнитель', width=150)
         self.collection_tree.column('Место хранения', width=150)
 
-        scrollbar = ttk.Scrollbar(table_frame,
-                                  orient='vertical',
-                                  command=self.collection_tree.yview)
-        self.collection_tree.configure(yscrollcommand=scrollbar.set)
+        # В таблице существуют только видимые строки, остальные читаются блоками
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical')
+        self.collection_source = WindowedSource(
+            lambda *window: self.db.get_media_items_window(self.media_search_term, *window),
+            lambda: self.db.count_media_items(self.media_search_term),
+            self.db_executor.submit, self.show_list_error)
+        self.collection_table = VirtualTable(self.collection_tree, scrollbar, self.collection_source)
 
         self.collection_tree.grid(row=0, column=0, sticky='nsew')
         scrollbar.grid(row=0, column=1, sticky='ns')
@@ -264,10 +368,11 @@ class AudiotechApp:
 
         self.artists_tree.column('Имя/Название', width=250)
 
-        scrollbar = ttk.Scrollbar(table_frame,
-                                  orient='vertical',
-                                  command=self.artists_tree.yview)
-        self.artists_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical')
+        self.artists_table = VirtualTable(
+            self.artists_tree, scrollbar,
+            WindowedSource(lambda *window: self.db.get_artists_window(None, *window),
+                           self.db.count_artists, self.db_executor.submit, self.show_list_error))
 
         self.artists_tree.grid(row=0, column=0, sticky='nsew')
         scrollbar.grid(row=0, column=1, sticky='ns')
@@ -310,10 +415,11 @@ class AudiotechApp:
         self.releases_tree.column('Название', width=200)
         self.releases_tree.column('Исполнитель', width=150)
 
-        scrollbar = ttk.Scrollbar(table_frame,
-                                  orient='vertical',
-                                  command=self.releases_tree.yview)
-        self.releases_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical')
+        self.releases_table = VirtualTable(
+            self.releases_tree, scrollbar,
+            WindowedSource(lambda *window: self.db.get_releases_window(None, *window),
+                           self.db.count_releases, self.db_executor.submit, self.show_list_error))
 
         self.releases_tree.grid(row=0, column=0, sticky='nsew')
         scrollbar.grid(row=0, column=1, sticky='ns')
@@ -341,18 +447,18 @@ class AudiotechApp:
                  fg=COLORS['accent']).pack(pady=(0, 20))
 
         reports = [
-            ("📈 Общий отчет по коллекции", self.generate_collection_report),
-            ("🎤 Отчет по артистам", self.generate_artists_report),
-            ("💿 Отчет по форматам", self.generate_formats_report),
-            ("💰 Отчет по стоимости", self.generate_value_report),
-            ("📅 Отчет по годам покупки", self.generate_purchase_years_report),
+            ("📈 Общий отчет по коллекции", 'collection'),
+            ("🎤 Отчет по артистам", 'artists'),
+            ("💿 Отчет по форматам", 'formats'),
+            ("💰 Отчет по стоимости", 'value'),
+            ("📅 Отчет по годам покупки", 'purchase_years'),
         ]
 
-        for text, command in reports:
+        for text, name in reports:
             btn = ttk.Button(report_frame,
                              text=text,
                              style='Primary.TButton',
-                             command=command)
+                             command=lambda name=name: self.generate_report(name))
             btn.pack(pady=5, fill='x')
 
         # Область для вывода отчета
@@ -374,15 +480,20 @@ class AudiotechApp:
                    command=self.save_report_to_file).pack(side='left', padx=5)
 
         ttk.Button(export_frame,
-                   text="📄 Экспорт в CSV",
+                   text="📄 Экспорт таблицы",
                    style='Primary.TButton',
-                   command=self.export_report_csv).pack(side='left', padx=5)
+                   command=self.export_report_table).pack(side='left', padx=5)
 
         ttk.Button(export_frame,
                    text="🧹 Очистить",
                    style='Secondary.TButton',
                    command=lambda: self.report_text.delete(1.0, tk.END)).pack(side='right', padx=5)
 
+        ttk.Button(export_frame,
+                   text="🔄 Обновить данные отчетов",
+                   style='Secondary.TButton',
+                   command=self.refresh_report_views).pack(side='right', padx=5)
+
     # ===== ВКЛАДКА СТАТИСТИКА =====
     def create_statistics_tab(self):
         self.stats_tab = tk.Frame(self.notebook, bg=COLORS['background'])
@@ -460,6 +571,7 @@ class AudiotechApp:
             self.format_tree.column(col, width=100)
 
         self.format_tree.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        self.format_binding = TreeBinding(self.format_tree)
 
         # Правая панель - по состоянию
         right_frame = tk.Frame(charts_frame, bg=COLORS['secondary_light'])
@@ -481,6 +593,7 @@ class AudiotechApp:
             self.condition_tree.column(col, width=100)
 
         self.condition_tree.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        self.condition_binding = TreeBinding(self.condition_tree)
 
         # Кнопка обновления
         ttk.Button(stats_frame,
@@ -488,28 +601,103 @@ class AudiotechApp:
                    style='Primary.TButton',
                    command=self.update_statistics).pack(pady=20)
 
+    def create_diagnostics_tab(self):
+        self.diagnostics_tab = tk.Frame(self.notebook, bg=COLORS['background'])
+        self.notebook.add(self.diagnostics_tab, text='⏱ Диагностика')
+
+        diagnostics_frame = tk.Frame(self.diagnostics_tab, bg=COLORS['background'])
+        diagnostics_frame.pack(fill='both', expand=True, padx=20, pady=20)
+
+        tk.Label(diagnostics_frame,
+                 text="ДИАГНОСТИКА ЗАПРОСОВ",
+                 font=('Arial', 18, 'bold'),
+                 bg=COLORS['background'],
+                 fg=COLORS['accent']).pack(pady=(0, 10))
+
+        # Пул соединений, подготовленные операторы, журнал медленных запросов
+        self.diagnostics_summary = tk.Label(diagnostics_frame,
+                                            text="",
+                                            font=('Arial', 10),
+                                            justify='left',
+                                            anchor='w',
+                                            bg=COLORS['background'],
+                                            fg=COLORS['text_secondary'])
+        self.diagnostics_summary.pack(fill='x', pady=(0, 10))
+
+        # Запросы по убыванию суммарного времени
+        tree_frame = tk.Frame(diagnostics_frame, bg=COLORS['background'])
+        tree_frame.pack(fill='both', expand=True)
+
+        columns = ('Запрос', 'Вызовов', 'Ошибок', 'Медленных', 'Всего, мс', 'Среднее, мс',
+                   'p95, мс', 'Макс., мс', 'Строк', 'Получено, КБ')
+        self.queries_tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=12)
+        for col in columns:
+            self.queries_tree.heading(col, text=col)
+            self.queries_tree.column(col, width=90, anchor='e')
+        self.queries_tree.column('Запрос', width=500, anchor='w')
+
+        scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=self.queries_tree.yview)
+        self.queries_tree.configure(yscrollcommand=scrollbar.set)
+        self.queries_tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        self.queries_binding = TreeBinding(self.queries_tree)
+        self.queries_tree.bind('<<TreeviewSelect>>', lambda e: self.show_query_details())
+
+        # Полный текст и гистограмма выбранного запроса
+        self.query_details = scrolledtext.ScrolledText(diagnostics_frame,
+                                                       height=8,
+                                                       font=('Courier', 10),
+                                                       bg=COLORS['secondary'],
+                                                       fg=COLORS['text'],
+                                                       wrap=tk.WORD)
+        self.query_details.pack(fill='x', pady=10)
+
+        btn_frame = tk.Frame(diagnostics_frame, bg=COLORS['background'])
+        btn_frame.pack(fill='x')
+
+        ttk.Button(btn_frame,
+                   text="🔄 Обновить",
+                   style='Primary.TButton',
+                   command=self.update_diagnostics).pack(side='left', padx=5)
+
+        ttk.Button(btn_frame,
+                   text="💾 Экспорт в JSON",
+                   style='Secondary.TButton',
+                   command=self.export_diagnostics).pack(side='left', padx=5)
+
+        ttk.Button(btn_frame,
+                   text="🧹 Сбросить замеры",
+                   style='Secondary.TButton',
+                   command=self.reset_diagnostics).pack(side='right', padx=5)
+
+        # Пока вкладка открыта, замеры обновляются сами
+        self.diagnostics = None
+        self.diagnostics_after_id = None
+        self.notebook.bind('<<NotebookTabChanged>>', lambda e: self.update_diagnostics(), add='+')
+
     # ===== МЕТОДЫ ДЛЯ КОЛЛЕКЦИИ =====
     def load_media_items(self):
-        for item in self.collection_tree.get_children():
-            self.collection_tree.delete(item)
-
-        search = self.search_var.get() if self.search_var.get() else None
-        items = self.db.get_all_media_items(search)
+        # Перечитывается только видимая часть, остальное - при прокрутке
+        self.collection_table.refresh()
 
-        for item in items:
-            price = f"{item[6]:.2f} ₽" if item[6] else "—"
-            self.collection_tree.insert('', 'end', values=item)
+    def show_media_search_results(self, term, result):
+        self.media_search_term = term or None
+        self.collection_table.reset(*result)
 
     def add_media_item_dialog(self):
+        # Справочники загружаются в фоне, диалог открывается по готовности
+        self.db_executor.submit(
+            lambda: (self.db.get_all_media_types(), self.db.get_all_releases_for_select()),
+            on_done=lambda lists: self.show_add_media_item_dialog(*lists),
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось загрузить справочники: {str(e)}"),
+            description="Загрузка справочников")
+
+    def show_add_media_item_dialog(self, media_types, releases):
         dialog = tk.Toplevel(self.root)
         dialog.title("Добавить носитель")
         dialog.geometry("500x600")
         dialog.configure(bg=COLORS['background'])
 
-        # Получаем справочники
-        media_types = self.db.get_all_media_types()
-        releases = self.db.get_all_releases()
-
         tk.Label(dialog,
                  text="ДОБАВЛЕНИЕ НОСИТЕЛЯ",
                  font=('Arial', 14, 'bold'),
@@ -596,72 +784,77 @@ class AudiotechApp:
                 # Преобразуем цену
                 purchase_price = float(price.replace(',', '.')) if price else None
 
-                # Сохраняем
-                item_id = self.db.add_media_item((
-                    catalog_num, media_type_id, release_id,
-                    condition, purchase_price, purchase_date,
-                    location, notes
-                ))
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Не удалось добавить носитель: {str(e)}")
+                return
 
+            def saved(item_id):
                 messagebox.showinfo("Успех", f"Носитель добавлен (ID: {item_id})")
-                self.load_media_items()
-                self.update_statistics()
+                self.refresh_after_write(self.load_media_items, self.update_statistics)
                 dialog.destroy()
 
-            except Exception as e:
+            def failed(e):
+                enable_widget(save_button)
                 messagebox.showerror("Ошибка", f"Не удалось добавить носитель: {str(e)}")
 
+            # Сохраняем в фоне; повторное нажатие недоступно до ответа
+            save_button.state(['disabled'])
+            self.db_executor.submit(self.db.add_media_item, (
+                catalog_num, media_type_id, release_id,
+                condition, purchase_price, purchase_date,
+                location, notes
+            ), on_done=saved, on_error=failed, description="Сохранение носителя")
+
         # Кнопки
         btn_frame = tk.Frame(dialog, bg=COLORS['background'])
         btn_frame.pack(pady=20)
 
-        ttk.Button(btn_frame,
-                   text="💾 Сохранить",
-                   style='Primary.TButton',
-                   command=save).pack(side='left', padx=10)
+        save_button = ttk.Button(btn_frame,
+                                 text="💾 Сохранить",
+                                 style='Primary.TButton',
+                                 command=save)
+        save_button.pack(side='left', padx=10)
 
         ttk.Button(btn_frame,
                    text="❌ Отмена",
                    command=dialog.destroy).pack(side='left', padx=10)
 
     def edit_media_item_dialog(self):
-        selected = self.collection_tree.selection()
+        selected = self.collection_table.selected_rows()
         if not selected:
             messagebox.showwarning("Выбор", "Выберите носитель для редактирования")
             return
 
         # Получаем данные выбранного элемента
-        item_values = self.collection_tree.item(selected[0])['values']
+        item_values = selected[0]
         # TODO: Реализовать редактирование
         messagebox.showinfo("Редактирование", "Функция редактирования в разработке")
 
     def delete_media_item(self):
-        selected = self.collection_tree.selection()
+        selected = self.collection_table.selected_rows()
         if not selected:
             messagebox.showwarning("Выбор", "Выберите носитель для удаления")
             return
 
-        item_values = self.collection_tree.item(selected[0])['values']
+        item_values = selected[0]
         item_id = item_values[0]
         item_name = item_values[2]
 
         if messagebox.askyesno("Подтверждение", f"Удалить носитель '{item_name}'?"):
-            try:
-                self.db.delete_media_item(item_id)
+            def deleted(_):
+                self.collection_table.deselect([item_id])
                 messagebox.showinfo("Успех", "Носитель удален")
-                self.load_media_items()
-                self.update_statistics()
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось удалить: {str(e)}")
+                self.refresh_after_write(self.load_media_items, self.update_statistics)
+
+            self.db_executor.submit(
+                self.db.delete_media_item, item_id,
+                on_done=deleted,
+                on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось удалить: {str(e)}"),
+                description="Удаление носителя")
 
     # ===== МЕТОДЫ ДЛЯ АРТИСТОВ =====
     def load_artists(self):
-        for item in self.artists_tree.get_children():
-            self.artists_tree.delete(item)
-
-        artists = self.db.get_all_artists()
-        for artist in artists:
-            self.artists_tree.insert('', 'end', values=artist)
+        self.artists_table.refresh()
 
     def add_artist_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -709,29 +902,36 @@ class AudiotechApp:
                 messagebox.showerror("Ошибка", "Введите имя артиста")
                 return
 
-            try:
-                artist_id = self.db.add_artist(name, artist_type, country)
+            def saved(artist_id):
                 messagebox.showinfo("Успех", f"Артист добавлен (ID: {artist_id})")
-                self.load_artists()
+                self.refresh_after_write(self.load_artists)
                 dialog.destroy()
-            except Exception as e:
+
+            def failed(e):
+                enable_widget(save_button)
                 messagebox.showerror("Ошибка", f"Не удалось добавить артиста: {str(e)}")
 
+            save_button.state(['disabled'])
+            self.db_executor.submit(self.db.add_artist, name, artist_type, country,
+                                    on_done=saved, on_error=failed,
+                                    description="Сохранение артиста")
+
         # Кнопки
         btn_frame = tk.Frame(dialog, bg=COLORS['background'])
         btn_frame.pack(pady=20)
 
-        ttk.Button(btn_frame,
-                   text="💾 Сохранить",
-                   style='Primary.TButton',
-                   command=save).pack(side='left', padx=10)
+        save_button = ttk.Button(btn_frame,
+                                 text="💾 Сохранить",
+                                 style='Primary.TButton',
+                                 command=save)
+        save_button.pack(side='left', padx=10)
 
         ttk.Button(btn_frame,
                    text="❌ Отмена",
                    command=dialog.destroy).pack(side='left', padx=10)
 
     def edit_artist_dialog(self):
-        selected = self.artists_tree.selection()
+        selected = self.artists_table.selected_rows()
         if not selected:
             messagebox.showwarning("Выбор", "Выберите артиста для редактирования")
             return
@@ -740,31 +940,34 @@ class AudiotechApp:
         messagebox.showinfo("Редактирование", "Функция редактирования артиста в разработке")
 
     def delete_artist(self):
-        selected = self.artists_tree.selection()
+        selected = self.artists_table.selected_rows()
         if not selected:
             messagebox.showwarning("Выбор", "Выберите артиста для удаления")
             return
 
-        item_values = self.artists_tree.item(selected[0])['values']
+        item_values = selected[0]
         artist_id = item_values[0]
         artist_name = item_values[1]
 
         if messagebox.askyesno("Подтверждение", f"Удалить артиста '{artist_name}'?"):
-            try:
-                self.db.delete_artist(artist_id)
+            def deleted(_):
+                self.artists_table.deselect([artist_id])
                 messagebox.showinfo("Успех", "Артист удален")
-                self.load_artists()
-                self.update_statistics()
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось удалить: {str(e)}")
+                self.refresh_after_write(self.load_artists, self.update_statistics)
+
+            self.db_executor.submit(
+                self.db.delete_artist, artist_id,
+                on_done=deleted,
+                on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось удалить: {str(e)}"),
+                description="Удаление артиста")
 
     def show_artist_report(self):
-        selected = self.artists_tree.selection()
+        selected = self.artists_table.selected_rows()
         if not selected:
             messagebox.showwarning("Выбор", "Выберите артиста для отчета")
             return
 
-        item_values = self.artists_tree.item(selected[0])['values']
+        item_values = selected[0]
         artist_id = item_values[0]
         artist_name = item_values[1]
 
@@ -774,23 +977,22 @@ class AudiotechApp:
 
     # ===== МЕТОДЫ ДЛЯ РЕЛИЗОВ =====
     def load_releases(self):
-        for item in self.releases_tree.get_children():
-            self.releases_tree.delete(item)
-
-        releases = self.db.get_all_releases()
-        for release in releases:
-            self.releases_tree.insert('', 'end', values=release)
+        self.releases_table.refresh()
 
     def add_release_dialog(self):
+        # Данные для выпадающих списков загружаются в фоне
+        self.db_executor.submit(
+            lambda: (self.db.get_all_artists_for_select(), self.db.get_all_genres_for_select()),
+            on_done=lambda lists: self.show_add_release_dialog(*lists),
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось загрузить справочники: {str(e)}"),
+            description="Загрузка справочников")
+
+    def show_add_release_dialog(self, artists, genres):
         dialog = tk.Toplevel(self.root)
         dialog.title("Добавить музыкальный релиз")
         dialog.geometry("700x800")
         dialog.configure(bg=COLORS['background'])
 
-        # Получаем данные для выпадающих списков
-        artists = self.db.get_all_artists_for_select()
-        genres = self.db.get_all_genres_for_select()
-
         # Список для хранения выбранных артистов и жанров
         selected_artists = []
         selected_genres = []
@@ -1065,36 +1267,43 @@ class AudiotechApp:
                     total_tracks
                 )
 
-                # Сохраняем в БД
-                release_id = self.db.add_release_with_artists_and_genres(
-                    release_data,
-                    selected_artists,
-                    selected_genres
-                )
+            except ValueError as e:
+                messagebox.showerror("Ошибка", f"Неправильный формат числа: {str(e)}")
+                return
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Не удалось добавить релиз: {str(e)}")
+                return
 
+            def saved(release_id):
                 messagebox.showinfo("Успех",
                                     f"Релиз '{title}' добавлен!\nID: {release_id}\n"
                                     f"Артистов: {len(selected_artists)}\n"
                                     f"Жанров: {len(selected_genres)}")
 
                 # Обновляем списки
-                self.load_releases()
-                self.update_statistics()
+                self.refresh_after_write(self.load_releases, self.update_statistics)
                 dialog.destroy()
 
-            except ValueError as e:
-                messagebox.showerror("Ошибка", f"Неправильный формат числа: {str(e)}")
-            except Exception as e:
+            def failed(e):
+                enable_widget(save_button)
                 messagebox.showerror("Ошибка", f"Не удалось добавить релиз: {str(e)}")
 
+            # Сохраняем в БД (в фоне)
+            save_button.state(['disabled'])
+            self.db_executor.submit(self.db.add_release_with_artists_and_genres,
+                                    release_data, list(selected_artists), list(selected_genres),
+                                    on_done=saved, on_error=failed,
+                                    description="Сохранение релиза")
+
         # Кнопки сохранения/отмены
         btn_frame = tk.Frame(dialog, bg=COLORS['background'])
         btn_frame.pack(pady=20, padx=20, fill='x')
 
-        ttk.Button(btn_frame,
-                   text="💾 Сохранить релиз",
-                   style='Primary.TButton',
-                   command=save_release).pack(side='left', padx=5)
+        save_button = ttk.Button(btn_frame,
+                                 text="💾 Сохранить релиз",
+                                 style='Primary.TButton',
+                                 command=save_release)
+        save_button.pack(side='left', padx=5)
 
         ttk.Button(btn_frame,
                    text="📋 Просмотреть данные",
@@ -1108,200 +1317,54 @@ class AudiotechApp:
                    command=dialog.destroy).pack(side='right', padx=5)
 
     # ===== МЕТОДЫ ДЛЯ ОТЧЕТОВ =====
-    def generate_collection_report(self):
-        stats = self.db.get_collection_statistics()
-
-        report = "=" * 60 + "\n"
-        report += "ОТЧЕТ ПО КОЛЛЕКЦИИ АУДИОТЕКИ\n"
-        report += "=" * 60 + "\n\n"
-
-        report += f"Всего носителей в коллекции: {sum(count for _, count in stats['by_format'])}\n"
-        report += f"Общая стоимость коллекции: {stats['total_value']:.2f} ₽\n"
-        report += f"Количество релизов: {stats['releases_count']}\n"
-        report += f"Количество артистов: {stats['artists_count']}\n\n"
-
-        report += "Распределение по форматам:\n"
-        report += "-" * 40 + "\n"
-        for format_name, count in stats['by_format']:
-            report += f"{format_name:25} {count:4d} шт.\n"
-
-        report += "\nРаспределение по состоянию:\n"
-        report += "-" * 40 + "\n"
-        for condition, count in stats['by_condition']:
-            report += f"{condition:25} {count:4d} шт.\n"
-
-        report += "\nПокупки по годам:\n"
-        report += "-" * 40 + "\n"
-        report += "Год   Кол-во   Сумма\n"
-        for year, count, sum_price in stats['by_year']:
-            report += f"{int(year)}   {count:6d}   {sum_price or 0:8.2f} ₽\n"
-
+    def run_report(self, description, chunks, build):
+        """Построить отчет в фоне и выводить его текст по мере готовности.
+        chunks() - части текста, build() - модель отчета для экспорта таблиц.
+        Новый отчет отменяет незавершенный прежний."""
+        if self.report_task is not None:
+            self.report_task.cancel()
         self.report_text.delete(1.0, tk.END)
-        self.report_text.insert(1.0, report)
-
-    def generate_artists_report(self):
-        artists_data = self.db.get_artist_report()
-
-        report = "=" * 60 + "\n"
-        report += "ОТЧЕТ ПО АРТИСТАМ\n"
-        report += "=" * 60 + "\n\n"
-
-        report += f"{'Артист':30} {'Релизов':8} {'Носителей':10} {'Стоимость':12}\n"
-        report += "-" * 60 + "\n"
+        self.report_build = (description, build)
+        self.report_task = self.db_executor.submit(
+            lambda: self.db_executor.stream(chunks(), self.append_report),
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось построить отчет: {str(e)}"),
+            description=description)
 
-        total_releases = 0
-        total_items = 0
-        total_value = 0
-
-        for artist in artists_data:
-            name = artist[0] or "Неизвестный"
-            releases = artist[1] or 0
-            items = artist[2] or 0
-            value = artist[3] or 0
-
-            report += f"{name:30} {releases:8d} {items:10d} {value:12.2f} ₽\n"
-
-            total_releases += releases
-            total_items += items
-            total_value += value
-
-        report += "-" * 60 + "\n"
-        report += f"{'ИТОГО':30} {total_releases:8d} {total_items:10d} {total_value:12.2f} ₽\n"
-
-        self.report_text.delete(1.0, tk.END)
-        self.report_text.insert(1.0, report)
+    def generate_report(self, name):
+        title, build = REPORTS[name]
+        self.run_report(title, lambda: stream_report(self.db, name), lambda: build(self.db))
 
     def generate_artist_report(self, artist_id, artist_name):
-        artist_data = self.db.get_artist_report(artist_id)
-
-        report = "=" * 60 + "\n"
-        report += f"ОТЧЕТ ПО АРТИСТУ: {artist_name}\n"
-        report += "=" * 60 + "\n\n"
-
-        if not artist_data:
-            report += "Нет данных по данному артисту\n"
-        else:
-            report += f"{'Альбом':30} {'Формат':15} {'Состояние':15} {'Цена':10} {'Дата':12}\n"
-            report += "-" * 82 + "\n"
-
-            total_value = 0
-            for item in artist_data:
-                title = item[0] or "Без названия"
-                format_name = item[1] or "—"
-                condition = item[2] or "—"
-                price = f"{item[3]:.2f} ₽" if item[3] else "—"
-                date = item[4] or "—"
-
-                report += f"{title:30} {format_name:15} {condition:15} {price:10} {date:12}\n"
-
-                if item[3]:
-                    total_value += item[3]
-
-            report += "-" * 82 + "\n"
-            report += f"Общая стоимость коллекции артиста: {total_value:.2f} ₽\n"
-
-        self.report_text.delete(1.0, tk.END)
-        self.report_text.insert(1.0, report)
-
-    def generate_formats_report(self):
-        formats_data = self.db.get_format_report()
-
-        report = "=" * 60 + "\n"
-        report += "ОТЧЕТ ПО ФОРМАТАМ НОСИТЕЛЕЙ\n"
-        report += "=" * 60 + "\n\n"
-
-        report += f"{'Формат':20} {'Кол-во':8} {'Ср. цена':12} {'Сумма':12} {'Первая':12} {'Последняя':12}\n"
-        report += "-" * 76 + "\n"
-
-        total_items = 0
-        total_value = 0
-
-        for item in formats_data:
-            format_name = item[0] or "Неизвестно"
-            count = item[1] or 0
-            avg_price = item[2] or 0
-            sum_price = item[3] or 0
-            first = item[4].strftime("%d.%m.%Y") if item[4] else "—"
-            last = item[5].strftime("%d.%m.%Y") if item[5] else "—"
-
-            report += f"{format_name:20} {count:8d} {avg_price:12.2f} ₽ {sum_price:12.2f} ₽ {first:12} {last:12}\n"
-
-            total_items += count
-            total_value += sum_price
-
-        report += "-" * 76 + "\n"
-        report += f"{'ИТОГО':20} {total_items:8d} {'—':12} {total_value:12.2f} ₽\n"
-
-        self.report_text.delete(1.0, tk.END)
-        self.report_text.insert(1.0, report)
-
-    def generate_value_report(self):
-        stats = self.db.get_collection_statistics()
-
-        report = "=" * 60 + "\n"
-        report += "ОТЧЕТ ПО СТОИМОСТИ КОЛЛЕКЦИИ\n"
-        report += "=" * 60 + "\n\n"
-
-        report += f"Общая стоимость коллекции: {stats['total_value']:.2f} ₽\n\n"
-
-        if stats['by_format']:
-            report += "Стоимость по форматам:\n"
-            report += "-" * 40 + "\n"
-
-            # Нужно получить данные о стоимости по форматам
-            cursor = self.db.connection.cursor()
-            cursor.execute("""
-                SELECT mt.type_name, 
-                       COUNT(mi.media_item_id),
-                       SUM(mi.purchase_price)
-                FROM media_types mt
-                LEFT JOIN media_items mi ON mt.media_type_id = mi.media_type_id
-                GROUP BY mt.media_type_id, mt.type_name
-                ORDER BY SUM(mi.purchase_price) DESC
-            """)
-
-            format_values = cursor.fetchall()
-
-            for format_name, count, sum_price in format_values:
-                if sum_price:
-                    percent = (sum_price / stats['total_value'] * 100) if stats['total_value'] > 0 else 0
-                    report += f"{format_name:20} {sum_price:10.2f} ₽ ({percent:.1f}%)\n"
-
-        self.report_text.delete(1.0, tk.END)
-        self.report_text.insert(1.0, report)
-
-    def generate_purchase_years_report(self):
-        stats = self.db.get_collection_statistics()
-
-        report = "=" * 60 + "\n"
-        report += "ОТЧЕТ ПО ГОДАМ ПОКУПКИ\n"
-        report += "=" * 60 + "\n\n"
-
-        report += "Год   Кол-во покупок   Сумма покупок   Средний чек\n"
-        report += "-" * 60 + "\n"
-
-        total_items = 0
-        total_value = 0
-
-        for year, count, sum_price in stats['by_year']:
-            avg_price = (sum_price / count) if count > 0 else 0
-            report += f"{int(year)}   {count:14d}   {sum_price:13.2f} ₽   {avg_price:11.2f} ₽\n"
+        self.run_report(f"Отчет по артисту {artist_name}",
+                        lambda: stream_artist_report(self.db, artist_id, artist_name),
+                        lambda: artist_report(self.db, artist_id, artist_name))
+
+    def refresh_report_views(self):
+        def done(refreshed):
+            if refreshed:
+                messagebox.showinfo("Отчеты", "Данные отчетов по артистам и форматам обновлены")
+            else:
+                messagebox.showinfo("Отчеты", "Данные отчетов сейчас обновляет другой клиент")
 
-            total_items += count
-            total_value += sum_price
+        self.db_executor.submit(
+            self.db.refresh_report_views, on_done=done,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось обновить данные отчетов: {str(e)}"),
+            description="Обновление данных отчетов")
 
-        report += "-" * 60 + "\n"
-        report += f"ИТОГО {total_items:14d}   {total_value:13.2f} ₽\n"
+    def append_report(self, chunk):
+        self.report_text.insert(tk.END, chunk)
 
-        avg_total = (total_value / total_items) if total_items > 0 else 0
-        report += f"Средний чек за все годы: {avg_total:.2f} ₽\n"
+    def report_chunks(self, lines=REPORT_CHUNK_LINES):
+        """Текст из области отчета частями по lines строк (без копии всего текста)"""
+        last = int(self.report_text.index('end-1c').split('.')[0])
+        for start in range(1, last + 1, lines):
+            yield self.report_text.get(f"{start}.0", f"{start + lines}.0" if start + lines <= last else 'end-1c')
 
-        self.report_text.delete(1.0, tk.END)
-        self.report_text.insert(1.0, report)
+    def report_is_empty(self):
+        return not self.report_text.search(r'\S', 1.0, tk.END, regexp=True)
 
     def save_report_to_file(self):
-        report_text = self.report_text.get(1.0, tk.END).strip()
-        if not report_text:
+        if self.report_is_empty():
             messagebox.showwarning("Пустой отчет", "Нет данных для сохранения")
             return
 
@@ -1314,79 +1377,179 @@ class AudiotechApp:
         if filename:
             try:
                 with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(report_text)
+                    f.writelines(self.report_chunks())
                 messagebox.showinfo("Успех", f"Отчет сохранен в файл:\n{filename}")
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Не удалось сохранить файл: {str(e)}")
 
-    def export_report_csv(self):
-        report_text = self.report_text.get(1.0, tk.END).strip()
-        if not report_text:
-            messagebox.showwarning("Пустой отчет", "Нет данных для экспорта")
+    def export_report_table(self):
+        """Выгрузить последний построенный отчет прямо из строк запроса"""
+        if self.report_build is None:
+            messagebox.showwarning("Пустой отчет", "Сначала постройте отчет")
             return
 
-        # Преобразуем текст отчета в CSV формат
-        lines = report_text.split('\n')
-        csv_data = []
-
-        for line in lines:
-            # Простая логика преобразования
-            if '=' in line and len(line.replace('=', '').strip()) == 0:
-                continue  # Пропускаем строки с разделителями
-            if line.strip():
-                # Разделяем по нескольким пробелам
-                cells = [cell.strip() for cell in line.split('  ') if cell.strip()]
-                if cells:
-                    csv_data.append(cells)
-
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            filetypes=[("CSV files", "*.csv"),
+                       ("Excel", "*.xlsx"),
+                       ("JSON", "*.json"),
+                       ("Text files", "*.txt"),
+                       ("All files", "*.*")],
             initialfile=f"отчет_аудиотека_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         )
+        if not filename:
+            return
 
-        if filename:
-            try:
-                with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f, delimiter=';')
-                    writer.writerows(csv_data)
-                messagebox.showinfo("Успех", f"Данные экспортированы в CSV:\n{filename}")
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось экспортировать: {str(e)}")
+        description, build = self.report_build
+        self.db_executor.submit(
+            lambda: export_report(build(), filename),
+            on_done=lambda result: messagebox.showinfo("Успех", f"Отчет выгружен в файл:\n{filename}"),
+            on_error=self.show_export_error,
+            description=f"Экспорт: {description}")
 
     def export_all_data(self):
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            filetypes=[("CSV files", "*.csv"),
+                       ("CSV, сжатый gzip", "*.csv.gz"),
+                       ("JSON Lines", "*.jsonl *.jsonl.gz"),
+                       ("Полный дамп (psql)", "*.sql *.sql.gz *.sql.zst"),
+                       ("All files", "*.*")],
             initialfile=f"аудиотека_полная_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         )
+        if not filename:
+            return
 
-        if filename:
-            try:
-                # Получаем все данные
-                media_items = self.db.get_all_media_items()
+        # Прогресс приходит из фонового потока в индикатор занятости
+        exporter = CollectionExporter(
+            self.db, lambda stage, written: self.db_executor.report(
+                f"{stage}, {written / (1 << 20):.1f} МБ"))
+        self.db_executor.submit(exporter.export, filename,
+                                on_done=lambda written: self.show_export_result(filename),
+                                on_error=self.show_export_error,
+                                description="Экспорт")
 
-                with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f, delimiter=';')
+    def show_export_result(self, filename):
+        messagebox.showinfo("Успех", f"Все данные экспортированы в:\n{filename}")
 
-                    # Заголовок
-                    writer.writerow([
-                        'ID', 'Каталожный номер', 'Альбом', 'Исполнитель',
-                        'Формат', 'Состояние', 'Цена (₽)', 'Дата покупки',
-                        'Место хранения'
-                    ])
+    def show_export_error(self, error):
+        messagebox.showerror("Ошибка", f"Не удалось экспортировать: {str(error)}")
 
-                    # Данные
-                    for item in media_items:
-                        writer.writerow(item)
+    def import_data(self):
+        filename = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
 
-                messagebox.showinfo("Успех", f"Все данные экспортированы в:\n{filename}")
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось экспортировать: {str(e)}")
+        importer = CollectionImporter(self.db)
+        self.db_executor.submit(importer.import_file, filename,
+                                on_done=self.show_import_result,
+                                on_error=self.show_import_error,
+                                description="Импорт")
+
+    def show_import_result(self, result):
+        self.refresh_after_write(self.refresh_all)
+
+        message = (f"Строк в файле: {result['total']}\n"
+                   f"Принято: {result['accepted']}\n"
+                   f"Отклонено: {result['rejected']}\n"
+                   f"Новых артистов: {result['new_artists']}, новых релизов: {result['new_releases']}")
+        if result['rejects']:
+            message += "\n\nОтклоненные строки:\n" + "\n".join(
+                f"запись {record}: {catalog_number or '—'} - {reason}"
+                for record, catalog_number, reason in result['rejects'][:20])
+        messagebox.showinfo("Импорт", message)
+
+    def show_import_error(self, error):
+        messagebox.showerror("Ошибка", f"Не удалось импортировать: {str(error)}")
+
+    # ===== ЛЕНТА ИЗМЕНЕНИЙ =====
+    def refresh_all(self):
+        self.load_media_items()
+        self.load_artists()
+        self.load_releases()
+        self.update_statistics()
+
+    def refresh_after_write(self, *loaders):
+        """Свои изменения придут через ленту; без нее - полная перезагрузка"""
+        if not self.db.listener.connected:
+            for loader in loaders:
+                loader()
+
+    def on_db_change(self, payload):
+        """Накопить изменение из ленты; применяются пачкой после короткой паузы.
+        Для таблицы копятся id измененных строк; None - изменена вся таблица."""
+        table, op, ids = parse_change(payload)
+        if ids is None or self.pending_changes.get(table, set()) is None:
+            self.pending_changes[table] = None
+        else:
+            self.pending_changes.setdefault(table, set()).update(ids)
+        # Добавленные и удаленные строки сдвигают позиции в списке таблицы
+        if op != 'UPDATE':
+            self.pending_moves.add(table)
+
+        if self.changes_after_id is None:
+            self.changes_after_id = self.root.after(CHANGES_DELAY_MS, self.apply_changes)
+
+    def apply_changes(self):
+        """Обновить затронутые списки и статистику.
+        Измененные строки обновляются на месте: перечитываются только видимые
+        из них. Если строки добавлены или удалены, изменена вся таблица или
+        список отфильтрован поиском (изменение может добавить в него строку),
+        перечитывается видимая часть списка."""
+        self.changes_after_id = None
+        changes, self.pending_changes = self.pending_changes, {}
+        moved, self.pending_moves = self.pending_moves, set()
+        media = changes.get('media_items', set())
+        releases = changes.get('releases', set())
+        links = changes.get('release_artists', set())
+        artists = changes.get('artists', set())
+
+        if changes.keys() & {'media_items', 'releases', 'release_artists', 'artists'}:
+            if None in (media, releases, links, artists) or 'media_items' in moved or self.media_search_term:
+                self.load_media_items()
+            else:
+                def fetch_media(loaded, visible, order):
+                    affected = self.db.changed_media_items(loaded, media, releases | links, artists)
+                    return affected, self.db.get_media_items_rows(None, affected & visible, order)
+
+                self.collection_table.patch(fetch_media)
+
+        if 'artists' in changes:
+            if artists is None or 'artists' in moved:
+                self.load_artists()
+            else:
+                def fetch_artists(loaded, visible, order):
+                    affected = artists & loaded
+                    return affected, self.db.get_artists_rows(None, affected & visible, order)
+
+                self.artists_table.patch(fetch_artists)
+
+        if changes.keys() & {'releases', 'release_artists', 'artists'}:
+            if None in (releases, links, artists) or 'releases' in moved:
+                self.load_releases()
+            else:
+                def fetch_releases(loaded, visible, order):
+                    affected = self.db.changed_releases(loaded, releases | links, artists)
+                    return affected, self.db.get_releases_rows(None, affected & visible, order)
+
+                self.releases_table.patch(fetch_releases)
+
+        if changes.keys() & {'media_items', 'releases', 'release_artists'}:
+            self.update_statistics()
 
     # ===== МЕТОДЫ ДЛЯ СТАТИСТИКИ =====
     def update_statistics(self):
-        stats = self.db.get_collection_statistics()
+        """Статистика читается в фоне; незавершенное прежнее чтение отменяется"""
+        if self.statistics_task is not None:
+            self.statistics_task.cancel()
+        self.statistics_task = self.db_executor.submit(
+            self.db.get_collection_statistics,
+            on_done=self.show_statistics,
+            on_error=lambda e: self.show_background_error("Ошибка обновления статистики", e))
+
+    def show_statistics(self, stats):
 
         # Обновляем карточки
         total_items = sum(count for _, count in stats['by_format'])
@@ -1395,31 +1558,107 @@ class AudiotechApp:
         self.stats_cards['artists_count'].config(text=str(stats['artists_count']))
         self.stats_cards['releases_count'].config(text=str(stats['releases_count']))
 
-        # Очищаем таблицы
-        for item in self.format_tree.get_children():
-            self.format_tree.delete(item)
-        for item in self.condition_tree.get_children():
-            self.condition_tree.delete(item)
-
-        # Заполняем таблицу форматов
+        # Заполняем таблицу форматов (меняются только отличающиеся строки)
         total_format_items = sum(count for _, count in stats['by_format'])
+        format_rows = []
         for format_name, count in stats['by_format']:
             if total_format_items > 0:
                 percent = (count / total_format_items) * 100
             else:
                 percent = 0
-            self.format_tree.insert('', 'end', values=(format_name, count, f"{percent:.1f}%"))
+            format_rows.append((format_name, count, f"{percent:.1f}%"))
+        self.format_binding.set_rows(format_rows)
 
         # Заполняем таблицу состояний
         total_condition_items = sum(count for _, count in stats['by_condition'])
+        condition_rows = []
         for condition, count in stats['by_condition']:
             if total_condition_items > 0:
                 percent = (count / total_condition_items) * 100
             else:
                 percent = 0
-            self.condition_tree.insert('', 'end', values=(condition, count, f"{percent:.1f}%"))
+            condition_rows.append((condition, count, f"{percent:.1f}%"))
+        self.condition_binding.set_rows(condition_rows)
+
+    # ===== ДИАГНОСТИКА =====
+    def update_diagnostics(self):
+        """Замеры хранятся в памяти, поэтому читаются прямо в потоке интерфейса"""
+        if self.diagnostics_after_id is not None:
+            self.root.after_cancel(self.diagnostics_after_id)
+            self.diagnostics_after_id = None
+        if self.notebook.select() != str(self.diagnostics_tab):
+            return
+
+        self.diagnostics = diagnostics = self.db.diagnostics()
+        pool, statements = diagnostics['pool'], diagnostics['statements']
+        report_cache = diagnostics['report_cache']
+        slow = sum(query['slow'] for query in diagnostics['queries'])
+        self.diagnostics_summary.config(text=(
+            f"Замеры с {diagnostics['since'].replace('T', ' ')}.   "
+            f"Соединения: занято {pool['in_use']} из {pool['size']} (макс. {pool['max_size']}), "
+            f"ожиданий {pool['waits']}, переподключений {pool['reconnects']}.   "
+            f"Подготовленные операторы: попаданий {statements['hit_ratio']:.0%}.   "
+            f"Кэш отчетов: {report_cache['entries']} шт., попаданий {report_cache['hits']}, "
+            f"промахов {report_cache['misses']}.\n"
+            f"Медленных запросов (дольше {diagnostics['slow_ms']} мс): {slow}; "
+            f"планы - в журнале {os.path.abspath(diagnostics['slow_log']) if diagnostics['slow_log'] else '—'}"))
+
+        self.queries_binding.set_rows(
+            (query['query'], query['calls'], query['errors'], query['slow'],
+             f"{query['total_ms']:.1f}", f"{query['mean_ms']:.2f}", f"{query['p95_ms']:.1f}",
+             f"{query['max_ms']:.1f}", query['rows'], f"{query['bytes_received'] / 1024:.1f}")
+            for query in diagnostics['queries'])
+        self.show_query_details()
+
+        self.diagnostics_after_id = self.root.after(DIAGNOSTICS_REFRESH_MS, self.update_diagnostics)
+
+    def show_query_details(self):
+        selection = self.queries_tree.selection()
+        if not selection or self.diagnostics is None:
+            return
+        label = self.queries_tree.item(selection[0], 'values')[0]
+        query = next((q for q in self.diagnostics['queries'] if q['query'] == label), None)
+        if query is None:
+            return
+
+        details = f"{query['query']}\n\n"
+        details += (f"Вызовов: {query['calls']}, ошибок: {query['errors']}; "
+                    f"мин. {query['min_ms']:.2f}, p50 {query['p50_ms']:.2f}, p95 {query['p95_ms']:.2f}, "
+                    f"p99 {query['p99_ms']:.2f}, макс. {query['max_ms']:.2f} мс; "
+                    f"отправлено {query['bytes_sent']} Б, получено {query['bytes_received']} Б\n\n")
+        peak = max(count for _, count in query['histogram']) or 1
+        for bound, count in query['histogram']:
+            if count:
+                bucket = f"≤ {bound} мс" if bound is not None else "дольше"
+                details += f"{bucket:>12} {'█' * max(1, count * 40 // peak)} {count}\n"
+
+        self.query_details.delete(1.0, tk.END)
+        self.query_details.insert(1.0, details)
+
+    def export_diagnostics(self):
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            initialfile=f"диагностика_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        if filename:
+            try:
+                with open(filename, 'w', encoding='utf-8') as f:
+                    json.dump(self.db.diagnostics(), f, ensure_ascii=False, indent=2)
+                messagebox.showinfo("Успех", f"Замеры сохранены в файл:\n{filename}")
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Не удалось сохранить файл: {str(e)}")
+
+    def reset_diagnostics(self):
+        self.db.metrics.reset()
+        self.query_details.delete(1.0, tk.END)
+        self.update_diagnostics()
 
     def on_closing(self):
+        # Долгие запросы прерываются на сервере, чтобы закрытие не ждало их
+        self.db_executor.cancel_active()
+        self.db_executor.shutdown()
+        self.report_views.stop()
         if self.db:
             self.db.close()
         self.root.destroy()
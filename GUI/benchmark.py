@@ -0,0 +1,313 @@
+# benchmark.py
+"""Замеры времени методов Database и отчетов.
+
+Каждый замер повторяется repeat раз после одного прогона для разогрева;
+в результат идут минимум, медиана, среднее и максимум в миллисекундах и
+число строк ответа. Результат - JSON, его можно сравнить с прошлым
+прогоном (--baseline).
+
+С --scale база перед замерами заполняется генератором datagen на каждом
+масштабе (данные коллекции в ней заменяются!), поэтому вместе с --scale
+нужно явно указать отдельную базу --database.
+
+Запуск из командной строки:
+    python benchmark.py --database audiotech_bench --scale 10k --scale 1M
+                        [--seed 1] [--repeat 5] [--only media] [--output замер.json]
+                        [--baseline прошлый.json]
+"""
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from psycopg2 import sql
+
+from config import DB_CONFIG
+from database import Database
+from datagen import DataGenerator, COLLECTION_TABLES, parse_scale
+from reports import REPORTS, generate_report
+from report_model import write_csv
+
+FORMAT_VERSION = 1
+
+
+class Benchmark:
+    """Замер: run(db, *args) замеряется; setup(db) готовит аргументы,
+    teardown(db, результат) убирает за замером - они в время не входят."""
+
+    def __init__(self, name, run, setup=None, teardown=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.teardown = teardown
+
+
+def _sample(db):
+    """Данные, на которых строятся замеры: существующие id и строка поиска"""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT MIN(artist_id) FROM artists")
+        artist_id = cursor.fetchone()[0]
+        cursor.execute("SELECT MIN(release_id) FROM releases")
+        release_id = cursor.fetchone()[0]
+        cursor.execute("SELECT MIN(media_type_id) FROM media_types")
+        media_type_id = cursor.fetchone()[0]
+        cursor.execute("SELECT ARRAY(SELECT genre_id FROM genres ORDER BY genre_id LIMIT 2)")
+        genre_ids = cursor.fetchone()[0]
+        cursor.execute("SELECT split_part(name, ' ', 1) FROM artists ORDER BY artist_id LIMIT 1")
+        search = (cursor.fetchone() or ('a',))[0]
+    return {
+        'artist_id': artist_id,
+        'release_id': release_id,
+        'media_type_id': media_type_id,
+        'genre_ids': genre_ids,
+        'search': search,
+        'media_items': db.count_media_items(),
+        'artists': db.count_artists(),
+        'releases': db.count_releases(),
+    }
+
+
+def benchmarks(sample):
+    """Все замеры для базы с данными sample (см. _sample)"""
+    search = sample['search']
+    item_data = lambda: (f"BENCH-{time.perf_counter_ns()}", sample['media_type_id'], sample['release_id'],
+                         'Отличное', 1000, None, None, None)
+    artist_args = lambda: (f"Bench artist {time.perf_counter_ns()}", 'Группа', 'Россия')
+    release_data = ('Bench release', 2000, 2000, 'Bench', 'Россия', None, None, None)
+
+    def delete_release(db, release_id):
+        with db.cursor() as cursor:
+            cursor.execute("DELETE FROM releases WHERE release_id = %s", (release_id,))
+
+    def add_media_item(db):
+        return (db.add_media_item(item_data()),)
+
+    def add_artist(db):
+        return (db.add_artist(*artist_args()),)
+
+    items = [
+        Benchmark('count_media_items', lambda db: db.count_media_items()),
+        Benchmark('count_media_items(search)', lambda db: db.count_media_items(search)),
+        Benchmark('get_all_media_items', lambda db: db.get_all_media_items()),
+        Benchmark('get_all_media_items(search)', lambda db: db.get_all_media_items(search)),
+        Benchmark('iter_media_items', lambda db: sum(1 for _ in db.iter_media_items())),
+        Benchmark('get_media_items_page', lambda db: db.get_media_items_page()),
+        Benchmark('get_media_items_page(search)', lambda db: db.get_media_items_page(search)),
+        Benchmark('get_media_items_window(middle)',
+                  lambda db: db.get_media_items_window(offset=sample['media_items'] // 2)),
+        Benchmark('get_media_items_window(order desc)',
+                  lambda db: db.get_media_items_window(offset=sample['media_items'] // 2, order=(3, True))),
+        Benchmark('add_media_item', lambda db: db.add_media_item(item_data()),
+                  teardown=lambda db, item_id: db.delete_media_item(item_id)),
+        Benchmark('update_media_item', lambda db, item_id: db.update_media_item(item_id, item_data()),
+                  setup=add_media_item, teardown=lambda db, _, item_id: db.delete_media_item(item_id)),
+        Benchmark('delete_media_item', lambda db, item_id: db.delete_media_item(item_id),
+                  setup=add_media_item),
+
+        Benchmark('count_artists', lambda db: db.count_artists()),
+        Benchmark('get_all_artists', lambda db: db.get_all_artists()),
+        Benchmark('get_all_artists(search)', lambda db: db.get_all_artists(search)),
+        Benchmark('iter_artists', lambda db: sum(1 for _ in db.iter_artists())),
+        Benchmark('get_artists_page', lambda db: db.get_artists_page()),
+        Benchmark('get_artists_window(middle)',
+                  lambda db: db.get_artists_window(offset=sample['artists'] // 2)),
+        Benchmark('add_artist', lambda db: db.add_artist(*artist_args()),
+                  teardown=lambda db, artist_id: db.delete_artist(artist_id)),
+        Benchmark('update_artist', lambda db, artist_id: db.update_artist(artist_id, *artist_args()),
+                  setup=add_artist, teardown=lambda db, _, artist_id: db.delete_artist(artist_id)),
+        Benchmark('delete_artist', lambda db, artist_id: db.delete_artist(artist_id), setup=add_artist),
+
+        Benchmark('count_releases', lambda db: db.count_releases()),
+        Benchmark('get_all_releases', lambda db: db.get_all_releases()),
+        Benchmark('get_all_releases(search)', lambda db: db.get_all_releases(search)),
+        Benchmark('iter_releases', lambda db: sum(1 for _ in db.iter_releases())),
+        Benchmark('get_releases_page', lambda db: db.get_releases_page()),
+        Benchmark('get_releases_window(middle)',
+                  lambda db: db.get_releases_window(offset=sample['releases'] // 2)),
+        Benchmark('add_release', lambda db: db.add_release(release_data), teardown=delete_release),
+        Benchmark('add_release_with_artists_and_genres',
+                  lambda db: db.add_release_with_artists_and_genres(
+                      release_data, [sample['artist_id']], sample['genre_ids']),
+                  teardown=delete_release),
+        Benchmark('add_releases_bulk(100)',
+                  lambda db: db.add_releases_bulk(
+                      [(release_data, [sample['artist_id']], sample['genre_ids'])] * 100),
+                  teardown=lambda db, release_ids: [delete_release(db, r) for r in release_ids]),
+
+        # Справочники кэшируются: замеряется чтение из базы после сброса кэша
+        Benchmark('get_all_artists_for_select', lambda db: db.get_all_artists_for_select(),
+                  setup=lambda db: db.cache.clear()),
+        Benchmark('get_all_releases_for_select', lambda db: db.get_all_releases_for_select(),
+                  setup=lambda db: db.cache.clear()),
+        Benchmark('get_all_genres_for_select', lambda db: db.get_all_genres_for_select(),
+                  setup=lambda db: db.cache.clear()),
+        Benchmark('get_all_media_types', lambda db: db.get_all_media_types(),
+                  setup=lambda db: db.cache.clear()),
+        Benchmark('get_all_genres', lambda db: db.get_all_genres()),
+
+        Benchmark('get_collection_statistics', lambda db: db.get_collection_statistics()),
+        Benchmark('get_artist_report', lambda db: db.get_artist_report()),
+        Benchmark('get_artist_report(artist_id)', lambda db: db.get_artist_report(sample['artist_id'])),
+        Benchmark('get_format_report', lambda db: db.get_format_report()),
+        Benchmark('refresh_report_views', lambda db: db.refresh_report_views()),
+    ]
+    # Отчеты без кэша и из кэша отчетов (данные не менялись)
+    items += [Benchmark(f"report:{name}", lambda db, name=name: generate_report(db, name),
+                        setup=lambda db: db.report_cache.clear())
+              for name in REPORTS]
+    items += [Benchmark(f"report:{name}:cached", lambda db, name=name: generate_report(db, name))
+              for name in REPORTS]
+    # Выгрузка строк отчета в CSV без построения текста
+    items += [Benchmark(f"report:{name}:csv", lambda db, name=name: write_csv(REPORTS[name][1](db), io.StringIO()))
+              for name in REPORTS]
+    return items
+
+
+def _rows(result):
+    """Число строк ответа; для скаляров (id, количество) - None"""
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], list):
+        return len(result[0])  # страница: (строки, ключ следующей)
+    if isinstance(result, (list, dict, str)):
+        return len(result)
+    return None
+
+
+def measure(db, benchmark, repeat):
+    """Время одного замера: {'min_ms', 'median_ms', 'mean_ms', 'max_ms', 'runs', 'rows'}"""
+    times = []
+    rows = None
+    for run in range(repeat + 1):
+        args = benchmark.setup(db) if benchmark.setup else None
+        args = args if isinstance(args, tuple) else ()
+        started = time.perf_counter()
+        result = benchmark.run(db, *args)
+        elapsed = time.perf_counter() - started
+        if benchmark.teardown:
+            benchmark.teardown(db, result, *args)
+        if run:  # первый прогон - разогрев
+            times.append(elapsed * 1000)
+            rows = _rows(result)
+    return {
+        'min_ms': round(min(times), 3),
+        'median_ms': round(statistics.median(times), 3),
+        'mean_ms': round(statistics.fmean(times), 3),
+        'max_ms': round(max(times), 3),
+        'runs': repeat,
+        'rows': rows,
+    }
+
+
+def table_rows(db):
+    with db.cursor() as cursor:
+        counts = {}
+        for table, _ in COLLECTION_TABLES:
+            cursor.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(table)))
+            counts[table] = cursor.fetchone()[0]
+    return counts
+
+
+def run_scale(db, repeat, only=None, progress=None):
+    """Все замеры на текущих данных базы -> {имя: результат}"""
+    results = {}
+    for benchmark in benchmarks(_sample(db)):
+        if only and not any(pattern in benchmark.name for pattern in only):
+            continue
+        if progress:
+            progress(benchmark.name)
+        results[benchmark.name] = measure(db, benchmark, repeat)
+    return results
+
+
+def compare(current, baseline):
+    """Строки сравнения медиан двух прогонов: (масштаб, замер, было, стало, отношение)"""
+    previous = {(scale['scale'], name): result['median_ms']
+                for scale in baseline['scales'] for name, result in scale['benchmarks'].items()}
+    lines = []
+    for scale in current['scales']:
+        for name, result in scale['benchmarks'].items():
+            before = previous.get((scale['scale'], name))
+            if before:
+                lines.append((scale['scale'], name, before, result['median_ms'], result['median_ms'] / before))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности Database")
+    parser.add_argument('--database', help=f"база для замеров (по умолчанию {DB_CONFIG['database']})")
+    parser.add_argument('--scale', action='append',
+                        help="заполнить базу генератором на этом масштабе (10k, 1M, ...) - заменяет данные!")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append', help="только замеры, в имени которых есть подстрока")
+    parser.add_argument('--output', help="файл результата JSON (по умолчанию stdout)")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    if args.scale and not args.database:
+        parser.error("--scale заменяет данные коллекции: укажите отдельную базу через --database")
+
+    db = Database({**DB_CONFIG, 'database': args.database or DB_CONFIG['database']})
+    if not db.pool:
+        print("Не удалось подключиться к базе данных", file=sys.stderr)
+        return 1
+
+    # Кэш отчетов используется, только пока принимаются уведомления об изменениях
+    db.start_listener()
+    deadline = time.monotonic() + 5
+    while not db.listener.connected and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    def progress(name):
+        print(f"\r{name:60}", end='', file=sys.stderr)
+
+    with db.cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        server_version = cursor.fetchone()[0]
+
+    result = {
+        'version': FORMAT_VERSION,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'server_version': server_version,
+        'scales': [],
+    }
+    try:
+        for scale in args.scale or [None]:
+            entry = {'scale': None}
+            if scale is not None:
+                entry['scale'] = parse_scale(scale)
+                started = time.perf_counter()
+                DataGenerator(db, args.seed, lambda table, rows: progress(f"{table}: {rows}")).generate(
+                    entry['scale'], replace=True)
+                entry['generate_seconds'] = round(time.perf_counter() - started, 3)
+            entry['rows'] = table_rows(db)
+            entry['benchmarks'] = run_scale(db, args.repeat, args.only, progress)
+            result['scales'].append(entry)
+    finally:
+        db.close()
+    print(file=sys.stderr)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for scale, name, before, after, ratio in compare(result, baseline):
+            print(f"{scale or '—':>10} {name:45} {before:10.2f} -> {after:10.2f} мс  x{ratio:.2f}",
+                  file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
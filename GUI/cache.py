@@ -0,0 +1,150 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+
+# Канал NOTIFY, в который триггеры справочных таблиц пишут имя таблицы
+REFERENCE_CHANNEL = 'audiotech_reference'
+
+
+class ReferenceCache:
+    """Кэш справочных наборов (типы носителей, жанры, артисты, релизы).
+
+    Каждый набор зависит от таблиц и сбрасывается при их изменении
+    (invalidate_table, обычно по NOTIFY) или по истечении ttl секунд.
+    Хранится не больше max_entries наборов (вытесняются давно не
+    использованные); наборы больше max_rows строк не кэшируются.
+    Возвращаемые списки общие - изменять их нельзя.
+    """
+
+    def __init__(self, ttl=300, max_entries=32, max_rows=50000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._epoch = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, key, tables, loader):
+        """Набор key из кэша или загруженный loader()"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            versions = [self._epoch] + [self._versions.get(table, 0) for table in tables]
+
+        rows = loader()
+
+        with self._lock:
+            # Если таблицы изменились во время загрузки, набор мог устареть
+            if (len(rows) <= self.max_rows and
+                    versions == [self._epoch] + [self._versions.get(table, 0) for table in tables]):
+                self._entries[key] = (now + self.ttl, rows, tuple(tables))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return rows
+
+    def invalidate_table(self, table):
+        """Сбросить наборы, зависящие от таблицы"""
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            for key in [key for key, entry in self._entries.items() if table in entry[2]]:
+                del self._entries[key]
+            self._invalidations += 1
+
+    def clear(self):
+        """Сбросить все наборы"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'invalidations': self._invalidations,
+            }
+
+
+class ReportCache:
+    """Кэш результатов отчетов по ключу (отчет, параметры) и версии данных.
+
+    Версия - счетчик изменений в базе (Database.data_version); результат
+    выдается из кэша, пока версия не изменилась. С новой версией все
+    прежние результаты сбрасываются; при версии None кэш не используется. Хранится не больше max_entries
+    результатов (вытесняются давно не использованные); текст отчетов
+    длиннее max_lines строк не кэшируется (см. reports). Результаты
+    общие - изменять их нельзя.
+    """
+
+    def __init__(self, max_entries=64, max_lines=20000):
+        self.max_entries = max_entries
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, version, loader):
+        """Результат key для версии данных version или загруженный loader()"""
+        result = self.lookup(key, version)
+        if result is None:
+            result = loader()
+            self.store(key, version, result)
+        return result
+
+    def lookup(self, key, version):
+        """Результат key для версии данных version или None"""
+        with self._lock:
+            if version is None:
+                self._misses += 1
+                return None
+            if version != self._version and (self._version is None or version > self._version):
+                self._entries.clear()
+                self._version = version
+            if version == self._version and key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+            self._misses += 1
+            return None
+
+    def store(self, key, version, result):
+        """Сохранить результат, построенный по версии данных version"""
+        with self._lock:
+            # Версию, которую уже сменила более новая, не кэшируем
+            if version is not None and version == self._version:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'version': self._version,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
@@ -5,3 +5,73 @@ DB_CONFIG = {
     'password': '',  # ваш рабочий пароль
     'port': ''
 }
+
+# Пул соединений
+DB_POOL = {
+    'min_size': 1,
+    'max_size': 10,
+    'timeout': 30,  # ожидание свободного соединения, сек
+    'health_check_interval': 30,  # проверять соединение, простаивавшее дольше, сек
+}
+
+# Размер порции строк для серверных курсоров
+DB_ITERSIZE = 2000
+
+# Размер страницы списков (keyset-пагинация)
+PAGE_SIZE = 200
+
+# Фоновое выполнение запросов
+DB_WORKERS = 4
+SEARCH_DEBOUNCE_MS = 300  # задержка поиска после последнего нажатия клавиши
+
+# Применять миграции схемы при подключении
+DB_AUTO_MIGRATE = True
+
+# Подготовленные операторы (PREPARE) на одно соединение; 0 - не использовать
+DB_PREPARED_STATEMENTS = 100
+
+# Кэш справочников: время жизни набора, сек; число наборов; наборы больше max_rows не кэшируются
+REFERENCE_CACHE = {
+    'ttl': 300,
+    'max_entries': 32,
+    'max_rows': 50000,
+}
+
+# Пауза, за которую изменения из ленты уведомлений собираются в одно обновление, мс
+CHANGES_DELAY_MS = 100
+
+# Обновление вкладки «Диагностика», пока она открыта, мс
+DIAGNOSTICS_REFRESH_MS = 2000
+
+# Виртуальные таблицы: блоков по PAGE_SIZE строк в памяти на один список
+WINDOW_BLOCKS = 50
+
+# Замеры запросов: порог медленного запроса, мс; снимать ли для медленных
+# читающих запросов план EXPLAIN (ANALYZE, BUFFERS) и не чаще чем раз в
+# explain_interval с на запрос; журнал медленных запросов с ротацией
+QUERY_METRICS = {
+    'slow_ms': 500,
+    'explain': True,
+    'explain_interval': 300,
+    'log_path': 'slow_queries.log',
+    'log_max_bytes': 5 * 1024 * 1024,
+    'log_backups': 3,
+}
+
+# Представления отчетов по артистам и форматам: обновлять ли их из интерфейса
+# после изменения данных; пауза после изменения до пересчета, с. Плановый
+# пересчет - python report_views.py --every 900 (один процесс на базу)
+REPORT_VIEWS_AUTO_REFRESH = True
+REPORT_VIEWS_REFRESH = {
+    'delay': 5,
+}
+
+# Кэш результатов отчетов (по версии данных): число хранимых результатов;
+# отчеты длиннее max_lines строк не кэшируются
+REPORT_CACHE = {
+    'max_entries': 64,
+    'max_lines': 20000,
+}
+
+# Текст отчетов выводится и пишется в файл частями по столько строк
+REPORT_CHUNK_LINES = 500
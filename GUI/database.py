@@ -1,128 +1,603 @@
 # database.py
+import threading
 import psycopg2
-from psycopg2 import OperationalError, IntegrityError
-from config import DB_CONFIG
+from psycopg2 import OperationalError, InterfaceError, IntegrityError, sql
+from psycopg2.errors import FeatureNotSupported
+from psycopg2.extensions import QueryCanceledError
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
+from itertools import count
+from config import (DB_CONFIG, DB_POOL, DB_ITERSIZE, PAGE_SIZE, DB_AUTO_MIGRATE, QUERY_METRICS,
+                    DB_PREPARED_STATEMENTS, REFERENCE_CACHE, REPORT_CACHE)
+from pool import ConnectionPool
+from statements import PreparedStatements
+from cache import ReferenceCache, ReportCache, REFERENCE_CHANNEL
+from notify import CHANGES_CHANNEL, NotifyListener, parse_change
+from instrumentation import QueryMetrics, mark_read_only
+from migrations import migrate
 from datetime import datetime
 
 
+_cursor_names = count(1)
+
+# Разделитель имен в колонке артистов списков
+ARTISTS_SEPARATOR = ', '
+
+# Материализованные представления отчетов (миграция 006) и таблицы, от которых они зависят
+REPORT_VIEWS = {
+    'mv_artist_report': ('artists', 'release_artists', 'releases', 'media_items'),
+    'mv_format_report': ('media_types', 'media_items'),
+}
+
+# Таблицы, из которых строятся отчеты: их изменения меняют версию данных
+# отчетов (report_view_refreshes - обновление представлений)
+REPORT_TABLES = {'media_items', 'releases', 'release_artists', 'artists', 'media_types',
+                 'report_view_refreshes'}
+
+# Ключ advisory-блокировок обновления представлений (второй ключ - hashtext имени)
+REPORT_VIEWS_LOCK_ID = 7302
+
+
+def _sort_keys(key_count):
+    return ', '.join(f"sort_key_{i}" for i in range(key_count))
+
+
+def _keyset_after(columns, descending, key):
+    """Условие "строка после ключа key" для ORDER BY columns с NULL в конце.
+    descending - направление каждой колонки. Возвращает (SQL, параметры)."""
+    clauses = []
+    params = []
+    equal = []
+    equal_params = []
+    for column, desc, value in zip(columns, descending, key):
+        if value is not None:
+            # После непустого значения идут большие (меньшие) значения и NULL
+            clauses.append(' AND '.join(equal + [f"({column} {'<' if desc else '>'} %s OR {column} IS NULL)"]))
+            params += equal_params + [value]
+            equal.append(f"{column} = %s")
+            equal_params.append(value)
+        else:
+            equal.append(f"{column} IS NULL")
+    return ' OR '.join(f"({clause})" for clause in clauses) or 'FALSE', params
+
+
+def _list_query(query, key_count):
+    return f"SELECT * FROM ({query}) AS q ORDER BY {_sort_keys(key_count)}"
+
+
+def _page_query(query, params, key_count, page_size, after=None):
+    """Запрос страницы после ключа after: (SQL, параметры)"""
+    keys = _sort_keys(key_count)
+    params = list(params)
+
+    query = f"SELECT * FROM ({query}) AS q"
+    if after is not None:
+        query += f" WHERE ({keys}) > ({', '.join(['%s'] * key_count)})"
+        params += list(after)
+    query += f" ORDER BY {keys} LIMIT %s"
+    params.append(page_size)
+    return query, params
+
+
+def _page_result(rows, key_count, page_size):
+    """(строки без ключа, ключ для следующей страницы или None)"""
+    next_after = tuple(rows[-1][-key_count:]) if len(rows) == page_size else None
+    return [row[:-key_count] for row in rows], next_after
+
+
+def _window_query(query, params, key_count, columns, offset, limit, order=None, after=None):
+    """Запрос окна списка (см. Database._window): (SQL, параметры)"""
+    keys = [f"sort_key_{i}" for i in range(key_count)]
+    descending = [False] * key_count
+    select = "q.*"
+    if order is not None:
+        index, desc = order
+        select += f", {columns[index]} AS sort_value"
+        keys.insert(0, "sort_value")
+        descending.insert(0, bool(desc))
+
+    params = list(params)
+    query = f"SELECT * FROM (SELECT {select} FROM ({query}) AS q) AS w"
+    if after is not None:
+        condition, condition_params = _keyset_after(keys, descending, after)
+        query += f" WHERE {condition}"
+        params += condition_params
+    query += " ORDER BY " + ', '.join(
+        f"{key} DESC NULLS LAST" if desc else key for key, desc in zip(keys, descending))
+    query += " LIMIT %s"
+    params.append(limit)
+    if after is None:
+        query += " OFFSET %s"
+        params.append(offset)
+    return query, params
+
+
+def _window_result(rows, key_count, order=None):
+    """Пары (строка, ключ) из строк окна"""
+    extra = key_count + (order is not None)
+    result = []
+    for row in rows:
+        key = row[-extra:]
+        if order is not None:
+            key = key[-1:] + key[:-1]
+        result.append((row[:-extra], key))
+    return result
+
+
+def _count_query(query):
+    return f"SELECT count(*) FROM ({query}) AS q"
+
+
+def _collection_statistics(rows):
+    """Словарь статистики из строк запроса Database._COLLECTION_STATISTICS"""
+    stats = {
+        'by_format': [],
+        'by_condition': [],
+        'by_year': [],
+        'value_by_format': [],
+        'total_value': 0,
+        'releases_count': 0,
+        'artists_count': 0,
+    }
+
+    for kind, type_name, condition, year, count, total, releases, artists in rows:
+        if kind == 'format':
+            stats['by_format'].append((type_name, count))
+            stats['value_by_format'].append((type_name, count, total))
+        elif kind == 'condition':
+            stats['by_condition'].append((condition, count))
+        elif kind == 'year':
+            if year is not None:
+                stats['by_year'].append((year, count, total))
+        else:
+            stats['total_value'] = total or 0
+            stats['releases_count'] = releases
+            stats['artists_count'] = artists
+
+    stats['by_format'].sort(key=lambda row: row[1], reverse=True)
+    stats['by_condition'].sort(key=lambda row: row[1], reverse=True)
+    stats['by_year'].sort(key=lambda row: row[0], reverse=True)
+    stats['value_by_format'].sort(key=lambda row: row[2] or 0, reverse=True)
+
+    return stats
+
+
+def _release_links(release_ids, releases):
+    """Пары (релиз, артист) и (релиз, жанр) для вставки релизов releases
+    (список (release_data, artist_ids, genre_ids)), получивших id release_ids"""
+    artist_links = [(release_id, artist_id)
+                    for release_id, (_, artist_ids, _) in zip(release_ids, releases)
+                    for artist_id in artist_ids]
+    genre_links = [(release_id, genre_id)
+                   for release_id, (_, _, genre_ids) in zip(release_ids, releases)
+                   for genre_id in genre_ids]
+    return artist_links, genre_links
+
+
+def _release_artists_join(release_column, separator):
+    """LEFT JOIN с артистами релиза одной строкой ar.artist_names,
+    чтобы релиз с несколькими артистами давал одну строку списка"""
+    separator = separator.replace("'", "''")
+    return f"""
+        LEFT JOIN LATERAL (
+            SELECT string_agg(a.name, '{separator}' ORDER BY a.name) AS artist_names
+            FROM release_artists ra
+            JOIN artists a ON a.artist_id = ra.artist_id
+            WHERE ra.release_id = {release_column}
+        ) ar ON true"""
+
+
+def _like_pattern(search):
+    """Шаблон ILIKE для поиска подстроки (спецсимволы экранируются)"""
+    escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+class CancelToken:
+    """Отмена запросов, выполняющихся на сервере в рамках Database.cancellable()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = set()
+        self.cancelled = False
+
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCanceledError("Операция отменена")
+            self._connections.add(conn)
+
+    def detach(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+    def cancel(self):
+        """Прервать текущие запросы; новые запросы будут отклонены"""
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.cancel()
+            except psycopg2.Error:
+                pass
+
+
 class Database:
 
+    # Тексты запросов выпадающих списков и пакетной вставки общие с AsyncDatabase
+    _ARTISTS_FOR_SELECT = "SELECT artist_id, name FROM artists ORDER BY name"
+    _GENRES_FOR_SELECT = "SELECT genre_id, genre_name FROM genres ORDER BY genre_name"
+    _RELEASES_FOR_SELECT = "SELECT release_id, title FROM releases ORDER BY title, release_id"
+
     def get_all_artists_for_select(self):
         """Получить список артистов для выпадающего списка"""
-        query = "SELECT artist_id, name FROM artists ORDER BY name"
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        return cursor.fetchall()
+        return self.cache.get('artists_for_select', ('artists',),
+                              lambda: self._fetchall(self._ARTISTS_FOR_SELECT))
 
     def get_all_genres_for_select(self):
         """Получить список жанров для выпадающего списка"""
-        query = "SELECT genre_id, genre_name FROM genres ORDER BY genre_name"
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        return cursor.fetchall()
+        return self.cache.get('genres_for_select', ('genres',),
+                              lambda: self._fetchall(self._GENRES_FOR_SELECT))
+
+    def get_all_releases_for_select(self):
+        """Получить список релизов для выпадающего списка"""
+        return self.cache.get('releases_for_select', ('releases',),
+                              lambda: self._fetchall(self._RELEASES_FOR_SELECT))
 
     def add_release_with_artists_and_genres(self, release_data, artist_ids, genre_ids):
         """Добавить релиз с артистами и жанрами"""
-        cursor = self.connection.cursor()
-
-        try:
-            # Добавляем релиз
-            query = """
-            INSERT INTO releases (
-                title, release_year, original_year, label, 
-                country, catalog_code, total_duration, total_tracks
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING release_id
-            """
-            cursor.execute(query, release_data)
-            release_id = cursor.fetchone()[0]
+        return self.add_releases_bulk([(release_data, artist_ids, genre_ids)])[0]
 
-            # Добавляем артистов
-            for artist_id in artist_ids:
-                cursor.execute(
-                    "INSERT INTO release_artists (release_id, artist_id) VALUES (%s, %s)",
-                    (release_id, artist_id)
-                )
-
-            # Добавляем жанры
-            for genre_id in genre_ids:
-                cursor.execute(
-                    "INSERT INTO release_genres (release_id, genre_id) VALUES (%s, %s)",
-                    (release_id, genre_id)
-                )
-
-            self.connection.commit()
-            return release_id
-
-        except Exception as e:
-            self.connection.rollback()
-            raise e
-    def __init__(self):
-        self.connection = None
+    _ADD_RELEASES = """
+        INSERT INTO releases (
+            title, release_year, original_year, label,
+            country, catalog_code, total_duration, total_tracks
+        ) VALUES %s
+        RETURNING release_id
+        """
+    _ADD_RELEASE_ARTISTS = "INSERT INTO release_artists (release_id, artist_id) VALUES %s"
+    _ADD_RELEASE_GENRES = "INSERT INTO release_genres (release_id, genre_id) VALUES %s"
+
+    def add_releases_bulk(self, releases, page_size=1000):
+        """Добавить много релизов с артистами и жанрами в одной транзакции.
+        releases - список (release_data, artist_ids, genre_ids).
+        Вставка идет многострочными VALUES; возвращает id релизов в том же порядке."""
+        if not releases:
+            return []
+
+        with self.cursor() as cursor:
+            # Добавляем релизы
+            rows = execute_values(cursor, self._ADD_RELEASES,
+                                  [tuple(release_data) for release_data, _, _ in releases],
+                                  page_size=page_size, fetch=True)
+            release_ids = [row[0] for row in rows]
+
+            # Добавляем артистов и жанры
+            artist_links, genre_links = _release_links(release_ids, releases)
+            if artist_links:
+                execute_values(cursor, self._ADD_RELEASE_ARTISTS, artist_links, page_size=page_size)
+            if genre_links:
+                execute_values(cursor, self._ADD_RELEASE_GENRES, genre_links, page_size=page_size)
+
+        self.cache.invalidate_table('releases')
+        return release_ids
+
+    def __init__(self, params=None, **pool_options):
+        """params - параметры подключения (по умолчанию DB_CONFIG),
+        pool_options - переопределение настроек пула DB_POOL"""
+        self.params = params or DB_CONFIG
+        self.pool_options = {**DB_POOL, **pool_options}
+        self.pool = None
+        self.statements = PreparedStatements(DB_PREPARED_STATEMENTS)
+        # Замеры всех запросов; EXECUTE подготовленных операторов учитывается под исходным текстом
+        self.metrics = QueryMetrics(resolve=self.statements.source, **QUERY_METRICS)
+        self.cache = ReferenceCache(**REFERENCE_CACHE)
+        # Кэш сбрасывается по уведомлениям триггеров; при обрыве приема - целиком
+        self.listener = NotifyListener(self.params, on_reconnect=self.cache.clear)
+        self.listener.subscribe(REFERENCE_CHANNEL, self.cache.invalidate_table)
+        # Результаты отчетов действительны, пока не изменилась версия данных:
+        # счетчик уведомлений об изменении таблиц отчетов (см. data_version)
+        self.report_cache = ReportCache(**REPORT_CACHE)
+        self._report_changes = 0
+        self.listener.subscribe(REFERENCE_CHANNEL, self._report_table_changed)
+        self.listener.subscribe(
+            CHANGES_CHANNEL, lambda payload: self._report_table_changed(parse_change(payload)[0]))
+        self._local = threading.local()
         self.connect()
 
     def connect(self):
         try:
-            self.connection = psycopg2.connect(**DB_CONFIG)
-            return True
+            self.pool = ConnectionPool({**self.params, 'cursor_factory': self.metrics.cursor_factory},
+                                       **self.pool_options)
         except OperationalError as e:
             print(f"Ошибка подключения: {e}")
             return False
 
+        if DB_AUTO_MIGRATE:
+            try:
+                self.apply_migrations()
+            except psycopg2.Error as e:
+                print(f"Ошибка миграции схемы: {e}")
+                self.pool.close()
+                self.pool = None
+                return False
+        return True
+
+    def apply_migrations(self):
+        """Привести схему БД к актуальной версии"""
+        with self.pool.connection() as conn:
+            applied = migrate(conn)
+        if applied:
+            # Планы подготовленных операторов могли устареть
+            self.statements.invalidate()
+        return applied
+
+    # ===== Соединения =====
+    @contextmanager
+    def cancellable(self, token):
+        """Запросы текущего потока внутри блока отменяются через token.cancel()"""
+        previous = getattr(self._local, 'token', None)
+        self._local.token = token
+        try:
+            yield token
+        finally:
+            self._local.token = previous
+
+    @contextmanager
+    def _connection(self):
+        """Соединение из пула, привязанное к токену отмены текущего потока"""
+        with self.pool.connection() as conn:
+            token = getattr(self._local, 'token', None)
+            if token is None:
+                yield conn
+                return
+            token.attach(conn)
+            try:
+                yield conn
+            finally:
+                token.detach(conn)
+
+    @contextmanager
+    def cursor(self, name=None):
+        """Курсор на соединении из пула: коммит при успехе, откат при ошибке.
+        С именем создается серверный (named) курсор."""
+        with self._connection() as conn:
+            try:
+                with conn.cursor(name) as cursor:
+                    yield cursor
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+
+    def _read(self, query, params=None, fetch='all'):
+        """Читающий запрос через подготовленный оператор;
+        при обрыве соединения повторяется на новом"""
+        for attempt in range(2):
+            with self._connection() as conn:
+                try:
+                    with conn.cursor() as cursor:
+                        mark_read_only(cursor)
+                        self.statements.execute(cursor, query, params)
+                        result = cursor.fetchall() if fetch == 'all' else cursor.fetchone()
+                    conn.commit()
+                    return result
+                except FeatureNotSupported:
+                    # Схему изменил другой клиент, и сохраненный план устарел
+                    # ("cached plan must not change result type")
+                    conn.rollback()
+                    self.statements.reset(conn)
+                    if attempt == 0:
+                        continue
+                    raise
+                except (OperationalError, InterfaceError):
+                    # Закрытое соединение пул отбросит, повтор получит новое
+                    if conn.closed and attempt == 0:
+                        continue
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+
+    def _fetchall(self, query, params=None):
+        return self._read(query, params, 'all')
+
+    def _fetchone(self, query, params=None):
+        return self._read(query, params, 'one')
+
+    def _iterate(self, query, params=None, itersize=None):
+        """Построчная выборка через серверный курсор порциями по itersize строк.
+        Соединение занято, пока генератор не исчерпан или не закрыт."""
+        with self.cursor(name=f"stream_{next(_cursor_names)}") as cursor:
+            cursor.itersize = itersize or DB_ITERSIZE
+            cursor.execute(query, params)
+            yield from cursor
+
+    # ===== Списки с ключом сортировки =====
+    # Запросы списков возвращают в последних key_count колонках ключ
+    # сортировки sort_key_0..N (уникальный в пределах выборки).
+    # Ключ используется для порядка выдачи и keyset-пагинации и отрезается
+    # от строк перед возвратом.
+    def _list(self, query, params, key_count):
+        return [row[:-key_count] for row in self._fetchall(_list_query(query, key_count), params)]
+
+    def _stream(self, query, params, key_count, itersize=None):
+        for row in self._iterate(_list_query(query, key_count), params, itersize):
+            yield row[:-key_count]
+
+    def _page(self, query, params, key_count, page_size=None, after=None):
+        """Страница строк после ключа after.
+        Возвращает (строки, ключ для следующей страницы или None)."""
+        page_size = page_size or PAGE_SIZE
+        query, params = _page_query(query, params, key_count, page_size, after)
+        return _page_result(self._fetchall(query, params), key_count, page_size)
+
+    def _window(self, query, params, key_count, columns, offset=0, limit=None, order=None, after=None):
+        """Окно списка: limit строк с позиции offset или сразу после ключа after
+        (ключ последней строки предыдущего окна; так не нужно пропускать offset строк).
+        order = (индекс колонки, по убыванию) сортирует по выражению columns[индекс]
+        с NULL в конце, иначе порядок по умолчанию.
+        Возвращает пары (строка, ключ)."""
+        query, params = _window_query(query, params, key_count, columns,
+                                      offset, limit or PAGE_SIZE, order, after)
+        return _window_result(self._fetchall(query, params), key_count, order)
+
+    def _window_rows(self, query, params, key_count, columns, ids, order=None):
+        """Строки списка с id из ids (колонка columns[0]) с ключами сортировки
+        order, как в окне: пары (строка, ключ). Для точечного обновления окна."""
+        if not ids:
+            return []
+        query = f"SELECT * FROM ({query}) AS f WHERE {columns[0]} = ANY(%s)"
+        return self._window(query, list(params) + [list(ids)], key_count, columns, 0, len(ids), order)
+
+    def _count(self, query, params):
+        return self._fetchone(_count_query(query), params)[0]
+
+    def pool_stats(self):
+        """Метрики пула соединений"""
+        return self.pool.stats()
+
+    def start_listener(self):
+        """Начать прием уведомлений об изменениях в фоновом потоке"""
+        self.listener.start()
+
+    def statement_stats(self):
+        """Попадания и промахи кэша подготовленных операторов"""
+        return self.statements.stats()
+
+    def query_stats(self):
+        """Время, строки и байты по каждому запросу (см. instrumentation)"""
+        return self.metrics.snapshot()
+
+    def diagnostics(self):
+        """Метрики пула, подготовленных операторов, кэша отчетов и запросов одним словарем"""
+        return {
+            'pool': self.pool_stats(),
+            'statements': self.statement_stats(),
+            'report_cache': self.report_cache.stats(),
+            **self.query_stats(),
+        }
+
     # ===== CRUD для Физических носителей =====
-    def get_all_media_items(self, search=None):
-        query = """
-        SELECT 
+    # Выражения сортировки по колонкам списка (для окон с сортировкой)
+    _MEDIA_ITEMS_SORT = ('media_item_id', 'catalog_number', 'album_title', 'artist_name',
+                         'format', 'condition', 'purchase_price',
+                         "to_date(purchase_date, 'DD.MM.YYYY')", 'storage_location')
+
+    @staticmethod
+    def _media_items_query(search=None, artists_separator=ARTISTS_SEPARATOR):
+        """Запрос списка носителей, по строке на носитель.
+        Поиск идет по индексируемым триграммами колонкам (в том числе по
+        каждому артисту), результаты упорядочены по релевантности."""
+        columns = """
             mi.media_item_id,
             mi.catalog_number,
             r.title as album_title,
-            a.name as artist_name,
+            ar.artist_names as artist_name,
             mt.type_name as format,
             mi.condition,
             mi.purchase_price,
             TO_CHAR(mi.purchase_date, 'DD.MM.YYYY') as purchase_date,
-            mi.storage_location
-        FROM media_items mi
+            mi.storage_location"""
+        joins = f"""
         LEFT JOIN releases r ON mi.release_id = r.release_id
         LEFT JOIN media_types mt ON mi.media_type_id = mt.media_type_id
-        LEFT JOIN release_artists ra ON r.release_id = ra.release_id
-        LEFT JOIN artists a ON ra.artist_id = a.artist_id
-        WHERE 1=1
-        """
-        params = []
-
-        if search:
-            query += """
-                AND (mi.catalog_number ILIKE %s 
-                OR r.title ILIKE %s 
-                OR a.name ILIKE %s
-                OR mt.type_name ILIKE %s)
+        {_release_artists_join('r.release_id', artists_separator)}"""
+
+        if not search:
+            query = f"""
+            SELECT {columns},
+                r.title AS sort_key_0,
+                mi.media_item_id AS sort_key_1
+            FROM media_items mi {joins}
             """
-            search_term = f"%{search}%"
-            params = [search_term, search_term, search_term, search_term]
+            return query, [], 2
 
-        query += " ORDER BY r.title"
+        # Каждая ветка использует свой триграммный индекс, затем
+        # совпадения сводятся к носителю с наилучшей оценкой
+        query = f"""
+        WITH matches AS (
+            SELECT mi.media_item_id, word_similarity(%s, mi.catalog_number) AS score
+            FROM media_items mi
+            WHERE mi.catalog_number ILIKE %s
+            UNION ALL
+            SELECT mi.media_item_id, word_similarity(%s, r.title)
+            FROM releases r
+            JOIN media_items mi ON mi.release_id = r.release_id
+            WHERE r.title ILIKE %s
+            UNION ALL
+            SELECT mi.media_item_id, word_similarity(%s, a.name)
+            FROM artists a
+            JOIN release_artists ra ON ra.artist_id = a.artist_id
+            JOIN media_items mi ON mi.release_id = ra.release_id
+            WHERE a.name ILIKE %s
+            UNION ALL
+            SELECT mi.media_item_id, word_similarity(%s, mt.type_name)
+            FROM media_types mt
+            JOIN media_items mi ON mi.media_type_id = mt.media_type_id
+            WHERE mt.type_name ILIKE %s
+        ), ranked AS (
+            SELECT media_item_id, MAX(score) AS rank
+            FROM matches
+            GROUP BY media_item_id
+        )
+        SELECT {columns},
+            -ranked.rank::float8 AS sort_key_0,
+            r.title AS sort_key_1,
+            mi.media_item_id AS sort_key_2
+        FROM ranked
+        JOIN media_items mi ON mi.media_item_id = ranked.media_item_id {joins}
+        """
+        return query, [search, _like_pattern(search)] * 4, 3
 
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchall()
+    def get_all_media_items(self, search=None):
+        return self._list(*self._media_items_query(search))
 
-    def add_media_item(self, data):
-        query = """
+    def iter_media_items(self, search=None, itersize=None):
+        """Носители потоком через серверный курсор"""
+        return self._stream(*self._media_items_query(search), itersize=itersize)
+
+    def get_media_items_page(self, search=None, page_size=None, after=None):
+        """Страница носителей после ключа after"""
+        return self._page(*self._media_items_query(search), page_size, after)
+
+    def get_media_items_window(self, search=None, offset=0, limit=None, order=None, after=None):
+        """Окно списка носителей (см. _window)"""
+        return self._window(*self._media_items_query(search), self._MEDIA_ITEMS_SORT,
+                            offset, limit, order, after)
+
+    def count_media_items(self, search=None):
+        return self._count(*self._media_items_query(search)[:2])
+
+    def get_media_items_rows(self, search=None, ids=(), order=None):
+        """Строки списка носителей ids (см. _window_rows)"""
+        return self._window_rows(*self._media_items_query(search), self._MEDIA_ITEMS_SORT, ids, order)
+
+    _CHANGED_MEDIA_ITEMS = """
+        SELECT media_item_id FROM media_items
+        WHERE media_item_id = ANY(%s)
+          AND (media_item_id = ANY(%s) OR release_id = ANY(%s)
+               OR release_id IN (SELECT release_id FROM release_artists WHERE artist_id = ANY(%s)))
+        """
+
+    def changed_media_items(self, among, ids=(), release_ids=(), artist_ids=()):
+        """Id носителей из among, затронутых изменением носителей ids,
+        релизов release_ids и артистов artist_ids"""
+        return {row[0] for row in self._fetchall(
+            self._CHANGED_MEDIA_ITEMS, (list(among), list(ids), list(release_ids), list(artist_ids)))}
+
+    # Тексты запросов изменения общие с AsyncDatabase
+    _ADD_MEDIA_ITEM = """
         INSERT INTO media_items (
-            catalog_number, media_type_id, release_id, 
-            condition, purchase_price, purchase_date, 
+            catalog_number, media_type_id, release_id,
+            condition, purchase_price, purchase_date,
             storage_location, notes
         ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING media_item_id
         """
-        cursor = self.connection.cursor()
-        cursor.execute(query, data)
-        self.connection.commit()
-        return cursor.fetchone()[0]
 
-    def update_media_item(self, item_id, data):
-        query = """
+    _UPDATE_MEDIA_ITEM = """
         UPDATE media_items SET
             catalog_number = %s,
             media_type_id = %s,
@@ -134,205 +609,328 @@ class Database:
             notes = %s
         WHERE media_item_id = %s
         """
-        cursor = self.connection.cursor()
-        cursor.execute(query, data + (item_id,))
-        self.connection.commit()
+
+    _DELETE_MEDIA_ITEM = "DELETE FROM media_items WHERE media_item_id = %s"
+
+    def add_media_item(self, data):
+        with self.cursor() as cursor:
+            cursor.execute(self._ADD_MEDIA_ITEM, data)
+            return cursor.fetchone()[0]
+
+    def update_media_item(self, item_id, data):
+        with self.cursor() as cursor:
+            cursor.execute(self._UPDATE_MEDIA_ITEM, data + (item_id,))
 
     def delete_media_item(self, item_id):
-        query = "DELETE FROM media_items WHERE media_item_id = %s"
-        cursor = self.connection.cursor()
-        cursor.execute(query, (item_id,))
-        self.connection.commit()
+        with self.cursor() as cursor:
+            cursor.execute(self._DELETE_MEDIA_ITEM, (item_id,))
 
     # ===== CRUD для Артистов =====
+    _ARTISTS_SORT = ('artist_id', 'name', 'artist_type', 'country')
+
+    @staticmethod
+    def _artists_query(search=None):
+        if not search:
+            query = """
+            SELECT artist_id, name, artist_type, country,
+                   name AS sort_key_0, artist_id AS sort_key_1
+            FROM artists
+            """
+            return query, [], 2
+
+        query = """
+        SELECT artist_id, name, artist_type, country,
+               -word_similarity(%s, name)::float8 AS sort_key_0,
+               name AS sort_key_1,
+               artist_id AS sort_key_2
+        FROM artists
+        WHERE name ILIKE %s
+        """
+        return query, [search, _like_pattern(search)], 3
+
     def get_all_artists(self, search=None):
-        query = "SELECT artist_id, name, artist_type, country FROM artists"
-        params = []
+        return self._list(*self._artists_query(search))
+
+    def iter_artists(self, search=None, itersize=None):
+        """Артисты потоком через серверный курсор"""
+        return self._stream(*self._artists_query(search), itersize=itersize)
+
+    def get_artists_page(self, search=None, page_size=None, after=None):
+        """Страница артистов после ключа after"""
+        return self._page(*self._artists_query(search), page_size, after)
 
-        if search:
-            query += " WHERE name ILIKE %s"
-            params = [f"%{search}%"]
+    def get_artists_window(self, search=None, offset=0, limit=None, order=None, after=None):
+        """Окно списка артистов (см. _window)"""
+        return self._window(*self._artists_query(search), self._ARTISTS_SORT,
+                            offset, limit, order, after)
 
-        query += " ORDER BY name"
+    def count_artists(self, search=None):
+        return self._count(*self._artists_query(search)[:2])
 
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchall()
+    def get_artists_rows(self, search=None, ids=(), order=None):
+        """Строки списка артистов ids (см. _window_rows)"""
+        return self._window_rows(*self._artists_query(search), self._ARTISTS_SORT, ids, order)
+
+    _ADD_ARTIST = "INSERT INTO artists (name, artist_type, country) VALUES (%s, %s, %s) RETURNING artist_id"
+    _UPDATE_ARTIST = "UPDATE artists SET name = %s, artist_type = %s, country = %s WHERE artist_id = %s"
+    _DELETE_ARTIST = "DELETE FROM artists WHERE artist_id = %s"
 
     def add_artist(self, name, artist_type, country):
-        query = "INSERT INTO artists (name, artist_type, country) VALUES (%s, %s, %s) RETURNING artist_id"
-        cursor = self.connection.cursor()
-        cursor.execute(query, (name, artist_type, country))
-        self.connection.commit()
-        return cursor.fetchone()[0]
+        with self.cursor() as cursor:
+            cursor.execute(self._ADD_ARTIST, (name, artist_type, country))
+            artist_id = cursor.fetchone()[0]
+        # Свои изменения видны сразу, не дожидаясь уведомления
+        self.cache.invalidate_table('artists')
+        return artist_id
 
     def update_artist(self, artist_id, name, artist_type, country):
-        query = "UPDATE artists SET name = %s, artist_type = %s, country = %s WHERE artist_id = %s"
-        cursor = self.connection.cursor()
-        cursor.execute(query, (name, artist_type, country, artist_id))
-        self.connection.commit()
+        with self.cursor() as cursor:
+            cursor.execute(self._UPDATE_ARTIST, (name, artist_type, country, artist_id))
+        self.cache.invalidate_table('artists')
 
     def delete_artist(self, artist_id):
-        query = "DELETE FROM artists WHERE artist_id = %s"
-        cursor = self.connection.cursor()
-        cursor.execute(query, (artist_id,))
-        self.connection.commit()
+        with self.cursor() as cursor:
+            cursor.execute(self._DELETE_ARTIST, (artist_id,))
+        self.cache.invalidate_table('artists')
 
     # ===== CRUD для Релизов =====
-    def get_all_releases(self, search=None):
-        query = """
-        SELECT r.release_id, r.title, r.release_year, r.label, 
-               r.country, a.name as artist_name
-        FROM releases r
-        LEFT JOIN release_artists ra ON r.release_id = ra.release_id
-        LEFT JOIN artists a ON ra.artist_id = a.artist_id
+    _RELEASES_SORT = ('release_id', 'title', 'release_year', 'label', 'country', 'artist_name')
+
+    @staticmethod
+    def _releases_query(search=None, artists_separator=ARTISTS_SEPARATOR):
+        """Запрос списка релизов, по строке на релиз; поиск по названию и
+        по каждому артисту"""
+        columns = """
+            r.release_id, r.title, r.release_year, r.label,
+            r.country, ar.artist_names as artist_name"""
+        joins = _release_artists_join('r.release_id', artists_separator)
+
+        if not search:
+            query = f"""
+            SELECT {columns},
+                r.title AS sort_key_0,
+                r.release_id AS sort_key_1
+            FROM releases r {joins}
+            """
+            return query, [], 2
+
+        query = f"""
+        WITH matches AS (
+            SELECT r.release_id, word_similarity(%s, r.title) AS score
+            FROM releases r
+            WHERE r.title ILIKE %s
+            UNION ALL
+            SELECT ra.release_id, word_similarity(%s, a.name)
+            FROM artists a
+            JOIN release_artists ra ON ra.artist_id = a.artist_id
+            WHERE a.name ILIKE %s
+        ), ranked AS (
+            SELECT release_id, MAX(score) AS rank
+            FROM matches
+            GROUP BY release_id
+        )
+        SELECT {columns},
+            -ranked.rank::float8 AS sort_key_0,
+            r.title AS sort_key_1,
+            r.release_id AS sort_key_2
+        FROM ranked
+        JOIN releases r ON r.release_id = ranked.release_id {joins}
         """
-        params = []
+        return query, [search, _like_pattern(search)] * 2, 3
 
-        if search:
-            query += " WHERE r.title ILIKE %s OR a.name ILIKE %s"
-            params = [f"%{search}%", f"%{search}%"]
+    def get_all_releases(self, search=None):
+        return self._list(*self._releases_query(search))
 
-        query += " ORDER BY r.title"
+    def iter_releases(self, search=None, itersize=None):
+        """Релизы потоком через серверный курсор"""
+        return self._stream(*self._releases_query(search), itersize=itersize)
 
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchall()
+    def get_releases_page(self, search=None, page_size=None, after=None):
+        """Страница релизов после ключа after"""
+        return self._page(*self._releases_query(search), page_size, after)
 
-    def add_release(self, data):
-        query = """
+    def get_releases_window(self, search=None, offset=0, limit=None, order=None, after=None):
+        """Окно списка релизов (см. _window)"""
+        return self._window(*self._releases_query(search), self._RELEASES_SORT,
+                            offset, limit, order, after)
+
+    def count_releases(self, search=None):
+        return self._count(*self._releases_query(search)[:2])
+
+    def get_releases_rows(self, search=None, ids=(), order=None):
+        """Строки списка релизов ids (см. _window_rows)"""
+        return self._window_rows(*self._releases_query(search), self._RELEASES_SORT, ids, order)
+
+    _CHANGED_RELEASES = """
+        SELECT release_id FROM releases
+        WHERE release_id = ANY(%s)
+          AND (release_id = ANY(%s)
+               OR release_id IN (SELECT release_id FROM release_artists WHERE artist_id = ANY(%s)))
+        """
+
+    def changed_releases(self, among, ids=(), artist_ids=()):
+        """Id релизов из among, затронутых изменением релизов ids и артистов artist_ids"""
+        return {row[0] for row in self._fetchall(
+            self._CHANGED_RELEASES, (list(among), list(ids), list(artist_ids)))}
+
+    _ADD_RELEASE = """
         INSERT INTO releases (
-            title, release_year, original_year, label, 
+            title, release_year, original_year, label,
             country, catalog_code, total_duration, total_tracks
         ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING release_id
         """
-        cursor = self.connection.cursor()
-        cursor.execute(query, data)
-        self.connection.commit()
-        return cursor.fetchone()[0]
+
+    def add_release(self, data):
+        with self.cursor() as cursor:
+            cursor.execute(self._ADD_RELEASE, data)
+            release_id = cursor.fetchone()[0]
+        self.cache.invalidate_table('releases')
+        return release_id
 
     # ===== CRUD для Жанров =====
+    _GENRES = "SELECT genre_id, genre_name FROM genres ORDER BY genre_name"
+
     def get_all_genres(self):
-        query = "SELECT genre_id, genre_name FROM genres ORDER BY genre_name"
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        return cursor.fetchall()
+        return self._fetchall(self._GENRES)
 
     # ===== CRUD для Типов носителей =====
+    _MEDIA_TYPES = "SELECT media_type_id, type_name, description FROM media_types ORDER BY type_name"
+
     def get_all_media_types(self):
-        query = "SELECT media_type_id, type_name, description FROM media_types ORDER BY type_name"
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        return cursor.fetchall()
+        return self.cache.get('media_types', ('media_types',), lambda: self._fetchall(self._MEDIA_TYPES))
 
     # ===== Отчеты =====
+    _COLLECTION_STATISTICS = """
+        SELECT 'format', mt.type_name, NULL::VARCHAR, NULL::INTEGER,
+               s.items_count, s.total_value, NULL::BIGINT, NULL::BIGINT
+        FROM stats_by_format s
+        JOIN media_types mt ON mt.media_type_id = s.media_type_id
+        WHERE s.items_count > 0
+        UNION ALL
+        SELECT 'condition', NULL, CASE WHEN condition_is_null THEN NULL ELSE condition END, NULL,
+               items_count, total_value, NULL, NULL
+        FROM stats_by_condition
+        WHERE items_count > 0
+        UNION ALL
+        SELECT 'year', NULL, NULL, year,
+               items_count, total_value, NULL, NULL
+        FROM stats_by_year
+        WHERE items_count > 0
+        UNION ALL
+        SELECT 'total', NULL, NULL, NULL,
+               items_count, total_value, releases_count, artists_count
+        FROM stats_totals
+    """
+
     def get_collection_statistics(self):
-        cursor = self.connection.cursor()
+        """Статистика коллекции одним запросом из сводных таблиц,
+        которые поддерживаются триггерами (см. миграцию 002)"""
+        return _collection_statistics(self._fetchall(self._COLLECTION_STATISTICS))
+
+    _ARTIST_ITEMS_REPORT = """
+        SELECT
+            r.title,
+            mt.type_name,
+            mi.condition,
+            mi.purchase_price,
+            mi.purchase_date
+        FROM media_items mi
+        JOIN releases r ON mi.release_id = r.release_id
+        JOIN media_types mt ON mi.media_type_id = mt.media_type_id
+        JOIN release_artists ra ON r.release_id = ra.release_id
+        WHERE ra.artist_id = %s
+        ORDER BY r.title
+        """
 
-        # Общая статистика
-        stats = {}
+    # Сводные отчеты читаются из материализованных представлений
+    # (см. refresh_report_views и get_report_freshness)
+    _ARTISTS_REPORT = """
+        SELECT name, releases_count, items_count, total_value
+        FROM mv_artist_report
+        ORDER BY name
+        """
 
-        # Количество по форматам
-        cursor.execute("""
-            SELECT mt.type_name, COUNT(*)
-            FROM media_items mi
-            JOIN media_types mt ON mi.media_type_id = mt.media_type_id
-            GROUP BY mt.type_name
-            ORDER BY COUNT(*) DESC
-        """)
-        stats['by_format'] = cursor.fetchall()
-
-        # Количество по состоянию
-        cursor.execute("""
-            SELECT condition, COUNT(*)
-            FROM media_items
-            GROUP BY condition
-            ORDER BY COUNT(*) DESC
-        """)
-        stats['by_condition'] = cursor.fetchall()
-
-        # Общая стоимость
-        cursor.execute("SELECT SUM(purchase_price) FROM media_items")
-        stats['total_value'] = cursor.fetchone()[0] or 0
-
-        # Количество релизов
-        cursor.execute("SELECT COUNT(DISTINCT release_id) FROM media_items")
-        stats['releases_count'] = cursor.fetchone()[0]
-
-        # Количество артистов
-        cursor.execute(
-            "SELECT COUNT(DISTINCT a.artist_id) FROM artists a JOIN release_artists ra ON a.artist_id = ra.artist_id")
-        stats['artists_count'] = cursor.fetchone()[0]
-
-        # По годам покупки
-        cursor.execute("""
-            SELECT EXTRACT(YEAR FROM purchase_date) as year, 
-                   COUNT(*), 
-                   SUM(purchase_price)
-            FROM media_items
-            WHERE purchase_date IS NOT NULL
-            GROUP BY EXTRACT(YEAR FROM purchase_date)
-            ORDER BY year DESC
-        """)
-        stats['by_year'] = cursor.fetchall()
-
-        return stats
+    _FORMAT_REPORT = """
+        SELECT type_name, items_count, avg_price, total_value, first_purchase, last_purchase
+        FROM mv_format_report
+        ORDER BY items_count DESC
+        """
 
-    def get_artist_report(self, artist_id=None):
-        cursor = self.connection.cursor()
+    _REPORT_FRESHNESS = "SELECT view_name, refreshed_at FROM report_view_refreshes"
+
+    _REPORT_VIEW_LOCK = "SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))"
 
+    # Обновлено ли представление после того, как устарело (%s секунд назад).
+    # Возраст отсчитывается по часам сервера: часы клиента могут расходиться.
+    _REPORT_VIEW_FRESH = """
+        SELECT refreshed_at >= clock_timestamp() - make_interval(secs => %s)
+        FROM report_view_refreshes WHERE view_name = %s
+        """
+
+    _REPORT_VIEW_REFRESH = sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}")
+
+    _REPORT_VIEW_REFRESHED = "UPDATE report_view_refreshes SET refreshed_at = now() WHERE view_name = %s"
+
+    def get_artist_report(self, artist_id=None):
         if artist_id:
-            query = """
-            SELECT 
-                r.title,
-                mt.type_name,
-                mi.condition,
-                mi.purchase_price,
-                TO_CHAR(mi.purchase_date, 'DD.MM.YYYY')
-            FROM media_items mi
-            JOIN releases r ON mi.release_id = r.release_id
-            JOIN media_types mt ON mi.media_type_id = mt.media_type_id
-            JOIN release_artists ra ON r.release_id = ra.release_id
-            WHERE ra.artist_id = %s
-            ORDER BY r.title
-            """
-            cursor.execute(query, (artist_id,))
-        else:
-            query = """
-            SELECT 
-                a.name,
-                COUNT(DISTINCT r.release_id) as releases_count,
-                COUNT(mi.media_item_id) as items_count,
-                SUM(mi.purchase_price) as total_value
-            FROM artists a
-            LEFT JOIN release_artists ra ON a.artist_id = ra.artist_id
-            LEFT JOIN releases r ON ra.release_id = r.release_id
-            LEFT JOIN media_items mi ON r.release_id = mi.release_id
-            GROUP BY a.artist_id, a.name
-            ORDER BY a.name
-            """
-            cursor.execute(query)
+            return self._fetchall(self._ARTIST_ITEMS_REPORT, (artist_id,))
+        return self._fetchall(self._ARTISTS_REPORT)
 
-        return cursor.fetchall()
+    def iter_artist_report(self, artist_id=None):
+        """То же, что get_artist_report, построчно через серверный курсор"""
+        if artist_id:
+            return self._iterate(self._ARTIST_ITEMS_REPORT, (artist_id,))
+        return self._iterate(self._ARTISTS_REPORT)
 
     def get_format_report(self):
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            SELECT 
-                mt.type_name,
-                COUNT(mi.media_item_id) as count,
-                AVG(mi.purchase_price) as avg_price,
-                SUM(mi.purchase_price) as total_value,
-                MIN(mi.purchase_date) as first_purchase,
-                MAX(mi.purchase_date) as last_purchase
-            FROM media_types mt
-            LEFT JOIN media_items mi ON mt.media_type_id = mi.media_type_id
-            GROUP BY mt.media_type_id, mt.type_name
-            ORDER BY COUNT(mi.media_item_id) DESC
-        """)
-        return cursor.fetchall()
+        return self._fetchall(self._FORMAT_REPORT)
+
+    def _report_table_changed(self, table):
+        # Вызывается только в потоке слушателя
+        if table in REPORT_TABLES:
+            self._report_changes += 1
+
+    def data_version(self):
+        """Версия данных отчетов: растет с каждым уведомлением об изменении
+        таблиц, из которых они строятся, и с каждым переподключением
+        слушателя. Уведомление приходит после коммита, поэтому отчет,
+        построенный до него, кэшируется под старой версией и сбрасывается
+        вместе с ней. Запроса к базе и общей строки-счетчика нет.
+        None - уведомления не принимаются, версия неизвестна."""
+        if not self.listener.connected:
+            return None
+        return self.listener.connections, self._report_changes
+
+    def get_report_freshness(self):
+        """Время, на которое актуальны представления отчетов: {представление: время}"""
+        return dict(self._fetchall(self._REPORT_FRESHNESS))
+
+    def refresh_report_views(self, views=None, ages=None):
+        """Пересчитать представления отчетов, каждое в своей транзакции.
+        REFRESH ... CONCURRENTLY не блокирует чтение отчетов и запись в таблицы.
+        Представление, которое сейчас обновляет другой клиент, пропускается.
+        ages - {представление: сколько секунд назад оно устарело}: уже
+        обновленное после этого (другим клиентом) не пересчитывается.
+        Возвращает список актуальных: обновленных или уже обновленных."""
+        refreshed = []
+        for view in views or REPORT_VIEWS:
+            with self.cursor() as cursor:
+                cursor.execute(self._REPORT_VIEW_LOCK, (REPORT_VIEWS_LOCK_ID, view))
+                if not cursor.fetchone()[0]:
+                    continue
+                if ages and view in ages:
+                    cursor.execute(self._REPORT_VIEW_FRESH, (ages[view], view))
+                    row = cursor.fetchone()
+                    if row and row[0]:
+                        refreshed.append(view)
+                        continue
+                cursor.execute(self._REPORT_VIEW_REFRESH.format(sql.Identifier(view)))
+                cursor.execute(self._REPORT_VIEW_REFRESHED, (view,))
+            refreshed.append(view)
+        return refreshed
 
     def close(self):
-        if self.connection:
-            self.connection.close()
+        self.listener.stop()
+        if self.pool:
+            self.pool.close()
@@ -0,0 +1,341 @@
+# datagen.py
+"""Генератор синтетической коллекции для замеров производительности.
+
+Заполняет схему (артисты, релизы, треки, носители, атрибуты винила,
+таблицы связей) воспроизводимыми данными: один и тот же seed и масштаб
+дают одни и те же строки. Масштаб - число носителей, остальные таблицы
+растут пропорционально (SCALE_RATIOS). Строки генерируются потоком и
+загружаются через COPY, так что и 10M носителей не держатся в памяти.
+
+Запуск из командной строки:
+    python datagen.py 100k [--seed 1] [--database audiotech_bench] [--replace]
+"""
+import argparse
+import random
+import sys
+import time
+from itertools import islice
+
+from psycopg2 import sql
+
+from config import DB_CONFIG
+from database import Database
+
+# Строк на один носитель
+SCALE_RATIOS = {
+    'artists': 0.05,
+    'releases': 0.5,
+}
+TRACKS_PER_RELEASE = (4, 12)
+FEATURED_TRACK_SHARE = 0.05  # доля треков с приглашенным артистом
+
+# Справочники для пустой базы (как в audiotech_db.md)
+DEFAULT_MEDIA_TYPES = [
+    ('Виниловая пластинка', 'Винил'),
+    ('Компакт-диск (CD)', 'CD'),
+    ('Компакт-кассета', 'Кассета'),
+]
+DEFAULT_GENRES = ['Рок', 'Поп', 'Джаз', 'Классическая музыка', 'Электронная музыка']
+
+# Таблицы коллекции в порядке загрузки и их колонки id
+COLLECTION_TABLES = [
+    ('artists', 'artist_id'),
+    ('releases', 'release_id'),
+    ('tracks', 'track_id'),
+    ('media_items', 'media_item_id'),
+    ('vinyl_attributes', 'vinyl_id'),
+    ('release_artists', None),
+    ('track_artists', None),
+    ('release_genres', None),
+]
+
+WORDS = [
+    'Ночь', 'Город', 'Река', 'Ветер', 'Огонь', 'Звезда', 'Дорога', 'Море', 'Тень', 'Свет',
+    'Night', 'City', 'River', 'Wind', 'Fire', 'Star', 'Road', 'Ocean', 'Shadow', 'Light',
+    'Blue', 'Silver', 'Electric', 'Velvet', 'Golden', 'Silent', 'Wild', 'Broken', 'Neon', 'Black',
+    'Dream', 'Machine', 'Garden', 'Echo', 'Storm', 'Heart', 'Mirror', 'Summer', 'Winter', 'Radio',
+]
+ARTIST_TYPES = ['Группа', 'Исполнитель', 'Оркестр', 'Дуэт']
+COUNTRIES = ['Великобритания', 'США', 'СССР', 'Россия', 'Германия', 'Франция', 'Япония', 'Швеция']
+LABELS = ['EMI', 'Columbia', 'Мелодия', 'Harvest', 'Atlantic', 'Virgin', 'Island', 'Parlophone']
+CONDITIONS = ['Отличное', 'Хорошее', 'Удовлетворительное', 'Новое', None]
+SIDES = ['A', 'B']
+
+
+def parse_scale(text):
+    """'10k', '2.5M', '10000' -> число носителей"""
+    text = str(text).strip().lower().replace('_', '')
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    number = text[:-1] if multiplier > 1 else text
+    scale = int(float(number) * multiplier)
+    if scale < 1:
+        raise ValueError(f"Неверный масштаб: {text}")
+    return scale
+
+
+def _mix(*values):
+    """Детерминированное перемешивание целых (splitmix64)"""
+    h = 0x9E3779B97F4A7C15
+    for value in values:
+        h = (h ^ value) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+        h = (h ^ (h >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 31
+    return h
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class _CopyStream:
+    """Файл для copy_expert: текстовый формат COPY из генератора строк"""
+
+    def __init__(self, rows, on_rows=None):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self._on_rows = on_rows
+        self.count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            batch = list(islice(self._rows, 1000))
+            if not batch:
+                break
+            self._buffer += ''.join('\t'.join(map(_copy_value, row)) + '\n' for row in batch)
+            self.count += len(batch)
+            if self._on_rows:
+                self._on_rows(self.count)
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    readline = read
+
+
+class DataGenerator:
+    """Заполнение базы синтетической коллекцией.
+    progress(таблица, строк) вызывается по мере загрузки."""
+
+    def __init__(self, db, seed=1, progress=None):
+        self.db = db
+        self.seed = seed
+        self.progress = progress
+
+    def _random(self, table):
+        return random.Random(f"{self.seed}:{table}")
+
+    def _track_count(self, release_id):
+        low, high = TRACKS_PER_RELEASE
+        return low + _mix(self.seed, release_id) % (high - low + 1)
+
+    def _track_duration(self, release_id, track_number):
+        return 120 + _mix(self.seed, release_id, track_number) % 360
+
+    def _words(self, rng, low, high):
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    def generate(self, scale, replace=False):
+        """Добавить scale носителей с релизами, артистами и треками.
+        replace - сначала очистить таблицы коллекции.
+        Возвращает число строк по таблицам."""
+        items = scale
+        artists = max(int(items * SCALE_RATIOS['artists']), 10)
+        releases = max(int(items * SCALE_RATIOS['releases']), 10)
+
+        with self.db.cursor() as cursor:
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            if replace:
+                cursor.execute(sql.SQL("TRUNCATE {} RESTART IDENTITY").format(
+                    sql.SQL(', ').join(sql.Identifier(table) for table, _ in COLLECTION_TABLES)))
+            media_type_ids, vinyl_type_id, genre_ids = self._references(cursor)
+            base = self._max_ids(cursor)
+
+            artist_ids = range(base['artist_id'] + 1, base['artist_id'] + artists + 1)
+            release_ids = range(base['release_id'] + 1, base['release_id'] + releases + 1)
+            track_base = base['track_id']
+            item_base = base['media_item_id']
+
+            counts = {}
+            counts['artists'] = self._copy(cursor, 'artists', ('artist_id', 'name', 'artist_type', 'country'),
+                                           self._artists(artist_ids))
+            counts['releases'] = self._copy(cursor, 'releases', (
+                'release_id', 'title', 'release_year', 'original_year', 'label',
+                'country', 'catalog_code', 'total_duration', 'total_tracks'), self._releases(release_ids))
+            counts['tracks'] = self._copy(cursor, 'tracks', (
+                'track_id', 'release_id', 'track_number', 'title', 'duration', 'side'),
+                self._tracks(release_ids, track_base))
+            counts['media_items'] = self._copy(cursor, 'media_items', (
+                'media_item_id', 'catalog_number', 'media_type_id', 'release_id', 'condition',
+                'purchase_price', 'purchase_date', 'storage_location', 'notes'),
+                self._media_items(items, item_base, release_ids, media_type_ids))
+            counts['vinyl_attributes'] = self._vinyl_attributes(cursor, item_base, vinyl_type_id)
+            counts['release_artists'] = self._copy(cursor, 'release_artists', ('release_id', 'artist_id'),
+                                                   self._release_artists(release_ids, artist_ids))
+            counts['track_artists'] = self._copy(cursor, 'track_artists', ('track_id', 'artist_id'),
+                                                 self._track_artists(release_ids, track_base, artist_ids))
+            counts['release_genres'] = self._copy(cursor, 'release_genres', ('release_id', 'genre_id'),
+                                                  self._release_genres(release_ids, genre_ids))
+            self._reset_sequences(cursor)
+
+        # Статистика планировщика для только что загруженных таблиц
+        with self.db.cursor() as cursor:
+            for table, _ in COLLECTION_TABLES:
+                cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+        self.db.refresh_report_views()
+        self.db.cache.clear()
+        return counts
+
+    def _references(self, cursor):
+        cursor.execute("SELECT COUNT(*) FROM media_types")
+        if not cursor.fetchone()[0]:
+            cursor.executemany("INSERT INTO media_types (type_name, description) VALUES (%s, %s)",
+                               DEFAULT_MEDIA_TYPES)
+        cursor.execute("SELECT COUNT(*) FROM genres")
+        if not cursor.fetchone()[0]:
+            cursor.executemany("INSERT INTO genres (genre_name) VALUES (%s)", [(g,) for g in DEFAULT_GENRES])
+
+        cursor.execute("SELECT media_type_id, type_name FROM media_types ORDER BY media_type_id")
+        media_types = cursor.fetchall()
+        vinyl_type_id = next((type_id for type_id, name in media_types if 'винил' in name.lower()), None)
+        cursor.execute("SELECT genre_id FROM genres ORDER BY genre_id")
+        return [type_id for type_id, _ in media_types], vinyl_type_id, [row[0] for row in cursor.fetchall()]
+
+    def _max_ids(self, cursor):
+        base = {}
+        for table, column in COLLECTION_TABLES:
+            if column:
+                cursor.execute(sql.SQL("SELECT COALESCE(MAX({}), 0) FROM {}").format(
+                    sql.Identifier(column), sql.Identifier(table)))
+                base[column] = cursor.fetchone()[0]
+        return base
+
+    def _copy(self, cursor, table, columns, rows):
+        stream = _CopyStream(rows, self.progress and (lambda count: self.progress(table, count)))
+        cursor.copy_expert(sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(table), sql.SQL(', ').join(map(sql.Identifier, columns))), stream)
+        return stream.count
+
+    def _reset_sequences(self, cursor):
+        for table, column in COLLECTION_TABLES:
+            if column:
+                cursor.execute(sql.SQL(
+                    "SELECT setval(pg_get_serial_sequence({table}, {column}), "
+                    "COALESCE((SELECT MAX({id}) FROM {ident}), 0) + 1, false)"
+                ).format(table=sql.Literal(table), column=sql.Literal(column),
+                         id=sql.Identifier(column), ident=sql.Identifier(table)))
+
+    # ===== Строки таблиц =====
+    def _artists(self, artist_ids):
+        rng = self._random('artists')
+        for artist_id in artist_ids:
+            # Номер в имени обеспечивает уникальность
+            yield (artist_id, f"{self._words(rng, 1, 3)} {artist_id}",
+                   rng.choice(ARTIST_TYPES), rng.choice(COUNTRIES))
+
+    def _releases(self, release_ids):
+        rng = self._random('releases')
+        for release_id in release_ids:
+            year = rng.randint(1955, 2024)
+            tracks = self._track_count(release_id)
+            duration = sum(self._track_duration(release_id, n) for n in range(1, tracks + 1))
+            yield (release_id, self._words(rng, 1, 4), year,
+                   year if rng.random() < 0.8 else rng.randint(1955, year),
+                   rng.choice(LABELS), rng.choice(COUNTRIES),
+                   f"CAT-{release_id:07d}", duration, tracks)
+
+    def _tracks(self, release_ids, track_base):
+        rng = self._random('tracks')
+        track_id = track_base
+        for release_id in release_ids:
+            tracks = self._track_count(release_id)
+            for number in range(1, tracks + 1):
+                track_id += 1
+                yield (track_id, release_id, number, self._words(rng, 1, 3),
+                       self._track_duration(release_id, number), SIDES[(number - 1) * 2 // tracks])
+
+    def _media_items(self, items, item_base, release_ids, media_type_ids):
+        rng = self._random('media_items')
+        for item_id in range(item_base + 1, item_base + items + 1):
+            price = round(rng.uniform(100, 15000), 2) if rng.random() < 0.9 else None
+            date = (f"{rng.randint(1990, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+                    if rng.random() < 0.9 else None)
+            yield (item_id, f"GEN-{item_id:08d}", rng.choice(media_type_ids),
+                   release_ids[rng.randrange(len(release_ids))], rng.choice(CONDITIONS), price, date,
+                   f"Полка {rng.randint(1, 200)}", None if rng.random() < 0.95 else self._words(rng, 2, 6))
+
+    def _vinyl_attributes(self, cursor, item_base, vinyl_type_id):
+        if vinyl_type_id is None:
+            return 0
+        # Атрибуты зависят только от id носителя - так же воспроизводимо, как и остальное
+        cursor.execute("""
+            INSERT INTO vinyl_attributes (media_item_id, size, sides_count, rpm)
+            SELECT media_item_id,
+                   CASE WHEN media_item_id %% 5 = 0 THEN '7"' ELSE '12"' END,
+                   CASE WHEN media_item_id %% 7 = 0 THEN 4 ELSE 2 END,
+                   CASE WHEN media_item_id %% 5 = 0 THEN 45 ELSE 33 END
+            FROM media_items
+            WHERE media_item_id > %s AND media_type_id = %s
+        """, (item_base, vinyl_type_id))
+        return cursor.rowcount
+
+    def _pick_artist(self, rng, artist_ids):
+        # Квадрат смещает выбор к началу: у части артистов много релизов
+        return artist_ids[int(len(artist_ids) * rng.random() ** 2)]
+
+    def _release_artists(self, release_ids, artist_ids):
+        rng = self._random('release_artists')
+        for release_id in release_ids:
+            count = 1 if rng.random() < 0.85 else rng.randint(2, 3)
+            for artist_id in {self._pick_artist(rng, artist_ids) for _ in range(count)}:
+                yield release_id, artist_id
+
+    def _track_artists(self, release_ids, track_base, artist_ids):
+        rng = self._random('track_artists')
+        track_id = track_base
+        for release_id in release_ids:
+            for _ in range(self._track_count(release_id)):
+                track_id += 1
+                if rng.random() < FEATURED_TRACK_SHARE:
+                    yield track_id, self._pick_artist(rng, artist_ids)
+
+    def _release_genres(self, release_ids, genre_ids):
+        rng = self._random('release_genres')
+        for release_id in release_ids:
+            for genre_id in rng.sample(genre_ids, min(len(genre_ids), rng.randint(1, 2))):
+                yield release_id, genre_id
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетическая коллекция для замеров")
+    parser.add_argument('scale', help="число носителей: 10k, 100k, 1M, 10M или число")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', default=DB_CONFIG['database'])
+    parser.add_argument('--replace', action='store_true', help="сначала очистить таблицы коллекции")
+    args = parser.parse_args(argv)
+
+    db = Database({**DB_CONFIG, 'database': args.database})
+    if not db.pool:
+        print("Не удалось подключиться к базе данных", file=sys.stderr)
+        return 1
+
+    def progress(table, rows):
+        print(f"\r{table}: {rows}", end='', file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        counts = DataGenerator(db, args.seed, progress).generate(parse_scale(args.scale), args.replace)
+    finally:
+        db.close()
+
+    print(file=sys.stderr)
+    for table, rows in counts.items():
+        print(f"{table:20} {rows:10d}")
+    print(f"Время: {time.perf_counter() - started:.1f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
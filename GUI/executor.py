@@ -0,0 +1,207 @@
+# executor.py
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extensions import QueryCanceledError
+
+from config import DB_WORKERS, SEARCH_DEBOUNCE_MS
+from database import CancelToken
+
+
+class Task:
+    """Фоновая операция, которую можно отменить.
+    description - название для индикатора занятости, progress - последнее
+    сообщение о ходе выполнения (DbExecutor.report)."""
+
+    def __init__(self, token, description=None):
+        self.future = None
+        self.token = token
+        self.description = description
+        self.progress = None
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def cancel(self):
+        """Снять задачу из очереди или прервать ее запрос на сервере"""
+        self.future.cancel()
+        self.token.cancel()
+
+
+class DbExecutor:
+    """Выполнение работы с БД в пуле потоков с возвратом результата в поток Tk.
+
+    Колбэки on_done/on_error вызываются в главном потоке через root.after;
+    результаты отмененных задач отбрасываются. Задачи с описанием считаются
+    операциями пользователя: их список передается обработчикам
+    subscribe_activity() при каждом изменении, и их можно отменить разом
+    через cancel_active().
+    """
+
+    def __init__(self, root, db, max_workers=DB_WORKERS, poll_interval=50):
+        self.root = root
+        self.db = db
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='db')
+        self._results = queue.Queue()
+        self._calls = queue.Queue()
+        self._local = threading.local()
+        self._active = []
+        self._activity_handlers = []
+        self._after_id = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, description=None):
+        task = Task(CancelToken(), description)
+
+        def run():
+            self._local.task = task
+            try:
+                with self.db.cancellable(task.token):
+                    return fn(*args)
+            finally:
+                self._local.task = None
+
+        task.future = self._pool.submit(run)
+        if description:
+            self._active.append(task)
+            self._notify_activity()
+        task.future.add_done_callback(lambda f: self._results.put((task, on_done, on_error)))
+        return task
+
+    def report(self, progress):
+        """Сообщить о ходе текущей задачи (вызывается из самой задачи)"""
+        task = getattr(self._local, 'task', None)
+        if task is not None:
+            self.call_soon(self._set_progress, task, progress)
+
+    def stream(self, chunks, on_chunk, max_pending=4):
+        """Передавать части chunks в on_chunk(часть) в потоке Tk по мере
+        получения (вызывается из самой задачи). В очереди не больше
+        max_pending частей: задача ждет, пока поток Tk их выведет.
+        Останавливается при отмене задачи; части отмененной не выводятся."""
+        task = self._local.task
+        pending = threading.Semaphore(max_pending)
+
+        def deliver(chunk):
+            pending.release()
+            if not task.cancelled:
+                on_chunk(chunk)
+
+        for chunk in chunks:
+            while not pending.acquire(timeout=self.poll_interval / 1000):
+                if task.cancelled:
+                    return
+            if task.cancelled:
+                return
+            self.call_soon(deliver, chunk)
+
+    def subscribe_activity(self, handler):
+        """Вызывать handler(задачи) при изменении списка операций пользователя"""
+        self._activity_handlers.append(handler)
+
+    @property
+    def active(self):
+        return list(self._active)
+
+    def cancel_active(self):
+        """Отменить все операции пользователя"""
+        tasks, self._active = self._active, []
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self._notify_activity()
+
+    def _set_progress(self, task, progress):
+        task.progress = progress
+        if task in self._active:
+            self._notify_activity()
+
+    def _notify_activity(self):
+        tasks = self.active
+        for handler in self._activity_handlers:
+            handler(tasks)
+
+    def call_soon(self, fn, *args):
+        """Выполнить fn(*args) в потоке Tk (можно вызывать из фоновой задачи)"""
+        self._calls.put((fn, args))
+
+    def _poll(self):
+        # Следующий опрос планируется сразу: колбэк может открыть модальное
+        # окно или упасть, а результаты должны приниматься дальше
+        self._after_id = self.root.after(self.poll_interval, self._poll)
+        while True:
+            try:
+                fn, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            fn(*args)
+        while True:
+            try:
+                task, on_done, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if task in self._active:
+                self._active.remove(task)
+                self._notify_activity()
+            if task.cancelled or task.future.cancelled():
+                continue
+            error = task.future.exception()
+            if error is None:
+                if on_done:
+                    on_done(task.future.result())
+            elif on_error:
+                on_error(error)
+
+    def shutdown(self):
+        self.root.after_cancel(self._after_id)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class DebouncedSearch:
+    """Поиск с задержкой после ввода.
+
+    Запрос выполняется в фоне; при новом вводе предыдущий запрос отменяется
+    на сервере, а его запоздавший результат отбрасывается.
+    """
+
+    def __init__(self, root, executor, query, on_result, on_error=None, delay=SEARCH_DEBOUNCE_MS):
+        self.root = root
+        self.executor = executor
+        self.query = query
+        self.on_result = on_result
+        self.on_error = on_error
+        self.delay = delay
+        self._after_id = None
+        self._task = None
+        self._generation = 0
+
+    def schedule(self, term):
+        """Запустить поиск term после паузы ввода"""
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+        self._after_id = self.root.after(self.delay, lambda: self.run(term))
+
+    def run(self, term):
+        """Запустить поиск немедленно"""
+        self._after_id = None
+        if self._task:
+            self._task.cancel()
+
+        self._generation += 1
+        generation = self._generation
+        self._task = self.executor.submit(
+            self.query, term,
+            on_done=lambda result: self._deliver(generation, term, result),
+            on_error=lambda error: self._fail(generation, error))
+
+    def _deliver(self, generation, term, result):
+        if generation == self._generation:
+            self.on_result(term, result)
+
+    def _fail(self, generation, error):
+        if generation != self._generation or isinstance(error, QueryCanceledError):
+            return
+        if self.on_error:
+            self.on_error(error)
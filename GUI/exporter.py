@@ -0,0 +1,242 @@
+# exporter.py
+"""Экспорт коллекции потоком COPY ... TO STDOUT прямо в файл.
+
+Данные не проходят построчно через Python: сервер отдает готовый поток
+CSV/JSON, который пишется в файл, при необходимости через gzip или zstd.
+
+Форматы:
+    csv   - список носителей (как в таблице коллекции), можно импортировать обратно
+    jsonl - тот же список, один JSON-объект на строку
+    dump  - все таблицы в формате COPY, загружается через psql
+
+Запуск из командной строки:
+    python exporter.py аудиотека.csv.gz [--format csv] [--compression gzip]
+"""
+import argparse
+import gzip
+import sys
+from datetime import datetime
+
+from psycopg2 import sql
+
+from database import Database
+from importer import ARTIST_SEPARATOR
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ('csv', 'jsonl', 'dump')
+
+# Таблицы полного дампа в порядке внешних ключей
+DUMP_TABLES = [
+    'media_types', 'genres', 'artists', 'releases', 'tracks',
+    'media_items', 'vinyl_attributes',
+    'release_artists', 'track_artists', 'release_genres',
+]
+
+# Колонки списка носителей: (колонка запроса, заголовок CSV).
+# Заголовки совпадают с прежним экспортом, их понимает importer.
+MEDIA_ITEMS_COLUMNS = [
+    ('media_item_id', 'ID'),
+    ('catalog_number', 'Каталожный номер'),
+    ('album_title', 'Альбом'),
+    ('artist_name', 'Исполнитель'),
+    ('format', 'Формат'),
+    ('condition', 'Состояние'),
+    ('purchase_price', 'Цена (₽)'),
+    ('purchase_date', 'Дата покупки'),
+    ('storage_location', 'Место хранения'),
+]
+
+# Уведомлять о прогрессе не чаще, чем раз на столько байт
+PROGRESS_STEP = 1 << 20
+
+
+def detect_format(path):
+    """Формат и сжатие по имени файла: 'x.jsonl.gz' -> ('jsonl', 'gzip')"""
+    name = path.lower()
+    compression = None
+    if name.endswith('.gz'):
+        compression, name = 'gzip', name[:-3]
+    elif name.endswith('.zst'):
+        compression, name = 'zstd', name[:-4]
+
+    if name.endswith('.jsonl') or name.endswith('.json'):
+        return 'jsonl', compression
+    if name.endswith('.sql'):
+        return 'dump', compression
+    return 'csv', compression
+
+
+def _open(path, compression):
+    if compression == 'gzip':
+        # Уровень 6 - компромисс: сжатие не должно быть медленнее диска
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Для сжатия zstd установите пакет zstandard")
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'))
+    if compression is None:
+        return open(path, 'wb')
+    raise ValueError(f"Неизвестное сжатие: {compression}")
+
+
+class _ProgressWriter:
+    """Обертка файла, считающая записанные байты"""
+
+    def __init__(self, f, progress, stage):
+        self.f = f
+        self.progress = progress
+        self.stage = stage
+        self.written = 0
+        self._reported = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.written += len(data)
+        if self.progress and self.written - self._reported >= PROGRESS_STEP:
+            self._reported = self.written
+            self.progress(self.stage, self.written)
+
+    def finish(self):
+        if self.progress:
+            self.progress(self.stage, self.written)
+
+
+class CollectionExporter:
+    """Экспорт данных через COPY TO STDOUT.
+
+    progress(stage, bytes) вызывается из потока экспорта: stage - имя
+    выгружаемой таблицы, bytes - сколько байт данных записано всего.
+    """
+
+    def __init__(self, db, progress=None):
+        self.db = db
+        self.progress = progress
+
+    def export(self, path, fmt=None, compression=None):
+        """Экспорт в файл; формат и сжатие по умолчанию - по имени файла.
+        Возвращает число записанных байт (до сжатия)."""
+        detected_format, detected_compression = detect_format(path)
+        fmt = fmt or detected_format
+        compression = compression or detected_compression
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}")
+
+        with _open(path, compression) as f:
+            if fmt == 'dump':
+                return self._dump(f)
+            return self._media_items(f, fmt)
+
+    def _media_items_copy(self, fmt):
+        # Артисты через разделитель, который понимает импорт
+        query, params, key_count = self.db._media_items_query(artists_separator=ARTIST_SEPARATOR)
+        order = ', '.join(f"q.sort_key_{i}" for i in range(key_count))
+        if fmt == 'csv':
+            columns = sql.SQL(', ').join(
+                sql.SQL("q.{} AS {}").format(sql.Identifier(column), sql.Identifier(header))
+                for column, header in MEDIA_ITEMS_COLUMNS)
+            return sql.SQL("""
+                COPY (SELECT {columns} FROM ({query}) AS q ORDER BY {order})
+                TO STDOUT WITH (FORMAT csv, HEADER true, DELIMITER ';')
+            """).format(columns=columns, query=sql.SQL(query), order=sql.SQL(order)), params
+
+        # В текстовом формате COPY удвоил бы обратные слэши JSON, поэтому
+        # CSV с кавычкой и разделителем, которых в JSON не бывает
+        columns = sql.SQL(', ').join(
+            sql.SQL("q.{}").format(sql.Identifier(column)) for column, _ in MEDIA_ITEMS_COLUMNS)
+        return sql.SQL("""
+            COPY (SELECT row_to_json(j)::text
+                  FROM (SELECT {columns} FROM ({query}) AS q ORDER BY {order}) AS j)
+            TO STDOUT WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')
+        """).format(columns=columns, query=sql.SQL(query), order=sql.SQL(order)), params
+
+    def _media_items(self, f, fmt):
+        copy, params = self._media_items_copy(fmt)
+        out = _ProgressWriter(f, self.progress, 'media_items')
+        if fmt == 'csv':
+            # BOM, чтобы Excel открывал файл в UTF-8
+            out.write('\ufeff'.encode('utf-8'))
+
+        with self.db.cursor() as cursor:
+            cursor.copy_expert(cursor.mogrify(copy, params), out)
+        out.finish()
+        return out.written
+
+    def _dump(self, f):
+        """Все таблицы в одном согласованном снимке"""
+        written = 0
+        with self.db.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            f.write((
+                f"-- Дамп домашней аудиотеки от {datetime.now():%d.%m.%Y %H:%M}\n"
+                f"-- Загрузка: psql -1 -f <файл> в базу с той же схемой\n"
+                f"SET client_encoding = '{cursor.connection.encoding}';\n\n"
+            ).encode('utf-8'))
+
+            for table in DUMP_TABLES:
+                cursor.execute("""
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = %s
+                    ORDER BY ordinal_position
+                """, (table,))
+                columns = sql.SQL(', ').join(sql.Identifier(row[0]) for row in cursor.fetchall())
+                header = sql.SQL("COPY {} ({}) FROM stdin;\n").format(sql.Identifier(table), columns)
+
+                out = _ProgressWriter(f, self.progress, table)
+                out.written = written
+                out.write(header.as_string(cursor).encode('utf-8'))
+                cursor.copy_expert(
+                    sql.SQL("COPY {} ({}) TO STDOUT").format(sql.Identifier(table), columns), out)
+                out.write(b"\\.\n\n")
+                out.finish()
+                written = out.written
+
+            # Счетчики SERIAL продолжаются после загруженных строк
+            cursor.execute("""
+                SELECT c.table_name, c.column_name
+                FROM information_schema.columns c
+                WHERE c.table_schema = current_schema() AND c.table_name = ANY(%s)
+                  AND pg_get_serial_sequence(quote_ident(c.table_name), c.column_name) IS NOT NULL
+                ORDER BY c.table_name
+            """, (DUMP_TABLES,))
+            for table, column in cursor.fetchall():
+                f.write(sql.SQL(
+                    "SELECT setval(pg_get_serial_sequence({table}, {column}), "
+                    "COALESCE((SELECT MAX({id}) FROM {ident}), 0) + 1, false);\n"
+                ).format(
+                    table=sql.Literal(table), column=sql.Literal(column),
+                    id=sql.Identifier(column), ident=sql.Identifier(table),
+                ).as_string(cursor).encode('utf-8'))
+
+        return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Экспорт коллекции")
+    parser.add_argument('path', help="файл; формат и сжатие определяются по расширению")
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('--compression', choices=('gzip', 'zstd'))
+    args = parser.parse_args(argv)
+
+    db = Database()
+    if not db.pool:
+        print("Не удалось подключиться к базе данных", file=sys.stderr)
+        return 1
+
+    def progress(stage, written):
+        print(f"\r{stage}: {written / (1 << 20):.1f} МБ", end='', file=sys.stderr)
+
+    try:
+        written = CollectionExporter(db, progress).export(args.path, args.format, args.compression)
+    finally:
+        db.close()
+
+    print(f"\nЗаписано {written / (1 << 20):.1f} МБ в {args.path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
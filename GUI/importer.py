@@ -0,0 +1,345 @@
+# importer.py
+"""Массовый импорт коллекции из CSV.
+
+Файл потоком загружается через COPY FROM STDIN во временную таблицу,
+затем проверка, сопоставление артистов, релизов и типов носителей по
+названию и слияние в основные таблицы выполняются набором SQL-запросов
+в одной транзакции.
+
+Запуск из командной строки:
+    python importer.py коллекция.csv [--delimiter ";"] [--dry-run]
+"""
+import argparse
+import sys
+
+from psycopg2 import sql
+
+from database import Database
+
+# Разделитель артистов в колонке artists (так же их пишет экспорт)
+ARTIST_SEPARATOR = '|'
+
+# Колонки файла -> колонки промежуточной таблицы.
+# Понимаются английские имена и заголовки полного экспорта приложения.
+COLUMN_ALIASES = {
+    'catalog_number': 'catalog_number',
+    'release_title': 'release_title',
+    'artists': 'artists',
+    'media_type': 'media_type',
+    'condition': 'condition',
+    'purchase_price': 'purchase_price',
+    'purchase_date': 'purchase_date',
+    'storage_location': 'storage_location',
+    'notes': 'notes',
+    'release_year': 'release_year',
+    'label': 'label',
+    'country': 'country',
+    'Каталожный номер': 'catalog_number',
+    'Альбом': 'release_title',
+    'Исполнитель': 'artists',
+    'Формат': 'media_type',
+    'Состояние': 'condition',
+    'Цена (₽)': 'purchase_price',
+    'Дата покупки': 'purchase_date',
+    'Место хранения': 'storage_location',
+    'Примечания': 'notes',
+}
+
+STAGING_COLUMNS = [
+    'catalog_number', 'release_title', 'artists', 'media_type', 'condition',
+    'purchase_price', 'purchase_date', 'storage_location', 'notes',
+    'release_year', 'label', 'country',
+]
+
+# Ограничения длины полей по схеме
+MAX_LENGTHS = {
+    'catalog_number': 100,
+    'release_title': 255,
+    'condition': 30,
+    'storage_location': 255,
+    'label': 100,
+    'country': 50,
+}
+
+# Причина отказа записи, чей каталожный номер занят при вставке
+DUPLICATE_CATALOG_NUMBER = "повтор каталожного номера"
+
+# Проверки строк: (причина отказа, условие отказа).
+# Выполняются по порядку, строка получает первую сработавшую причину.
+VALIDATIONS = [
+    ("нет каталожного номера", "catalog_number IS NULL"),
+    ("нет названия релиза", "release_title IS NULL"),
+    ("слишком длинное значение", " OR ".join(
+        f"length({column}) > {limit}" for column, limit in MAX_LENGTHS.items())),
+    ("слишком длинное имя артиста", """EXISTS (
+        SELECT 1 FROM unnest(string_to_array(artists, %(separator)s)) AS artist_name
+        WHERE length(trim(artist_name)) > 255)"""),
+    ("неизвестный тип носителя", "media_type_id IS NULL"),
+    ("неверная цена", "purchase_price IS NOT NULL AND price IS NULL"),
+    ("неверная дата покупки", "purchase_date IS NOT NULL AND purchase_day IS NULL"),
+    ("неверный год релиза", """release_year IS NOT NULL AND (year IS NULL
+        OR year NOT BETWEEN 1900 AND EXTRACT(YEAR FROM CURRENT_DATE) + 1)"""),
+    ("повтор каталожного номера в файле", """line_no IN (
+        SELECT line_no FROM (
+            SELECT line_no, row_number() OVER (PARTITION BY catalog_number ORDER BY line_no) AS n
+            FROM import_staging WHERE reject_reason IS NULL
+        ) numbered WHERE n > 1)"""),
+    ("носитель уже есть в коллекции", """EXISTS (
+        SELECT 1 FROM media_items mi WHERE mi.catalog_number = import_staging.catalog_number)"""),
+]
+
+
+def _read_header(path, delimiter):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        header = f.readline().rstrip('\r\n')
+    if delimiter is None:
+        delimiter = ';' if header.count(';') >= header.count(',') else ','
+    names = [name.strip().strip('"') for name in header.split(delimiter)]
+    return names, delimiter
+
+
+class CollectionImporter:
+    """Импорт CSV через COPY и промежуточную таблицу"""
+
+    def __init__(self, db, delimiter=None, artist_separator=ARTIST_SEPARATOR, max_rejects=1000):
+        self.db = db
+        self.delimiter = delimiter
+        self.artist_separator = artist_separator
+        self.max_rejects = max_rejects
+
+    def import_file(self, path, dry_run=False):
+        """Импортировать файл. Возвращает словарь с итогами:
+        total, accepted, rejected, new_artists, new_releases и
+        rejects - список (номер записи, каталожный номер, причина).
+        Номер записи считается без заголовка; запись с переводами строк
+        внутри поля занимает в файле несколько строк."""
+        names, delimiter = _read_header(path, self.delimiter)
+        file_columns = []
+        for i, name in enumerate(names):
+            column = COLUMN_ALIASES.get(name)
+            if column is None or column in file_columns:
+                column = f"ignored_{i}"
+            file_columns.append(column)
+
+        if 'catalog_number' not in file_columns or 'release_title' not in file_columns:
+            raise ValueError("В файле нет колонок catalog_number и release_title")
+
+        result = {}
+        with self.db.cursor() as cursor:
+            self._create_staging(cursor, file_columns)
+
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                cursor.copy_expert(sql.SQL(
+                    "COPY import_staging ({}) FROM STDIN WITH (FORMAT csv, HEADER true, DELIMITER {})"
+                ).format(
+                    sql.SQL(', ').join(map(sql.Identifier, file_columns)),
+                    sql.Literal(delimiter),
+                ), f)
+
+            cursor.execute("ANALYZE import_staging")
+            self._prepare(cursor)
+            self._validate(cursor)
+            result['new_artists'] = self._merge_artists(cursor)
+            result['new_releases'] = self._merge_releases(cursor)
+            result['accepted'] = self._merge_media_items(cursor)
+            result.update(self._summary(cursor))
+            result['rejected'] = result['total'] - result['accepted']
+
+            if dry_run:
+                cursor.connection.rollback()
+
+        return result
+
+    def _create_staging(self, cursor, file_columns):
+        extra = [column for column in file_columns if column not in STAGING_COLUMNS]
+        cursor.execute(sql.SQL("""
+            CREATE TEMP TABLE import_staging (
+                -- Номер записи файла: COPY вставляет записи по порядку
+                line_no BIGSERIAL PRIMARY KEY,
+                {columns},
+                price NUMERIC(10, 2),
+                purchase_day DATE,
+                year INTEGER,
+                media_type_id INTEGER,
+                release_id INTEGER,
+                reject_reason TEXT
+            ) ON COMMIT DROP
+        """).format(columns=sql.SQL(', ').join(
+            sql.SQL("{} TEXT").format(sql.Identifier(column))
+            for column in STAGING_COLUMNS + extra)))
+
+    def _prepare(self, cursor):
+        """Очистка значений и приведение типов"""
+        cursor.execute(sql.SQL("UPDATE import_staging SET {}").format(sql.SQL(', ').join(
+            sql.SQL("{0} = NULLIF(trim({0}), '')").format(sql.Identifier(column))
+            for column in STAGING_COLUMNS)))
+
+        # Пробелы - разделители разрядов ("1 200")
+        cursor.execute(r"""
+            UPDATE import_staging
+            SET price = replace(replace(purchase_price, ' ', ''), ',', '.')::NUMERIC
+            WHERE replace(purchase_price, ' ', '') ~ '^\d{1,8}([.,]\d{1,2})?$'
+        """)
+
+        cursor.execute(r"""
+            UPDATE import_staging SET year = release_year::INTEGER
+            WHERE release_year ~ '^\d{4}$'
+        """)
+
+        # Даты ДД.ММ.ГГГГ приводятся к ГГГГ-ММ-ДД; несуществующие дни (31.02)
+        # отбрасываются: день строится от первого числа месяца и сверяется месяц
+        cursor.execute(r"""
+            UPDATE import_staging
+            SET purchase_date = regexp_replace(purchase_date, '^(\d{2})\.(\d{2})\.(\d{4})$', '\3-\2-\1')
+            WHERE purchase_date ~ '^\d{2}\.\d{2}\.\d{4}$'
+        """)
+
+        day = """make_date(left(purchase_date, 4)::INTEGER, substr(purchase_date, 6, 2)::INTEGER, 1)
+                 + (right(purchase_date, 2)::INTEGER - 1)"""
+        cursor.execute(rf"""
+            UPDATE import_staging
+            SET purchase_day = {day}
+            WHERE purchase_date ~ '^\d{{4}}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$'
+              AND left(purchase_date, 4) <> '0000'
+              AND EXTRACT(MONTH FROM {day}) = substr(purchase_date, 6, 2)::INTEGER
+        """)
+
+        cursor.execute("""
+            UPDATE import_staging s
+            SET media_type_id = mt.media_type_id
+            FROM media_types mt
+            WHERE lower(mt.type_name) = lower(s.media_type)
+        """)
+
+        # Статистика после UPDATE, чтобы дальнейшие соединения планировались верно
+        cursor.execute("ANALYZE import_staging")
+
+    def _validate(self, cursor):
+        for reason, condition in VALIDATIONS:
+            cursor.execute(
+                f"UPDATE import_staging SET reject_reason = %(reason)s "
+                f"WHERE reject_reason IS NULL AND ({condition})",
+                {'reason': reason, 'separator': self.artist_separator})
+
+    def _merge_artists(self, cursor):
+        cursor.execute("""
+            INSERT INTO artists (name)
+            SELECT DISTINCT trim(artist_name)
+            FROM import_staging s,
+                 unnest(string_to_array(s.artists, %s)) AS artist_name
+            WHERE s.reject_reason IS NULL AND trim(artist_name) <> ''
+            ON CONFLICT (name) DO NOTHING
+        """, (self.artist_separator,))
+        return cursor.rowcount
+
+    def _resolve_releases(self, cursor):
+        # Релиз ищется по названию без учета регистра и, если указан, по году
+        cursor.execute("""
+            UPDATE import_staging s
+            SET release_id = found.release_id
+            FROM (
+                SELECT s2.line_no, MIN(r.release_id) AS release_id
+                FROM import_staging s2
+                JOIN releases r ON lower(r.title) = lower(s2.release_title)
+                               AND (s2.year IS NULL OR r.release_year = s2.year)
+                WHERE s2.reject_reason IS NULL AND s2.release_id IS NULL
+                GROUP BY s2.line_no
+            ) found
+            WHERE s.line_no = found.line_no
+        """)
+
+    def _merge_releases(self, cursor):
+        self._resolve_releases(cursor)
+        cursor.execute("""
+            INSERT INTO releases (title, release_year, label, country)
+            SELECT DISTINCT ON (lower(release_title), year)
+                   release_title, year, label, country
+            FROM import_staging
+            WHERE reject_reason IS NULL AND release_id IS NULL
+            ORDER BY lower(release_title), year, line_no
+        """)
+        new_releases = cursor.rowcount
+        if new_releases:
+            self._resolve_releases(cursor)
+
+        cursor.execute("""
+            INSERT INTO release_artists (release_id, artist_id)
+            SELECT DISTINCT s.release_id, a.artist_id
+            FROM import_staging s,
+                 unnest(string_to_array(s.artists, %s)) AS artist_name
+            JOIN artists a ON a.name = trim(artist_name)
+            WHERE s.reject_reason IS NULL
+            ON CONFLICT DO NOTHING
+        """, (self.artist_separator,))
+        return new_releases
+
+    def _merge_media_items(self, cursor):
+        # Номер, занятый после проверки (другим клиентом), пропускается
+        # ON CONFLICT; такая запись отклоняется как повтор
+        cursor.execute("""
+            WITH inserted AS (
+                INSERT INTO media_items (
+                    catalog_number, media_type_id, release_id,
+                    condition, purchase_price, purchase_date,
+                    storage_location, notes
+                )
+                SELECT catalog_number, media_type_id, release_id,
+                       condition, price, purchase_day,
+                       storage_location, notes
+                FROM import_staging
+                WHERE reject_reason IS NULL
+                ORDER BY line_no
+                ON CONFLICT (catalog_number) DO NOTHING
+                RETURNING catalog_number
+            )
+            UPDATE import_staging s
+            SET reject_reason = %s
+            WHERE s.reject_reason IS NULL
+              AND NOT EXISTS (SELECT 1 FROM inserted i WHERE i.catalog_number = s.catalog_number)
+        """, (DUPLICATE_CATALOG_NUMBER,))
+        cursor.execute("SELECT COUNT(*) FROM import_staging WHERE reject_reason IS NULL")
+        return cursor.fetchone()[0]
+
+    def _summary(self, cursor):
+        cursor.execute("SELECT COUNT(*) FROM import_staging")
+        total = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT line_no, catalog_number, reject_reason
+            FROM import_staging
+            WHERE reject_reason IS NOT NULL
+            ORDER BY line_no
+            LIMIT %s
+        """, (self.max_rejects,))
+        return {'total': total, 'rejects': cursor.fetchall()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт коллекции из CSV")
+    parser.add_argument('path', help="CSV-файл с заголовком")
+    parser.add_argument('--delimiter', help="разделитель полей (по умолчанию определяется по заголовку)")
+    parser.add_argument('--artist-separator', default=ARTIST_SEPARATOR, help="разделитель артистов в колонке artists")
+    parser.add_argument('--dry-run', action='store_true', help="проверить файл без сохранения")
+    args = parser.parse_args(argv)
+
+    db = Database()
+    if not db.pool:
+        print("Не удалось подключиться к базе данных", file=sys.stderr)
+        return 1
+
+    try:
+        importer = CollectionImporter(db, args.delimiter, args.artist_separator)
+        result = importer.import_file(args.path, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    print(f"Строк в файле: {result['total']}")
+    print(f"Принято: {result['accepted']}")
+    print(f"Отклонено: {result['rejected']}")
+    print(f"Новых артистов: {result['new_artists']}, новых релизов: {result['new_releases']}")
+    for record, catalog_number, reason in result['rejects']:
+        print(f"  запись {record}: {catalog_number or '—'} - {reason}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
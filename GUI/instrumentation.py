@@ -0,0 +1,371 @@
+# instrumentation.py
+"""Замеры выполнения SQL-запросов.
+
+Соединения пула создают курсоры InstrumentedCursor (cursor_factory):
+каждый execute, executemany и COPY учитывается в QueryMetrics под текстом
+запроса без значений параметров - вызовы, ошибки, гистограмма времени,
+строки, отправленные и полученные байты. Полученные байты оцениваются по
+выбранным строкам; у серверных курсоров учитывается только открытие.
+
+Для запросов дольше порога slow_ms на курсорах, помеченных как читающие
+(mark_read_only - так делает Database._read), план EXPLAIN (ANALYZE,
+BUFFERS) пишется в журнал медленных запросов с ротацией. План снимается
+на том же соединении сразу после запроса (запрос выполняется повторно),
+поэтому для одного запроса - не чаще раза в explain_interval секунд.
+Текст запроса не разбирается: SELECT функции с побочным эффектом
+(блокировки, setval) повторять нельзя, и читающим запрос объявляет только
+вызывающий.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import cursor as _cursor, STATUS_IN_TRANSACTION
+
+# Верхние границы корзин гистограммы времени, мс; последняя корзина - все, что дольше
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# Запросы сверх этого числа различных текстов учитываются вместе
+OTHER_QUERIES = "(прочие запросы)"
+
+_WHITESPACE = re.compile(r"\s+")
+# Литералы в тексте запроса (execute_values и запросы без параметров)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+_VALUES_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+
+_slow_logs = {}
+_slow_logs_lock = threading.Lock()
+
+
+def normalize(query, literal=False):
+    """Текст запроса для учета: пробелы схлопнуты; с literal=True значения,
+    подставленные прямо в текст, заменены на '?', а списки VALUES - на одну строку"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    text = _WHITESPACE.sub(' ', str(query)).strip()
+    if literal:
+        text = _VALUES_LIST.sub(r"\1, ...", _LITERALS.sub('?', text))
+    return text
+
+
+def _row_bytes(row):
+    size = 0
+    for value in row:
+        if value is None:
+            continue
+        if isinstance(value, str):
+            size += len(value.encode('utf-8'))
+        elif isinstance(value, (bytes, memoryview)):
+            size += len(value)
+        else:
+            size += 8
+    return size
+
+
+def estimate_bytes(rows, sample=100):
+    """Оценка объема строк по первым sample строкам"""
+    if not rows:
+        return 0
+    head = rows[:sample]
+    return sum(_row_bytes(row) for row in head) * len(rows) // len(head)
+
+
+def _slow_log(path, max_bytes, backups):
+    """Журнал медленных запросов (один обработчик на файл)"""
+    with _slow_logs_lock:
+        logger = _slow_logs.get(path)
+        if logger is None:
+            logger = logging.getLogger(f"audiotech.slow_queries.{len(_slow_logs)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                          encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            _slow_logs[path] = logger
+        return logger
+
+
+class QueryStats:
+    """Накопленные замеры одного запроса"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.slow = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+        self.rows = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.explained_at = None
+
+    def add(self, elapsed_ms, rows, sent, error):
+        self.calls += 1
+        self.errors += error
+        self.total_ms += elapsed_ms
+        self.min_ms = elapsed_ms if self.min_ms is None else min(self.min_ms, elapsed_ms)
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows or 0
+        self.bytes_sent += sent
+        self.buckets[bisect_left(HISTOGRAM_BOUNDS_MS, elapsed_ms)] += 1
+
+    def percentile(self, q):
+        """Оценка перцентиля по гистограмме: верхняя граница корзины"""
+        if not self.calls:
+            return 0.0
+        threshold = q * self.calls
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BOUNDS_MS, self.buckets):
+            seen += count
+            if seen >= threshold:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'slow': self.slow,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'min_ms': round(self.min_ms or 0.0, 3),
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': round(self.percentile(0.5), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'rows': self.rows,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            # [верхняя граница корзины, мс (None - больше последней), число вызовов]
+            'histogram': [[bound, count] for bound, count
+                          in zip(HISTOGRAM_BOUNDS_MS + (None,), self.buckets)],
+        }
+
+
+class QueryMetrics:
+    """Метрики запросов одного экземпляра Database.
+    resolve(запрос) возвращает текст для учета вместо служебного
+    (например, исходный запрос для EXECUTE подготовленного оператора) или None."""
+
+    def __init__(self, slow_ms=500, explain=True, explain_interval=300, log_path='slow_queries.log',
+                 log_max_bytes=5 * 1024 * 1024, log_backups=3, max_queries=500, resolve=None):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        self.max_queries = max_queries
+        self.resolve = resolve
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._labels = {}
+        self._started = datetime.now()
+        # Курсор, записывающий замеры именно в эти метрики
+        self.cursor_factory = type('InstrumentedCursor', (InstrumentedCursor,), {'metrics': self})
+
+    def label(self, query, literal=False):
+        """Текст, под которым учитывается запрос"""
+        label = self._labels.get(query)
+        if label is None:
+            resolved = self.resolve(query) if self.resolve and isinstance(query, str) else None
+            label = normalize(resolved or query, literal and not resolved)
+            # Тексты с литералами почти не повторяются - их не запоминаем
+            if not literal and len(self._labels) < self.max_queries * 2:
+                self._labels[query] = label
+        return label
+
+    def _stats(self, label):
+        stats = self._queries.get(label)
+        if stats is None:
+            if len(self._queries) >= self.max_queries:
+                label = OTHER_QUERIES
+                stats = self._queries.get(label)
+            if stats is None:
+                stats = self._queries[label] = QueryStats()
+        return stats
+
+    def record(self, label, elapsed_ms, rows=None, sent=0, error=False):
+        """Учесть вызов; возвращает True, если нужно снять план медленного запроса"""
+        with self._lock:
+            stats = self._stats(label)
+            stats.add(elapsed_ms, rows, sent, error)
+            if error or elapsed_ms < self.slow_ms:
+                return False
+            stats.slow += 1
+            if not self.explain:
+                return False
+            now = time.monotonic()
+            if stats.explained_at is not None and now - stats.explained_at < self.explain_interval:
+                return False
+            stats.explained_at = now
+            return True
+
+    def add_received(self, label, size):
+        with self._lock:
+            self._stats(label).bytes_received += size
+
+    def log_slow(self, label, elapsed_ms, rows, statement, plan):
+        if not self.log_path:
+            return
+        _slow_log(self.log_path, self.log_max_bytes, self.log_backups).info(
+            "%.1f мс, строк: %s\n%s\n-- выполнено:\n%s\n-- план:\n%s\n",
+            elapsed_ms, rows if rows is not None else '—', label, statement, plan)
+
+    def snapshot(self):
+        """Метрики всех запросов, по убыванию суммарного времени"""
+        with self._lock:
+            queries = [{'query': label, **stats.snapshot()} for label, stats in self._queries.items()]
+        queries.sort(key=lambda query: query['total_ms'], reverse=True)
+        return {
+            'since': self._started.isoformat(timespec='seconds'),
+            'slow_ms': self.slow_ms,
+            'slow_log': self.log_path,
+            'queries': queries,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._started = datetime.now()
+
+
+class _CountingFile:
+    """Файл COPY, считающий прошедшие через него байты"""
+
+    def __init__(self, file):
+        self.file = file
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.size += len(data.encode('utf-8') if isinstance(data, str) else data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.file.readline(size)
+        self.size += len(data.encode('utf-8') if isinstance(data, str) else data)
+        return data
+
+    def write(self, data):
+        self.size += len(data.encode('utf-8') if isinstance(data, str) else data)
+        return self.file.write(data)
+
+
+def mark_read_only(cursor):
+    """Объявить запросы курсора читающими (см. InstrumentedCursor.read_only);
+    курсоры без замеров не меняются"""
+    if isinstance(cursor, InstrumentedCursor):
+        cursor.read_only = True
+    return cursor
+
+
+class InstrumentedCursor(_cursor):
+    """Курсор, записывающий замеры каждого запроса в metrics
+    (подкласс с конкретными метриками создает QueryMetrics)"""
+
+    metrics = None
+    _label = None
+    # Запросы курсора только читают данные: для медленных можно снять план
+    read_only = False
+
+    def _text(self, query):
+        # Запросы, собранные через psycopg2.sql, учитываются по их тексту
+        return query.as_string(self) if isinstance(query, sql.Composable) else query
+
+    def _run(self, query, literal, call):
+        label = self.metrics.label(query, literal)
+        started = time.perf_counter()
+        try:
+            result = call()
+        except Exception:
+            self.metrics.record(label, (time.perf_counter() - started) * 1000,
+                                sent=len(self.query or b''), error=True)
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rows = self.rowcount if self.rowcount >= 0 else None
+        self._label = label
+        return label, elapsed_ms, rows, result
+
+    def execute(self, query, vars=None):
+        query = self._text(query)
+        label, elapsed_ms, rows, result = self._run(
+            query, vars is None, lambda: super(InstrumentedCursor, self).execute(query, vars))
+        if self.metrics.record(label, elapsed_ms, rows, len(self.query or b'')) and self._plannable():
+            self._log_plan(label, elapsed_ms, rows, self.query)
+        return result
+
+    def executemany(self, query, vars_list):
+        query = self._text(query)
+        label, elapsed_ms, rows, result = self._run(
+            query, False, lambda: super(InstrumentedCursor, self).executemany(query, vars_list))
+        self.metrics.record(label, elapsed_ms, rows, len(self.query or b''))
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        sql = self._text(sql)
+        counting = _CountingFile(file)
+        label, elapsed_ms, rows, result = self._run(
+            sql, False, lambda: super(InstrumentedCursor, self).copy_expert(sql, counting, size))
+        self.metrics.record(label, elapsed_ms, rows, len(sql))
+        self.metrics.add_received(label, counting.size)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None and self._label is not None:
+            self.metrics.add_received(self._label, _row_bytes(row))
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._label is not None:
+            self.metrics.add_received(self._label, estimate_bytes(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._label is not None:
+            self.metrics.add_received(self._label, estimate_bytes(rows))
+        return rows
+
+    def _plannable(self):
+        # Серверный курсор только открыт; повторять можно только то, что
+        # вызывающий объявил читающим
+        return self.read_only and self.name is None
+
+    def _log_plan(self, label, elapsed_ms, rows, statement):
+        """Снять план только что выполненного запроса в точке сохранения,
+        чтобы ошибка плана не прервала транзакцию вызывающего"""
+        conn = self.connection
+        savepoint = conn.status == STATUS_IN_TRANSACTION
+        statement = statement.decode('utf-8', 'replace') if isinstance(statement, bytes) else statement
+        with conn.cursor(cursor_factory=_cursor) as cursor:
+            try:
+                if savepoint:
+                    cursor.execute("SAVEPOINT query_plan")
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT query_plan")
+            except psycopg2.Error as e:
+                plan = f"План не получен: {e}"
+                if savepoint and not conn.closed:
+                    try:
+                        cursor.execute("ROLLBACK TO SAVEPOINT query_plan")
+                    except psycopg2.Error:
+                        pass
+        self.metrics.log_slow(label, elapsed_ms, rows, statement, plan)
@@ -0,0 +1,563 @@
+# migrations.py
+# Миграции схемы БД. Применяются по порядку, каждая в своей транзакции;
+# примененные отмечаются в таблице schema_migrations.
+from psycopg2.extensions import cursor as _plain_cursor
+
+# Ключ advisory-блокировки, чтобы несколько клиентов не мигрировали одновременно
+MIGRATION_LOCK_ID = 7301
+
+MIGRATIONS = [
+    ('001_search_trgm_indexes', """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+        -- Триграммные индексы для поиска по подстроке (ILIKE '%...%')
+        CREATE INDEX IF NOT EXISTS idx_media_items_catalog_number_trgm
+            ON media_items USING gin (catalog_number gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_releases_title_trgm
+            ON releases USING gin (title gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_artists_name_trgm
+            ON artists USING gin (name gin_trgm_ops);
+
+        -- Индексы для соединений от найденных строк к носителям
+        CREATE INDEX IF NOT EXISTS idx_media_items_release_id
+            ON media_items (release_id);
+        CREATE INDEX IF NOT EXISTS idx_media_items_media_type_id
+            ON media_items (media_type_id);
+        CREATE INDEX IF NOT EXISTS idx_release_artists_artist_id
+            ON release_artists (artist_id);
+    """),
+    ('002_collection_stats_summary', """
+        -- Сводные таблицы статистики, поддерживаемые триггерами
+        CREATE TABLE stats_by_format (
+            media_type_id INTEGER PRIMARY KEY,
+            items_count BIGINT NOT NULL DEFAULT 0,
+            total_value NUMERIC(16, 2) NOT NULL DEFAULT 0
+        );
+
+        -- NULL и пустое состояние различаются, как в GROUP BY
+        CREATE TABLE stats_by_condition (
+            condition VARCHAR(30) NOT NULL,
+            condition_is_null BOOLEAN NOT NULL,
+            items_count BIGINT NOT NULL DEFAULT 0,
+            total_value NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (condition, condition_is_null)
+        );
+
+        CREATE TABLE stats_by_year (
+            year INTEGER PRIMARY KEY,
+            items_count BIGINT NOT NULL DEFAULT 0,
+            total_value NUMERIC(16, 2) NOT NULL DEFAULT 0
+        );
+
+        -- Счетчики для числа различных релизов и артистов
+        CREATE TABLE stats_release_items (
+            release_id INTEGER PRIMARY KEY,
+            items_count BIGINT NOT NULL
+        );
+
+        CREATE TABLE stats_artist_links (
+            artist_id INTEGER PRIMARY KEY,
+            links_count BIGINT NOT NULL
+        );
+
+        CREATE TABLE stats_totals (
+            id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+            items_count BIGINT NOT NULL DEFAULT 0,
+            total_value NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            releases_count BIGINT NOT NULL DEFAULT 0,
+            artists_count BIGINT NOT NULL DEFAULT 0
+        );
+
+        -- Учесть носитель в сводках со знаком p_sign (+1 / -1)
+        CREATE FUNCTION stats_apply_item(
+            p_media_type_id INTEGER, p_condition VARCHAR, p_purchase_date DATE,
+            p_price NUMERIC, p_release_id INTEGER, p_sign INTEGER
+        ) RETURNS void LANGUAGE plpgsql AS $$
+        DECLARE
+            v_value NUMERIC := p_sign * COALESCE(p_price, 0);
+            v_release_items BIGINT;
+        BEGIN
+            INSERT INTO stats_by_format AS s (media_type_id, items_count, total_value)
+            VALUES (p_media_type_id, p_sign, v_value)
+            ON CONFLICT (media_type_id) DO UPDATE
+                SET items_count = s.items_count + EXCLUDED.items_count,
+                    total_value = s.total_value + EXCLUDED.total_value;
+
+            INSERT INTO stats_by_condition AS s (condition, condition_is_null, items_count, total_value)
+            VALUES (COALESCE(p_condition, ''), p_condition IS NULL, p_sign, v_value)
+            ON CONFLICT (condition, condition_is_null) DO UPDATE
+                SET items_count = s.items_count + EXCLUDED.items_count,
+                    total_value = s.total_value + EXCLUDED.total_value;
+
+            IF p_purchase_date IS NOT NULL THEN
+                INSERT INTO stats_by_year AS s (year, items_count, total_value)
+                VALUES (EXTRACT(YEAR FROM p_purchase_date)::INTEGER, p_sign, v_value)
+                ON CONFLICT (year) DO UPDATE
+                    SET items_count = s.items_count + EXCLUDED.items_count,
+                        total_value = s.total_value + EXCLUDED.total_value;
+            END IF;
+
+            INSERT INTO stats_release_items AS s (release_id, items_count)
+            VALUES (p_release_id, p_sign)
+            ON CONFLICT (release_id) DO UPDATE
+                SET items_count = s.items_count + EXCLUDED.items_count
+            RETURNING s.items_count INTO v_release_items;
+
+            IF v_release_items = 0 THEN
+                DELETE FROM stats_release_items WHERE release_id = p_release_id;
+            END IF;
+
+            UPDATE stats_totals
+            SET items_count = items_count + p_sign,
+                total_value = total_value + v_value,
+                releases_count = releases_count + CASE
+                    WHEN p_sign > 0 AND v_release_items = 1 THEN 1
+                    WHEN p_sign < 0 AND v_release_items = 0 THEN -1
+                    ELSE 0
+                END;
+        END;
+        $$;
+
+        -- Учесть связь релиза с артистом со знаком p_sign
+        CREATE FUNCTION stats_apply_artist_link(p_artist_id INTEGER, p_sign INTEGER)
+        RETURNS void LANGUAGE plpgsql AS $$
+        DECLARE
+            v_links BIGINT;
+        BEGIN
+            INSERT INTO stats_artist_links AS s (artist_id, links_count)
+            VALUES (p_artist_id, p_sign)
+            ON CONFLICT (artist_id) DO UPDATE
+                SET links_count = s.links_count + EXCLUDED.links_count
+            RETURNING s.links_count INTO v_links;
+
+            IF v_links = 0 THEN
+                DELETE FROM stats_artist_links WHERE artist_id = p_artist_id;
+            END IF;
+
+            UPDATE stats_totals
+            SET artists_count = artists_count + CASE
+                WHEN p_sign > 0 AND v_links = 1 THEN 1
+                WHEN p_sign < 0 AND v_links = 0 THEN -1
+                ELSE 0
+            END;
+        END;
+        $$;
+
+        CREATE FUNCTION stats_media_items_change() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM stats_apply_item(OLD.media_type_id, OLD.condition, OLD.purchase_date,
+                                         OLD.purchase_price, OLD.release_id, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM stats_apply_item(NEW.media_type_id, NEW.condition, NEW.purchase_date,
+                                         NEW.purchase_price, NEW.release_id, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE FUNCTION stats_release_artists_change() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM stats_apply_artist_link(OLD.artist_id, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM stats_apply_artist_link(NEW.artist_id, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        -- Полный пересчет сводок (начальное заполнение и TRUNCATE)
+        CREATE FUNCTION stats_rebuild() RETURNS void LANGUAGE plpgsql AS $$
+        BEGIN
+            DELETE FROM stats_by_format;
+            DELETE FROM stats_by_condition;
+            DELETE FROM stats_by_year;
+            DELETE FROM stats_release_items;
+            DELETE FROM stats_artist_links;
+            DELETE FROM stats_totals;
+
+            INSERT INTO stats_by_format (media_type_id, items_count, total_value)
+            SELECT media_type_id, COUNT(*), COALESCE(SUM(purchase_price), 0)
+            FROM media_items GROUP BY media_type_id;
+
+            INSERT INTO stats_by_condition (condition, condition_is_null, items_count, total_value)
+            SELECT COALESCE(condition, ''), condition IS NULL, COUNT(*), COALESCE(SUM(purchase_price), 0)
+            FROM media_items GROUP BY 1, 2;
+
+            INSERT INTO stats_by_year (year, items_count, total_value)
+            SELECT EXTRACT(YEAR FROM purchase_date)::INTEGER, COUNT(*), COALESCE(SUM(purchase_price), 0)
+            FROM media_items WHERE purchase_date IS NOT NULL GROUP BY 1;
+
+            INSERT INTO stats_release_items (release_id, items_count)
+            SELECT release_id, COUNT(*) FROM media_items GROUP BY release_id;
+
+            INSERT INTO stats_artist_links (artist_id, links_count)
+            SELECT artist_id, COUNT(*) FROM release_artists GROUP BY artist_id;
+
+            INSERT INTO stats_totals (items_count, total_value, releases_count, artists_count)
+            SELECT (SELECT COUNT(*) FROM media_items),
+                   (SELECT COALESCE(SUM(purchase_price), 0) FROM media_items),
+                   (SELECT COUNT(*) FROM stats_release_items),
+                   (SELECT COUNT(*) FROM stats_artist_links);
+        END;
+        $$;
+
+        CREATE FUNCTION stats_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM stats_rebuild();
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER trg_media_items_stats
+            AFTER INSERT OR DELETE OR UPDATE OF media_type_id, condition, purchase_date, purchase_price, release_id
+            ON media_items
+            FOR EACH ROW EXECUTE FUNCTION stats_media_items_change();
+
+        CREATE TRIGGER trg_release_artists_stats
+            AFTER INSERT OR DELETE OR UPDATE OF artist_id
+            ON release_artists
+            FOR EACH ROW EXECUTE FUNCTION stats_release_artists_change();
+
+        -- Удаление релиза каскадно удаляет носители и связи, и их строковые
+        -- триггеры обновляют сводки; TRUNCATE строковые триггеры не вызывает
+        CREATE TRIGGER trg_media_items_stats_truncate
+            AFTER TRUNCATE ON media_items
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_truncate();
+        CREATE TRIGGER trg_release_artists_stats_truncate
+            AFTER TRUNCATE ON release_artists
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_truncate();
+        CREATE TRIGGER trg_releases_stats_truncate
+            AFTER TRUNCATE ON releases
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_truncate();
+
+        SELECT stats_rebuild();
+    """),
+    ('003_stats_statement_triggers', """
+        -- Строковые триггеры сводок обновляют одну строку stats_totals на каждую
+        -- строку: массовая вставка в одной транзакции накапливает версии этой
+        -- строки и замедляется квадратично. Заменяем их триггерами уровня
+        -- оператора, которые применяют агрегированную разницу один раз.
+        DROP TRIGGER trg_media_items_stats ON media_items;
+        DROP TRIGGER trg_release_artists_stats ON release_artists;
+        DROP FUNCTION stats_media_items_change();
+        DROP FUNCTION stats_release_artists_change();
+        DROP FUNCTION stats_apply_item(INTEGER, VARCHAR, DATE, NUMERIC, INTEGER, INTEGER);
+        DROP FUNCTION stats_apply_artist_link(INTEGER, INTEGER);
+
+        -- Изменения оператора как строки со знаком: new_rows (+1), old_rows (-1)
+        CREATE FUNCTION stats_delta_sql(p_op TEXT) RETURNS TEXT LANGUAGE sql IMMUTABLE AS $$
+            SELECT CASE p_op
+                WHEN 'INSERT' THEN 'SELECT n.*, 1 AS sign FROM new_rows n'
+                WHEN 'DELETE' THEN 'SELECT o.*, -1 AS sign FROM old_rows o'
+                ELSE 'SELECT n.*, 1 AS sign FROM new_rows n UNION ALL SELECT o.*, -1 FROM old_rows o'
+            END
+        $$;
+
+        CREATE FUNCTION stats_media_items_statement() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            v_delta TEXT := stats_delta_sql(TG_OP);
+            v_releases BIGINT;
+        BEGIN
+            EXECUTE format($q$
+                INSERT INTO stats_by_format AS s (media_type_id, items_count, total_value)
+                SELECT media_type_id, SUM(sign), SUM(sign * COALESCE(purchase_price, 0))
+                FROM (%s) d GROUP BY media_type_id
+                HAVING SUM(sign) <> 0 OR SUM(sign * COALESCE(purchase_price, 0)) <> 0
+                ON CONFLICT (media_type_id) DO UPDATE
+                    SET items_count = s.items_count + EXCLUDED.items_count,
+                        total_value = s.total_value + EXCLUDED.total_value
+            $q$, v_delta);
+
+            EXECUTE format($q$
+                INSERT INTO stats_by_condition AS s (condition, condition_is_null, items_count, total_value)
+                SELECT COALESCE(condition, ''), condition IS NULL,
+                       SUM(sign), SUM(sign * COALESCE(purchase_price, 0))
+                FROM (%s) d GROUP BY 1, 2
+                HAVING SUM(sign) <> 0 OR SUM(sign * COALESCE(purchase_price, 0)) <> 0
+                ON CONFLICT (condition, condition_is_null) DO UPDATE
+                    SET items_count = s.items_count + EXCLUDED.items_count,
+                        total_value = s.total_value + EXCLUDED.total_value
+            $q$, v_delta);
+
+            EXECUTE format($q$
+                INSERT INTO stats_by_year AS s (year, items_count, total_value)
+                SELECT EXTRACT(YEAR FROM purchase_date)::INTEGER,
+                       SUM(sign), SUM(sign * COALESCE(purchase_price, 0))
+                FROM (%s) d WHERE purchase_date IS NOT NULL GROUP BY 1
+                HAVING SUM(sign) <> 0 OR SUM(sign * COALESCE(purchase_price, 0)) <> 0
+                ON CONFLICT (year) DO UPDATE
+                    SET items_count = s.items_count + EXCLUDED.items_count,
+                        total_value = s.total_value + EXCLUDED.total_value
+            $q$, v_delta);
+
+            -- Релиз появляется в коллекции, когда счетчик был 0 (новое значение
+            -- равно приросту), и исчезает, когда счетчик обнулился
+            EXECUTE format($q$
+                WITH d AS (
+                    SELECT release_id, SUM(sign) AS change
+                    FROM (%s) d GROUP BY release_id HAVING SUM(sign) <> 0
+                ), up AS (
+                    INSERT INTO stats_release_items AS s (release_id, items_count)
+                    SELECT release_id, change FROM d
+                    ON CONFLICT (release_id) DO UPDATE
+                        SET items_count = s.items_count + EXCLUDED.items_count
+                    RETURNING s.release_id, s.items_count
+                )
+                SELECT COALESCE(SUM(CASE
+                    WHEN up.items_count = 0 THEN -1
+                    WHEN up.items_count = d.change THEN 1
+                    ELSE 0
+                END), 0)
+                FROM up JOIN d USING (release_id)
+            $q$, v_delta) INTO v_releases;
+
+            EXECUTE format($q$
+                DELETE FROM stats_release_items
+                WHERE items_count = 0
+                  AND release_id IN (SELECT release_id FROM (%s) d)
+            $q$, v_delta);
+
+            EXECUTE format($q$
+                UPDATE stats_totals t
+                SET items_count = t.items_count + d.items_count,
+                    total_value = t.total_value + d.total_value,
+                    releases_count = t.releases_count + $1
+                FROM (SELECT COALESCE(SUM(sign), 0) AS items_count,
+                             COALESCE(SUM(sign * COALESCE(purchase_price, 0)), 0) AS total_value
+                      FROM (%s) d) d
+            $q$, v_delta) USING v_releases;
+
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE FUNCTION stats_release_artists_statement() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            v_artists BIGINT;
+        BEGIN
+            EXECUTE format($q$
+                WITH d AS (
+                    SELECT artist_id, SUM(sign) AS change
+                    FROM (%s) d GROUP BY artist_id HAVING SUM(sign) <> 0
+                ), up AS (
+                    INSERT INTO stats_artist_links AS s (artist_id, links_count)
+                    SELECT artist_id, change FROM d
+                    ON CONFLICT (artist_id) DO UPDATE
+                        SET links_count = s.links_count + EXCLUDED.links_count
+                    RETURNING s.artist_id, s.links_count
+                )
+                SELECT COALESCE(SUM(CASE
+                    WHEN up.links_count = 0 THEN -1
+                    WHEN up.links_count = d.change THEN 1
+                    ELSE 0
+                END), 0)
+                FROM up JOIN d USING (artist_id)
+            $q$, stats_delta_sql(TG_OP)) INTO v_artists;
+
+            IF v_artists IS DISTINCT FROM 0 THEN
+                UPDATE stats_totals SET artists_count = artists_count + v_artists;
+            END IF;
+
+            EXECUTE format($q$
+                DELETE FROM stats_artist_links
+                WHERE links_count = 0
+                  AND artist_id IN (SELECT artist_id FROM (%s) d)
+            $q$, stats_delta_sql(TG_OP));
+
+            RETURN NULL;
+        END;
+        $$;
+
+        -- Триггеры с таблицами переходов допускают только одно событие
+        CREATE TRIGGER trg_media_items_stats_insert
+            AFTER INSERT ON media_items REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_media_items_statement();
+        CREATE TRIGGER trg_media_items_stats_update
+            AFTER UPDATE ON media_items REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_media_items_statement();
+        CREATE TRIGGER trg_media_items_stats_delete
+            AFTER DELETE ON media_items REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_media_items_statement();
+
+        CREATE TRIGGER trg_release_artists_stats_insert
+            AFTER INSERT ON release_artists REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_release_artists_statement();
+        CREATE TRIGGER trg_release_artists_stats_update
+            AFTER UPDATE ON release_artists REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_release_artists_statement();
+        CREATE TRIGGER trg_release_artists_stats_delete
+            AFTER DELETE ON release_artists REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION stats_release_artists_statement();
+    """),
+    ('004_reference_notify', """
+        -- Уведомления об изменении справочных таблиц для сброса кэшей клиентов.
+        -- Одинаковые уведомления в транзакции PostgreSQL объединяет в одно.
+        CREATE FUNCTION notify_reference_change() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('audiotech_reference', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER trg_media_types_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON media_types
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+        CREATE TRIGGER trg_genres_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON genres
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+        CREATE TRIGGER trg_artists_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON artists
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+        CREATE TRIGGER trg_releases_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON releases
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+    """),
+    ('005_change_feed', """
+        -- Лента изменений для клиентов: одно уведомление на оператор
+        -- {"table": ..., "op": ..., "ids": [...]} с id измененных строк
+        -- (колонка id - аргумент триггера). Если список не помещается
+        -- в уведомление или таблица очищена, ids = null: изменено все.
+        CREATE FUNCTION notify_row_changes() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            v_ids INTEGER[];
+            v_payload TEXT;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                EXECUTE format('SELECT array_agg(DISTINCT %I) FROM new_rows', TG_ARGV[0]) INTO v_ids;
+            ELSIF TG_OP = 'DELETE' THEN
+                EXECUTE format('SELECT array_agg(DISTINCT %I) FROM old_rows', TG_ARGV[0]) INTO v_ids;
+            ELSIF TG_OP = 'UPDATE' THEN
+                EXECUTE format('SELECT array_agg(id) FROM (SELECT %1$I AS id FROM new_rows
+                                UNION SELECT %1$I FROM old_rows) ids', TG_ARGV[0]) INTO v_ids;
+            END IF;
+
+            IF TG_OP <> 'TRUNCATE' AND v_ids IS NULL THEN
+                RETURN NULL;
+            END IF;
+
+            v_payload := json_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'ids', v_ids)::text;
+            -- Предел размера уведомления - 8000 байт
+            IF octet_length(v_payload) > 7900 THEN
+                v_payload := json_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'ids', NULL)::text;
+            END IF;
+            PERFORM pg_notify('audiotech_changes', v_payload);
+            RETURN NULL;
+        END;
+        $$;
+
+        -- release_artists передает id релиза: удаление артиста каскадно
+        -- удаляет связи, и по ним клиент находит затронутые релизы и носители
+        DO $$
+        DECLARE
+            v_table TEXT;
+            v_id TEXT;
+        BEGIN
+            FOR v_table, v_id IN VALUES ('media_items', 'media_item_id'), ('artists', 'artist_id'),
+                                        ('releases', 'release_id'), ('release_artists', 'release_id')
+            LOOP
+                EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows
+                                FOR EACH STATEMENT EXECUTE FUNCTION notify_row_changes(%L)',
+                               'trg_' || v_table || '_changes_insert', v_table, v_id);
+                EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I
+                                REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+                                FOR EACH STATEMENT EXECUTE FUNCTION notify_row_changes(%L)',
+                               'trg_' || v_table || '_changes_update', v_table, v_id);
+                EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows
+                                FOR EACH STATEMENT EXECUTE FUNCTION notify_row_changes(%L)',
+                               'trg_' || v_table || '_changes_delete', v_table, v_id);
+                EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I
+                                FOR EACH STATEMENT EXECUTE FUNCTION notify_row_changes(%L)',
+                               'trg_' || v_table || '_changes_truncate', v_table, v_id);
+            END LOOP;
+        END;
+        $$;
+    """),
+    ('006_report_views', """
+        -- Отчеты по артистам и форматам читаются из материализованных
+        -- представлений. Уникальные индексы нужны для REFRESH ... CONCURRENTLY,
+        -- который не блокирует ни чтение отчетов, ни запись в таблицы.
+        CREATE MATERIALIZED VIEW mv_artist_report AS
+        SELECT
+            a.artist_id,
+            a.name,
+            COUNT(DISTINCT ra.release_id) AS releases_count,
+            COUNT(mi.media_item_id) AS items_count,
+            SUM(mi.purchase_price) AS total_value
+        FROM artists a
+        LEFT JOIN release_artists ra ON a.artist_id = ra.artist_id
+        LEFT JOIN media_items mi ON ra.release_id = mi.release_id
+        GROUP BY a.artist_id, a.name;
+
+        CREATE UNIQUE INDEX idx_mv_artist_report_artist_id ON mv_artist_report (artist_id);
+
+        CREATE MATERIALIZED VIEW mv_format_report AS
+        SELECT
+            mt.media_type_id,
+            mt.type_name,
+            COUNT(mi.media_item_id) AS items_count,
+            AVG(mi.purchase_price) AS avg_price,
+            SUM(mi.purchase_price) AS total_value,
+            MIN(mi.purchase_date) AS first_purchase,
+            MAX(mi.purchase_date) AS last_purchase
+        FROM media_types mt
+        LEFT JOIN media_items mi ON mt.media_type_id = mi.media_type_id
+        GROUP BY mt.media_type_id, mt.type_name;
+
+        CREATE UNIQUE INDEX idx_mv_format_report_media_type_id ON mv_format_report (media_type_id);
+
+        -- Время, на которое актуальны данные представлений
+        CREATE TABLE report_view_refreshes (
+            view_name VARCHAR(63) PRIMARY KEY,
+            refreshed_at TIMESTAMPTZ NOT NULL
+        );
+        INSERT INTO report_view_refreshes (view_name, refreshed_at)
+        VALUES ('mv_artist_report', now()), ('mv_format_report', now());
+    """),
+    ('007_report_view_notify', """
+        -- Версия данных отчетов считается клиентами по уведомлениям об
+        -- изменении таблиц; обновление представлений отчетов тоже меняет
+        -- их данные
+        CREATE TRIGGER trg_report_view_refreshes_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON report_view_refreshes
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+    """),
+]
+
+
+def migrate(conn):
+    """Применить непримененные миграции. Возвращает имена примененных."""
+    applied_now = []
+    # Обычный курсор, без замеров: запросы миграций (блокировка, DDL) не
+    # должны повторяться ради плана медленного запроса
+    with conn.cursor(cursor_factory=_plain_cursor) as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    name VARCHAR(100) PRIMARY KEY,
+                    applied_at TIMESTAMP NOT NULL DEFAULT now()
+                )
+            """)
+            cursor.execute("SELECT name FROM schema_migrations")
+            applied = {row[0] for row in cursor.fetchall()}
+            conn.commit()
+
+            for name, sql in MIGRATIONS:
+                if name in applied:
+                    continue
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+                conn.commit()
+                applied_now.append(name)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+
+    return applied_now
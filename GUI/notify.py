@@ -0,0 +1,120 @@
+# notify.py
+import json
+import select
+import threading
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2 import sql
+
+# Канал ленты изменений строк (триггеры notify_row_changes)
+CHANGES_CHANNEL = 'audiotech_changes'
+
+
+def parse_change(payload):
+    """Уведомление ленты изменений -> (таблица, операция, множество id или None).
+    None вместо id означает, что изменена вся таблица."""
+    change = json.loads(payload)
+    ids = change.get('ids')
+    return change['table'], change['op'], None if ids is None else set(ids)
+
+
+class NotifyListener:
+    """Прием уведомлений PostgreSQL (LISTEN/NOTIFY) в фоновом потоке.
+
+    Слушает на отдельном соединении (не из пула). Обработчики
+    handler(payload) вызываются в потоке слушателя. При обрыве соединение
+    восстанавливается; уведомления за время обрыва теряются, поэтому после
+    переподключения вызываются обработчики on_reconnect.
+    """
+
+    def __init__(self, params, on_reconnect=None, poll_timeout=1.0, retry_interval=5.0):
+        self.params = params
+        self._reconnect_handlers = [on_reconnect] if on_reconnect else []
+        self.poll_timeout = poll_timeout
+        self.retry_interval = retry_interval
+        self._handlers = {}
+        self._listening = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Слушатель подключен и подписан: изменения будут получены;
+        # connections - число таких подключений (растет до connected)
+        self.connected = False
+        self.connections = 0
+
+    def subscribe(self, channel, handler):
+        """Вызывать handler(payload) на уведомления канала channel"""
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(handler)
+
+    def subscribe_reconnect(self, handler):
+        """Вызывать handler() после восстановления соединения"""
+        with self._lock:
+            self._reconnect_handlers.append(handler)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='db-notify', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout if timeout is not None else self.poll_timeout * 2)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        first_attempt = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.params)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                self._listening = set()
+                self._listen_new(conn)
+                self.connections += 1
+                self.connected = True
+                # Все, что изменилось до подписки, могло быть пропущено
+                if not first_attempt:
+                    with self._lock:
+                        handlers = list(self._reconnect_handlers)
+                    for handler in handlers:
+                        handler()
+
+                while not self._stop.is_set():
+                    self._listen_new(conn)
+                    if select.select([conn], [], [], self.poll_timeout)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            notify = conn.notifies.pop(0)
+                            self._dispatch(notify.channel, notify.payload)
+            except psycopg2.Error as e:
+                print(f"Ошибка приема уведомлений: {e}")
+                self._stop.wait(self.retry_interval)
+            finally:
+                self.connected = False
+                first_attempt = False
+                if conn is not None:
+                    conn.close()
+
+    def _listen_new(self, conn):
+        with self._lock:
+            channels = [channel for channel in self._handlers if channel not in self._listening]
+        for channel in channels:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+            self._listening.add(channel)
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            handlers = list(self._handlers.get(channel, ()))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"Ошибка обработки уведомления {channel}: {e}")
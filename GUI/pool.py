@@ -0,0 +1,179 @@
+# pool.py
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений с проверкой живости и переподключением"""
+
+    def __init__(self, params, min_size=1, max_size=10, timeout=30, health_check_interval=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Неверные размеры пула соединений")
+
+        self.params = params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # (соединение, время последнего использования)
+        self._in_use = set()
+        self._size = 0  # открытые соединения, включая открываемые прямо сейчас
+        self._closed = False
+
+        # Метрики
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+
+        try:
+            for _ in range(min_size):
+                self._idle.append((self._open(), time.monotonic()))
+                self._size += 1
+        except Exception:
+            # Пул не создан: уже открытые соединения не должны остаться висеть
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._idle = []
+            self._size = 0
+            self._closed = True
+            raise
+
+    def _open(self):
+        return psycopg2.connect(**self.params)
+
+    def _is_alive(self, conn, last_used):
+        """Проверка соединения перед выдачей"""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout=None):
+        """Взять соединение из пула, при необходимости дождавшись освобождения"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Пул соединений закрыт")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolError(f"Нет свободных соединений в пуле ({self.max_size}) за {timeout} с")
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self._waits += 1
+
+        # Открытие и проверка соединения выполняются вне блокировки
+        reconnected = False
+        try:
+            if conn is None:
+                conn = self._open()
+            elif not self._is_alive(conn, last_used):
+                self._close_quietly(conn)
+                conn = self._open()
+                reconnected = True
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._in_use.add(conn)
+            self._checkouts += 1
+            self._reconnects += reconnected
+            self._checkout_time_total += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+        return conn
+
+    def putconn(self, conn, broken=False):
+        """Вернуть соединение в пул; сломанные соединения закрываются"""
+        broken = broken or bool(conn.closed)
+        if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        with self._cond:
+            self._in_use.discard(conn)
+            if broken or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if broken or self._closed:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """Соединение на время одной операции"""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        """Метрики пула"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects,
+                'avg_checkout_ms': (self._checkout_time_total / self._checkouts * 1000) if self._checkouts else 0.0,
+                'max_checkout_ms': self._checkout_time_max * 1000,
+            }
+
+    def close(self):
+        """Закрыть все соединения пула"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
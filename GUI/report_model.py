@@ -0,0 +1,312 @@
+# report_model.py
+"""Модель отчета и его выгрузка в текст, CSV, JSON и XLSX.
+
+Отчет (Report) - заголовок, сводные значения и таблицы (ReportTable) с
+типизированными колонками (Column). Строки таблиц - кортежи значений из
+базы (str, int, Decimal, date), NULL остается None. Текст - только один из
+способов вывода: CSV, JSON и XLSX пишутся прямо из строк, без
+форматирования в текст и разбора обратно.
+
+Строки таблицы могут быть итератором (серверным курсором): тогда отчет
+выводится один раз, по мере чтения, а итоговая строка считается по пути.
+"""
+import csv
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+except ImportError:
+    openpyxl = None
+
+# Числовые форматы ячеек XLSX по типу колонки
+_XLSX_FORMATS = {
+    'int': '0',
+    'money': '#,##0.00',
+    'percent': '0.0"%"',
+    'date': 'DD.MM.YYYY',
+}
+
+
+class Column:
+    """Колонка отчета (или сводное значение).
+    name - ключ в JSON, title - заголовок; kind - тип значений: text, int,
+    money, percent или date; width - ширина в тексте; default - текст вместо
+    NULL; total - итог колонки: 'sum' или ('ratio', i, j) - итог колонки i,
+    деленный на итог колонки j."""
+
+    def __init__(self, name, title, kind='text', width=12, default=None, total=None):
+        self.name = name
+        self.title = title
+        self.kind = kind
+        self.width = width
+        self.default = default
+        self.total = total
+
+    def format(self, value):
+        """Значение для текстового отчета"""
+        if value is None:
+            return self.default if self.default is not None else "—"
+        if self.kind == 'int':
+            return f"{int(value):d}"
+        if self.kind == 'money':
+            return f"{value:.2f} ₽"
+        if self.kind == 'percent':
+            return f"{value:.1f}%"
+        if self.kind == 'date':
+            return value.strftime("%d.%m.%Y")
+        return str(value)
+
+
+class ReportTable:
+    """Таблица отчета: колонки и строки (кортежи в порядке колонок).
+    totals_label - подпись итоговой строки (итоги по Column.total), empty -
+    текст вместо пустой таблицы."""
+
+    def __init__(self, columns, rows, title=None, totals_label=None, empty=None):
+        self.columns = columns
+        self.rows = rows
+        self.title = title
+        self.totals_label = totals_label
+        self.empty = empty
+        self._sums = [0] * len(columns)
+
+    def __iter__(self):
+        """Строки таблицы; по пути заново считаются итоги"""
+        self._sums = [0] * len(self.columns)
+        summed = [i for i, column in enumerate(self.columns) if column.total]
+        for row in self.rows:
+            for i in summed:
+                if row[i] is not None:
+                    self._sums[i] += row[i]
+            yield row
+
+    def totals(self):
+        """Итоговая строка (после чтения всех строк) или None"""
+        if self.totals_label is None:
+            return None
+        row = [None] * len(self.columns)
+        for i, column in enumerate(self.columns):
+            if column.total == 'sum':
+                row[i] = self._sums[i]
+            elif column.total:
+                _, numerator, denominator = column.total
+                row[i] = self._sums[numerator] / self._sums[denominator] if self._sums[denominator] else 0
+        row[0] = self.totals_label
+        return tuple(row)
+
+
+class Report:
+    """Отчет: заголовок, сводные значения [(Column, значение)] и таблицы.
+    from_view - данные из материализованного представления на момент
+    refreshed_at (None - еще не обновлялось)."""
+
+    def __init__(self, title, tables=(), summary=(), refreshed_at=None, from_view=False):
+        self.title = title
+        self.tables = tables
+        self.summary = summary
+        self.refreshed_at = refreshed_at
+        self.from_view = from_view
+
+
+# ===== Текст =====
+def _text_cells(columns, texts):
+    cells = [text.ljust(column.width) if column.kind in ('text', 'date') else text.rjust(column.width)
+             for column, text in zip(columns, texts)]
+    return " ".join(cells).rstrip() + "\n"
+
+
+def _text_row(columns, values):
+    return _text_cells(columns, [column.format(value) for column, value in zip(columns, values)])
+
+
+def _text_totals(columns, totals):
+    # Первая ячейка итоговой строки - подпись, а не значение колонки
+    return _text_cells(columns, [totals[0]] + [column.format(value)
+                                               for column, value in zip(columns[1:], totals[1:])])
+
+
+def text_lines(report):
+    """Строки текстового отчета (с переводом строки), по мере чтения таблиц"""
+    yield "=" * 60 + "\n"
+    yield report.title + "\n"
+    if report.from_view:
+        if report.refreshed_at is None:
+            yield "Данные еще не обновлялись\n"
+        else:
+            yield f"Данные на: {report.refreshed_at.astimezone().strftime('%d.%m.%Y %H:%M:%S')}\n"
+    yield "=" * 60 + "\n"
+
+    if report.summary:
+        yield "\n"
+        for column, value in report.summary:
+            yield f"{column.title}: {column.format(value)}\n"
+
+    for table in report.tables:
+        yield "\n"
+        if table.title:
+            yield f"{table.title}:\n"
+        rule = "-" * (sum(column.width for column in table.columns) + len(table.columns) - 1) + "\n"
+        # Шапка выводится с первой строкой: у пустой таблицы может быть свой текст
+        head = [_text_cells(table.columns, [column.title for column in table.columns]), rule]
+        for row in table:
+            if head:
+                yield from head
+                head = None
+            yield _text_row(table.columns, row)
+        if head:
+            if table.empty:
+                yield table.empty + "\n"
+                continue
+            yield from head
+        totals = table.totals()
+        if totals is not None:
+            yield rule
+            yield _text_totals(table.columns, totals)
+
+
+def write_text(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(text_lines(report))
+
+
+# ===== Табличные форматы =====
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def write_csv(report, f):
+    """Отчет в CSV (разделитель ';'): сводные значения, затем таблицы с
+    заголовками колонок; таблицы разделены пустой строкой"""
+    writer = csv.writer(f, delimiter=';')
+    for column, value in report.summary:
+        writer.writerow([column.title, _csv_value(value)])
+    for number, table in enumerate(report.tables):
+        if number or report.summary:
+            writer.writerow([])
+        if table.title:
+            writer.writerow([table.title])
+        writer.writerow([column.title for column in table.columns])
+        writer.writerows([_csv_value(value) for value in row] for row in table)
+        totals = table.totals()
+        if totals is not None:
+            writer.writerow([_csv_value(value) for value in totals])
+
+
+def write_json(report, f):
+    """Отчет в JSON; строки таблиц - объекты по именам колонок.
+    Пишется по мере чтения строк, без сборки всего документа в памяти."""
+    head = {
+        'title': report.title,
+        'refreshed_at': _json_value(report.refreshed_at),
+        'summary': {column.name: _json_value(value) for column, value in report.summary},
+    }
+    f.write(json.dumps(head, ensure_ascii=False)[:-1] + ', "tables": [')
+    for number, table in enumerate(report.tables):
+        names = [column.name for column in table.columns]
+        columns = [{'name': column.name, 'title': column.title, 'kind': column.kind}
+                   for column in table.columns]
+        f.write((", " if number else "") + json.dumps(
+            {'title': table.title, 'columns': columns}, ensure_ascii=False)[:-1] + ', "rows": [')
+        for index, row in enumerate(table):
+            f.write(("," if index else "") + "\n" + json.dumps(
+                {name: _json_value(value) for name, value in zip(names, row)}, ensure_ascii=False))
+        totals = table.totals()
+        totals = None if totals is None else {name: _json_value(value) for name, value in zip(names, totals)}
+        f.write('], "totals": ' + json.dumps(totals, ensure_ascii=False) + '}')
+    f.write(']}\n')
+
+
+def write_xlsx(report, path):
+    """Отчет в XLSX: каждая таблица на своем листе, сводные значения - на
+    листе «Сводка». Книга пишется потоком (write_only)."""
+    if openpyxl is None:
+        raise RuntimeError("Для выгрузки в XLSX установите пакет openpyxl")
+    workbook = openpyxl.Workbook(write_only=True)
+
+    def cell(sheet, column, value):
+        value = value.replace(tzinfo=None) if isinstance(value, datetime) else value
+        result = WriteOnlyCell(sheet, value=value)
+        if column is not None and column.kind in _XLSX_FORMATS and not isinstance(value, str):
+            result.number_format = _XLSX_FORMATS[column.kind]
+        return result
+
+    titles = set()
+
+    def sheet_title(title):
+        # Имя листа: до 31 символа, без []:*?/\ и уникальное
+        base = ''.join('_' if char in '[]:*?/\\' else char for char in title)[:31] or "Лист"
+        name, number = base, 1
+        while name.lower() in titles:
+            number += 1
+            name = f"{base[:31 - len(str(number)) - 1]} {number}"
+        titles.add(name.lower())
+        return name
+
+    if report.summary:
+        sheet = workbook.create_sheet(sheet_title("Сводка"))
+        sheet.append([report.title])
+        if report.refreshed_at is not None:
+            sheet.append(["Данные на", cell(sheet, None, report.refreshed_at)])
+        for column, value in report.summary:
+            sheet.append([column.title, cell(sheet, column, value)])
+
+    for table in report.tables:
+        sheet = workbook.create_sheet(sheet_title(table.title or report.title))
+        for index, column in enumerate(table.columns):
+            sheet.column_dimensions[get_column_letter(index + 1)].width = column.width + 2
+        sheet.append([column.title for column in table.columns])
+        for row in table:
+            sheet.append([cell(sheet, column, value) for column, value in zip(table.columns, row)])
+        totals = table.totals()
+        if totals is not None:
+            sheet.append([cell(sheet, column, value) for column, value in zip(table.columns, totals)])
+
+    if not workbook.worksheets:
+        workbook.create_sheet(sheet_title(report.title))
+    workbook.save(path)
+
+
+# Форматы выгрузки по расширению файла
+EXPORT_FORMATS = ('txt', 'csv', 'json', 'xlsx')
+
+
+def export_format(path):
+    """Формат выгрузки по имени файла: 'отчет.xlsx' -> 'xlsx'"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчета: {path} (доступны: {', '.join(EXPORT_FORMATS)})")
+    return extension
+
+
+def export_report(report, path, format=None):
+    """Выгрузить отчет в файл path; формат - по расширению, если не указан"""
+    format = format or export_format(path)
+    if format == 'txt':
+        write_text(report, path)
+    elif format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            write_csv(report, f)
+    elif format == 'json':
+        with open(path, 'w', encoding='utf-8') as f:
+            write_json(report, f)
+    elif format == 'xlsx':
+        write_xlsx(report, path)
+    else:
+        raise ValueError(f"Неизвестный формат отчета: {format}")
@@ -0,0 +1,157 @@
+# report_views.py
+"""Обновление материализованных представлений отчетов.
+
+Отчеты по артистам и форматам читаются из представлений (миграция 006),
+а не считаются заново по всей коллекции. Представления пересчитываются
+через REFRESH ... CONCURRENTLY после изменения зависимых таблиц (с
+задержкой, чтобы серия правок дала одно обновление). Клиенты, получившие
+одно и то же уведомление, не пересчитывают представление повторно: если
+оно уже обновлено после изменения, пересчет пропускается.
+
+Плановое обновление выполняется в одном месте - этим скриптом, а не в
+каждом интерфейсе. Однократно (например, из cron):
+    python report_views.py [--database audiotech_db ...]
+или постоянно, раз в заданное число секунд:
+    python report_views.py --every 900
+"""
+import argparse
+import sys
+import threading
+import time
+
+from config import DB_CONFIG
+from database import Database, REPORT_VIEWS
+
+
+class ReportViewRefresher:
+    """Фоновое обновление представлений отчетов после изменения данных.
+
+    mark_changed(table) помечает устаревшими представления, зависящие от
+    таблицы (None - все). Они пересчитываются через delay секунд после
+    первой такой пометки, если с момента пометки их еще не обновил другой
+    клиент. Представление, которое в это время обновляет другой клиент,
+    остается помеченным (с прежним временем) и проверяется на следующем
+    шаге. Ошибки обновления передаются в on_error(ошибка) в фоновом потоке.
+    """
+
+    def __init__(self, db, delay=5, on_error=None):
+        self.db = db
+        self.delay = delay
+        self.on_error = on_error
+        self._dirty = {}
+        self._due_at = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def mark_changed(self, table=None):
+        """Таблица table изменилась (None - неизвестно какая)"""
+        views = [view for view, tables in REPORT_VIEWS.items() if table is None or table in tables]
+        if not views:
+            return
+        now = time.monotonic()
+        with self._condition:
+            for view in views:
+                self._dirty.setdefault(view, now)
+            if self._due_at is None:
+                self._due_at = now + self.delay
+                self._condition.notify()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='report-views', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _due(self):
+        """Представления, которые пора обновить, со временем их пометки, и
+        сколько ждать, если таких нет"""
+        if self._due_at is None:
+            return None, None
+        wait = self._due_at - time.monotonic()
+        if wait <= 0:
+            return dict(self._dirty), None
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    marked, wait = self._due()
+                    if marked:
+                        self._dirty.clear()
+                        self._due_at = None
+                        break
+                    self._condition.wait(wait)
+                if self._stopped:
+                    return
+
+            now = time.monotonic()
+            try:
+                refreshed = self.db.refresh_report_views(
+                    list(marked), ages={view: now - since for view, since in marked.items()})
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+                refreshed = []
+            # Не обновленные (занятые другим клиентом или с ошибкой) - через
+            # delay секунд, с временем первой пометки
+            skipped = set(marked) - set(refreshed)
+            if skipped:
+                with self._condition:
+                    for view in skipped:
+                        self._dirty[view] = min(self._dirty.get(view, marked[view]), marked[view])
+                    if self._due_at is None:
+                        self._due_at = time.monotonic() + self.delay
+
+
+def refresh(database):
+    """Обновить представления в базе database; False - при ошибке"""
+    db = Database({**DB_CONFIG, 'database': database}, min_size=1, max_size=1)
+    if not db.pool:
+        print(f"{database}: не удалось подключиться к базе данных", file=sys.stderr)
+        return False
+    try:
+        refreshed = db.refresh_report_views()
+        skipped = set(REPORT_VIEWS) - set(refreshed)
+        print(f"{database}: обновлено {len(refreshed)} из {len(REPORT_VIEWS)}", file=sys.stderr)
+        if skipped:
+            print(f"{database}: уже обновляются другим клиентом: {', '.join(sorted(skipped))}",
+                  file=sys.stderr)
+        return True
+    except Exception as e:
+        print(f"{database}: ошибка: {e}", file=sys.stderr)
+        return False
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обновление представлений отчетов")
+    parser.add_argument('--database', action='append',
+                        help=f"база коллекции (можно указать несколько раз; по умолчанию {DB_CONFIG['database']})")
+    parser.add_argument('--every', type=float, metavar='SECONDS',
+                        help="обновлять постоянно с этим интервалом, а не один раз")
+    args = parser.parse_args(argv)
+    databases = args.database or [DB_CONFIG['database']]
+
+    while True:
+        started = time.monotonic()
+        failed = sum(not refresh(database) for database in databases)
+        if not args.every:
+            return 1 if failed else 0
+        try:
+            time.sleep(max(0, started + args.every - time.monotonic()))
+        except KeyboardInterrupt:
+            return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+# reports.py
+"""Отчеты по коллекции без графического интерфейса.
+
+Отчет строится по запросам к Database в модель с типизированными
+колонками и строками (report_model.Report). Текст отчета строится из
+модели по мере чтения строк и выдается частями (stream_report):
+интерфейс выводит его во вкладку «Отчеты» по мере готовности. В файлы
+отчет выгружается прямо из строк - текстом, CSV, JSON или XLSX. Отчеты
+по нескольким базам (коллекциям) строятся параллельно в пуле потоков или
+процессов; каждый исполнитель держит по одному соединению на базу.
+
+Запуск из командной строки:
+    python reports.py [--report collection --report formats] [--database audiotech_db ...]
+                      [--output-dir отчеты] [--format csv --format xlsx] [--workers 4]
+                      [--processes] [--refresh-views]
+"""
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from multiprocessing import util
+
+from config import DB_CONFIG, DB_WORKERS, REPORT_CHUNK_LINES
+from database import Database
+from report_model import Column, Report, ReportTable, EXPORT_FORMATS, export_report, text_lines
+
+
+# ===== Отчеты =====
+# Построители отчетов возвращают модель Report (см. report_model); текст,
+# CSV, JSON и XLSX выводятся из ее строк
+def _collection_statistics(db):
+    # Общие данные отчетов по коллекции, стоимости и годам покупки
+    return db.report_cache.get(('data', 'collection_statistics'), db.data_version(),
+                               db.get_collection_statistics)
+
+
+def collection_report(db):
+    stats = _collection_statistics(db)
+    return Report("ОТЧЕТ ПО КОЛЛЕКЦИИ АУДИОТЕКИ", summary=[
+        (Column('items_count', "Всего носителей в коллекции", 'int'), sum(count for _, count in stats['by_format'])),
+        (Column('total_value', "Общая стоимость коллекции", 'money'), stats['total_value']),
+        (Column('releases_count', "Количество релизов", 'int'), stats['releases_count']),
+        (Column('artists_count', "Количество артистов", 'int'), stats['artists_count']),
+    ], tables=[
+        ReportTable([Column('format', "Формат", width=25),
+                     Column('items_count', "Кол-во", 'int', 8)],
+                    stats['by_format'], title="Распределение по форматам"),
+        ReportTable([Column('condition', "Состояние", width=25, default="Не указано"),
+                     Column('items_count', "Кол-во", 'int', 8)],
+                    stats['by_condition'], title="Распределение по состоянию"),
+        ReportTable([Column('year', "Год", 'int', 6),
+                     Column('items_count', "Кол-во", 'int', 8),
+                     Column('total_value', "Сумма", 'money', 16)],
+                    stats['by_year'], title="Покупки по годам"),
+    ])
+
+
+def artists_report(db):
+    return Report("ОТЧЕТ ПО АРТИСТАМ", [
+        ReportTable([Column('artist', "Артист", width=30, default="Неизвестный"),
+                     Column('releases_count', "Релизов", 'int', 8, total='sum'),
+                     Column('items_count', "Носителей", 'int', 10, total='sum'),
+                     Column('total_value', "Стоимость", 'money', 16, total='sum')],
+                    db.iter_artist_report(), totals_label="ИТОГО"),
+    ], refreshed_at=db.get_report_freshness().get('mv_artist_report'), from_view=True)
+
+
+def artist_report(db, artist_id, artist_name):
+    return Report(f"ОТЧЕТ ПО АРТИСТУ: {artist_name}", [
+        ReportTable([Column('album', "Альбом", width=30, default="Без названия"),
+                     Column('format', "Формат", width=20),
+                     Column('condition', "Состояние", width=18),
+                     Column('purchase_price', "Цена", 'money', 12, total='sum'),
+                     Column('purchase_date', "Дата", 'date', 12)],
+                    db.iter_artist_report(artist_id), totals_label="ИТОГО",
+                    empty="Нет данных по данному артисту"),
+    ])
+
+
+def formats_report(db):
+    return Report("ОТЧЕТ ПО ФОРМАТАМ НОСИТЕЛЕЙ", [
+        ReportTable([Column('format', "Формат", width=20, default="Неизвестно"),
+                     Column('items_count', "Кол-во", 'int', 8, total='sum'),
+                     Column('avg_price', "Ср. цена", 'money', 14),
+                     Column('total_value', "Сумма", 'money', 16, total='sum'),
+                     Column('first_purchase', "Первая", 'date', 12),
+                     Column('last_purchase', "Последняя", 'date', 12)],
+                    db.get_format_report(), totals_label="ИТОГО"),
+    ], refreshed_at=db.get_report_freshness().get('mv_format_report'), from_view=True)
+
+
+def value_report(db):
+    stats = _collection_statistics(db)
+    total_value = stats['total_value']
+    return Report("ОТЧЕТ ПО СТОИМОСТИ КОЛЛЕКЦИИ", summary=[
+        (Column('total_value', "Общая стоимость коллекции", 'money'), total_value),
+    ], tables=[
+        ReportTable([Column('format', "Формат", width=20),
+                     Column('total_value', "Стоимость", 'money', 16),
+                     Column('percent', "Доля", 'percent', 8)],
+                    [(format_name, sum_price, sum_price / total_value * 100 if total_value > 0 else 0)
+                     for format_name, count, sum_price in stats['value_by_format'] if sum_price],
+                    title="Стоимость по форматам"),
+    ])
+
+
+def purchase_years_report(db):
+    return Report("ОТЧЕТ ПО ГОДАМ ПОКУПКИ", [
+        ReportTable([Column('year', "Год", 'int', 6),
+                     Column('items_count', "Кол-во покупок", 'int', 14, total='sum'),
+                     Column('total_value', "Сумма покупок", 'money', 16, total='sum'),
+                     Column('avg_price', "Средний чек", 'money', 14, total=('ratio', 2, 1))],
+                    [(year, count, sum_price, sum_price / count if count > 0 else 0)
+                     for year, count, sum_price in _collection_statistics(db)['by_year']],
+                    totals_label="ИТОГО"),
+    ])
+
+
+# Отчеты по коллекции: имя -> (название, построитель build(db) -> Report)
+REPORTS = {
+    'collection': ("Отчет по коллекции", collection_report),
+    'artists': ("Отчет по артистам", artists_report),
+    'formats': ("Отчет по форматам", formats_report),
+    'value': ("Отчет по стоимости", value_report),
+    'purchase_years': ("Отчет по годам покупки", purchase_years_report),
+}
+
+
+def _chunks(lines, chunk_lines):
+    lines = iter(lines)
+    while True:
+        chunk = ''.join(islice(lines, chunk_lines))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _cached_stream(db, key, lines, chunk_lines):
+    """Части текста из кэша отчетов базы или построенные из lines().
+    Пока версия данных не изменилась, к базе нет запросов.
+    Текст длиннее max_lines кэша строится заново при каждом запросе."""
+    version = db.data_version()
+    cached = db.report_cache.lookup(key, version)
+    if cached is not None:
+        yield from cached
+        return
+
+    chunks = []
+    count = 0
+    for chunk in _chunks(lines(), chunk_lines):
+        if chunks is not None:
+            chunks.append(chunk)
+            count += chunk.count('\n')
+            if count > db.report_cache.max_lines:
+                chunks = None
+        yield chunk
+    if chunks is not None:
+        db.report_cache.store(key, version, tuple(chunks))
+
+
+def stream_report(db, name, chunk_lines=REPORT_CHUNK_LINES):
+    """Текст отчета name по базе db частями по chunk_lines строк.
+    Первая часть выдается, как только построены ее строки."""
+    build = REPORTS[name][1]
+    return _cached_stream(db, ('text', name), lambda: text_lines(build(db)), chunk_lines)
+
+
+def stream_artist_report(db, artist_id, artist_name, chunk_lines=REPORT_CHUNK_LINES):
+    """Текст отчета по одному артисту частями (см. stream_report)"""
+    return _cached_stream(db, ('text', 'artist', artist_id, artist_name),
+                          lambda: text_lines(artist_report(db, artist_id, artist_name)), chunk_lines)
+
+
+def generate_report(db, name):
+    """Текст отчета name по базе db целиком"""
+    return ''.join(stream_report(db, name))
+
+
+def generate_artist_report(db, artist_id, artist_name):
+    """Текст отчета по одному артисту целиком"""
+    return ''.join(stream_artist_report(db, artist_id, artist_name))
+
+
+# ===== Параллельное построение =====
+# Базы исполнителя: у каждого потока (процесса) свое соединение на каждую базу
+_worker = threading.local()
+_worker_databases = []
+_worker_lock = threading.Lock()
+
+
+def _worker_database(params):
+    databases = getattr(_worker, 'databases', None)
+    if databases is None:
+        databases = _worker.databases = {}
+    key = tuple(sorted(params.items()))
+    db = databases.get(key)
+    if db is None:
+        db = Database(params, min_size=1, max_size=1)
+        if not db.pool:
+            raise ConnectionError(f"Не удалось подключиться к базе данных {params.get('database')}")
+        databases[key] = db
+        with _worker_lock:
+            _worker_databases.append(db)
+    return db
+
+
+def _close_worker_databases():
+    with _worker_lock:
+        databases = list(_worker_databases)
+        _worker_databases.clear()
+    for db in databases:
+        db.close()
+
+
+def _init_worker_process():
+    # Соединения процесса-исполнителя закрываются при его завершении
+    util.Finalize(None, _close_worker_databases, exitpriority=10)
+
+
+def _write_report(params, name, path):
+    export_report(REPORTS[name][1](_worker_database(params)), path)
+    return path
+
+
+def write_reports(jobs, workers=DB_WORKERS, processes=False):
+    """Построить отчеты параллельно и записать в файлы.
+    jobs - список (параметры подключения, имя отчета, путь к файлу).
+    Возвращает [(задание, ошибка или None)] в порядке jobs."""
+    if processes:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker_process)
+    else:
+        executor = ThreadPoolExecutor(workers, thread_name_prefix='report')
+
+    try:
+        with executor:
+            futures = [executor.submit(_write_report, *job) for job in jobs]
+            results = []
+            for job, future in zip(jobs, futures):
+                try:
+                    future.result()
+                    results.append((job, None))
+                except Exception as e:
+                    results.append((job, e))
+    finally:
+        if not processes:
+            _close_worker_databases()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчеты по коллекции")
+    parser.add_argument('--report', action='append', choices=REPORTS,
+                        help="отчет (можно указать несколько раз; по умолчанию все)")
+    parser.add_argument('--database', action='append',
+                        help=f"база коллекции (можно указать несколько раз; по умолчанию {DB_CONFIG['database']})")
+    parser.add_argument('--output-dir', default='.', help="каталог для файлов отчетов")
+    parser.add_argument('--format', action='append', choices=EXPORT_FORMATS,
+                        help="формат файлов (можно указать несколько раз; по умолчанию txt)")
+    parser.add_argument('--workers', type=int, default=DB_WORKERS, help="число параллельных исполнителей")
+    parser.add_argument('--processes', action='store_true', help="исполнители в отдельных процессах, а не потоках")
+    parser.add_argument('--refresh-views', action='store_true',
+                        help="перед построением обновить представления отчетов по артистам и форматам")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    jobs = [
+        ({**DB_CONFIG, 'database': database}, name,
+         os.path.join(args.output_dir, f"отчет_{database}_{name}_{stamp}.{format}"))
+        for database in args.database or [DB_CONFIG['database']]
+        for name in args.report or REPORTS
+        for format in args.format or ['txt']
+    ]
+
+    failed = 0
+    if args.refresh_views:
+        for database in args.database or [DB_CONFIG['database']]:
+            db = Database({**DB_CONFIG, 'database': database}, min_size=1, max_size=1)
+            try:
+                if not db.pool:
+                    raise ConnectionError("нет подключения к базе данных")
+                db.refresh_report_views()
+            except Exception as e:
+                failed += 1
+                print(f"{database}: не удалось обновить представления отчетов: {e}", file=sys.stderr)
+            finally:
+                db.close()
+
+    for (params, name, path), error in write_reports(jobs, args.workers, args.processes):
+        if error is None:
+            print(path)
+        else:
+            failed += 1
+            print(f"{params['database']}: {REPORTS[name][0]} - ошибка: {error}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# statements.py
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from itertools import count
+
+import psycopg2
+
+_PLACEHOLDER = re.compile(r"%(s|%)")
+_EXECUTE = re.compile(r"EXECUTE (ps_\d+)\b")
+
+
+def to_positional(query):
+    """Перевести параметры psycopg2 в параметры PREPARE:
+    '... %s ... %s ... %%' -> ('... $1 ... $2 ... %', 2).
+    Для именованных параметров %(имя)s возвращает (None, 0)."""
+    if '%(' in query:
+        return None, 0
+
+    params = 0
+
+    def replace(match):
+        nonlocal params
+        if match.group(1) == '%':
+            return '%'
+        params += 1
+        return f"${params}"
+
+    return _PLACEHOLDER.sub(replace, query), params
+
+
+def _utility(cursor, command):
+    """Служебная команда (PREPARE, DEALLOCATE) на курсоре читающего запроса:
+    она не читающая, и план для нее не снимается (см. instrumentation)"""
+    read_only = getattr(cursor, 'read_only', False)
+    if read_only:
+        cursor.read_only = False
+    try:
+        cursor.execute(command)
+    finally:
+        if read_only:
+            cursor.read_only = True
+
+
+class _ConnectionStatements:
+    def __init__(self, generation):
+        self.generation = generation
+        self.names = OrderedDict()
+
+
+class PreparedStatements:
+    """Кэш подготовленных операторов (PREPARE) для каждого соединения.
+
+    Текст запроса один раз получает имя; на каждом соединении оператор
+    готовится при первом использовании и дальше выполняется через EXECUTE
+    без повторного разбора и планирования. Соединения после переподключения
+    начинают с пустым кэшем; invalidate() сбрасывает кэши всех соединений
+    (после миграций схемы). На соединении хранится не больше max_per_connection
+    операторов, давно не использованные освобождаются.
+    """
+
+    def __init__(self, max_per_connection=100):
+        self.max_per_connection = max_per_connection
+        self._lock = threading.Lock()
+        self._names = count(1)
+        self._statements = {}
+        self._sources = {}
+        self._connections = weakref.WeakKeyDictionary()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._unpreparable = 0
+
+    def _statement(self, query, params):
+        key = (query, params is None)
+        with self._lock:
+            if key in self._statements:
+                return self._statements[key]
+
+        if isinstance(params, dict):
+            statement = None
+        elif params is None:
+            # Без параметров psycopg2 отправляет текст как есть
+            statement = (f"ps_{next(self._names)}", query, 0)
+        else:
+            text, param_count = to_positional(query)
+            statement = (f"ps_{next(self._names)}", text, param_count) if text else None
+
+        with self._lock:
+            statement = self._statements.setdefault(key, statement)
+            if statement:
+                self._sources[statement[0]] = query
+            return statement
+
+    def source(self, query):
+        """Исходный текст запроса для 'EXECUTE ps_N ...' (для метрик и журналов);
+        для остальных запросов - None"""
+        match = _EXECUTE.match(query)
+        if match:
+            with self._lock:
+                return self._sources.get(match.group(1))
+        return None
+
+    def _prepared_on(self, cursor):
+        conn = cursor.connection
+        with self._lock:
+            entry = self._connections.get(conn)
+            generation = self._generation
+        if entry is not None and entry.generation == generation:
+            return entry.names
+
+        if entry is not None:
+            _utility(cursor, "DEALLOCATE ALL")
+        entry = _ConnectionStatements(generation)
+        with self._lock:
+            self._connections[conn] = entry
+        return entry.names
+
+    def execute(self, cursor, query, params=None):
+        """Выполнить читающий запрос подготовленным оператором.
+        Запрос должен быть первым в транзакции: если оператор не удается
+        подготовить, транзакция откатывается и запрос выполняется обычным образом."""
+        statement = self._statement(query, params) if self.max_per_connection else None
+        if statement is None:
+            cursor.execute(query, params)
+            return
+
+        name, text, param_count = statement
+        prepared = self._prepared_on(cursor)
+        if name in prepared:
+            prepared.move_to_end(name)
+            with self._lock:
+                self._hits += 1
+        else:
+            try:
+                _utility(cursor, f"PREPARE {name} AS {text}")
+            except (psycopg2.ProgrammingError, psycopg2.DataError):
+                # Например, тип параметра не выводится из запроса
+                cursor.connection.rollback()
+                with self._lock:
+                    self._statements[(query, params is None)] = None
+                    self._unpreparable += 1
+                cursor.execute(query, params)
+                return
+
+            prepared[name] = None
+            with self._lock:
+                self._misses += 1
+            if len(prepared) > self.max_per_connection:
+                evicted, _ = prepared.popitem(last=False)
+                _utility(cursor, f"DEALLOCATE {evicted}")
+
+        if param_count:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * param_count)})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def reset(self, conn):
+        """Забыть операторы соединения: при следующем использовании
+        они будут освобождены и подготовлены заново"""
+        with self._lock:
+            entry = self._connections.get(conn)
+            if entry is not None:
+                entry.generation = None
+
+    def invalidate(self):
+        """Сбросить операторы всех соединений (после изменения схемы)"""
+        with self._lock:
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / total if total else 0.0,
+                'statements': sum(1 for statement in self._statements.values() if statement),
+                'unpreparable': self._unpreparable,
+                'prepared': sum(len(entry.names) for entry in self._connections.values()
+                                if entry.generation == self._generation),
+            }
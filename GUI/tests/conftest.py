@@ -0,0 +1,28 @@
+# conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Строка подключения к тестовой базе коллекции (со схемой приложения);
+# без нее тесты с базой пропускаются
+TEST_DSN = os.environ.get('AUDIOTECH_TEST_DSN')
+
+
+@pytest.fixture
+def dsn():
+    if not TEST_DSN:
+        pytest.skip("не задана AUDIOTECH_TEST_DSN")
+    return TEST_DSN
+
+
+@pytest.fixture
+def conn(dsn):
+    """Соединение с тестовой базой; изменения откатываются"""
+    import psycopg2
+    connection = psycopg2.connect(dsn)
+    yield connection
+    connection.rollback()
+    connection.close()
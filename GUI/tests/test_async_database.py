@@ -0,0 +1,306 @@
+# test_async_database.py
+import asyncio
+import socket
+from collections import deque
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from async_database import AsyncConnectionPool, AsyncDatabase, _execute
+from database import Database, _collection_statistics
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.start(query)
+
+    def fetchall(self):
+        return list(self.conn.rows)
+
+    def fetchone(self):
+        return self.conn.rows[0] if self.conn.rows else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Асинхронное соединение без сервера. Запрос проходит состояния
+    POLL_WRITE и POLL_READ; у зависшего (hang) ответ не приходит никогда."""
+
+    def __init__(self):
+        self.closed = 0
+        self.cancelled = False
+        self.hang = False
+        self.rows = [(1,)]
+        self.queries = []
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self._states = deque()
+        # Сокет, готовый к записи и чтению: цикл событий ждет на настоящем fd
+        self._sock, self._peer = socket.socketpair()
+        self._peer.send(b'x')
+        self._silent, self._silent_peer = socket.socketpair()
+
+    def start(self, query):
+        self.queries.append(query)
+        if query == "BEGIN":
+            self.status = extensions.TRANSACTION_STATUS_INTRANS
+        elif query in ("COMMIT", "ROLLBACK"):
+            self.status = extensions.TRANSACTION_STATUS_IDLE
+        self._states.extend([extensions.POLL_WRITE, extensions.POLL_READ])
+
+    def poll(self):
+        if self._states:
+            return self._states.popleft()
+        if self.hang:
+            return extensions.POLL_READ
+        return extensions.POLL_OK
+
+    def fileno(self):
+        return self._silent.fileno() if self.hang and not self._states else self._sock.fileno()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def isexecuting(self):
+        return bool(self._states) or self.hang
+
+    def get_transaction_status(self):
+        return self.status
+
+    def cancel(self):
+        self.cancelled = True
+
+    def close(self):
+        if not self.closed:
+            for sock in (self._sock, self._peer, self._silent, self._silent_peer):
+                sock.close()
+        self.closed = 1
+
+
+class FakePool(AsyncConnectionPool):
+    """Пул без сервера: соединения - заглушки"""
+
+    def __init__(self, *args, fail_after=None, **kwargs):
+        super().__init__({}, *args, **kwargs)
+        self.opened = []
+        self.fail_after = fail_after
+
+    async def _open(self):
+        await asyncio.sleep(0)
+        if self.fail_after is not None and len(self.opened) >= self.fail_after:
+            raise psycopg2.OperationalError("нет соединения")
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+
+def _run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def test_execute_polls_until_ready():
+    async def main():
+        conn = FakeConnection()
+        conn.rows = [(1, 'a'), (2, 'b')]
+        assert await _execute(conn, "SELECT", fetch='all') == [(1, 'a'), (2, 'b')]
+        assert await _execute(conn, "SELECT", fetch='one') == (1, 'a')
+        assert conn.queries == ["SELECT", "SELECT"]
+        assert not conn.isexecuting()
+        conn.close()
+
+    _run(main())
+
+
+def test_unexpected_poll_state():
+    async def main():
+        conn = FakeConnection()
+        conn.poll = lambda: 42
+        with pytest.raises(psycopg2.OperationalError):
+            await _execute(conn, "SELECT")
+        conn.close()
+
+    _run(main())
+
+
+def test_open_fills_min_size():
+    async def main():
+        pool = FakePool(min_size=2, max_size=3)
+        await pool.open()
+        assert (pool.stats()['size'], pool.stats()['idle']) == (2, 2)
+        await pool.close()
+        assert all(conn.closed for conn in pool.opened)
+
+    _run(main())
+
+
+def test_failed_open_closes_opened_connections():
+    async def main():
+        pool = FakePool(min_size=3, max_size=3, fail_after=2)
+        with pytest.raises(psycopg2.OperationalError):
+            await pool.open()
+        assert len(pool.opened) == 2
+        assert all(conn.closed for conn in pool.opened)
+        assert pool.stats()['size'] == 0
+
+    _run(main())
+
+
+def test_checkout_waits_for_release():
+    async def main():
+        pool = FakePool(min_size=0, max_size=1, timeout=2)
+        conn = await pool.getconn()
+
+        async def release():
+            await asyncio.sleep(0.05)
+            await pool.putconn(conn)
+
+        _, again = await asyncio.gather(release(), pool.getconn())
+        assert again is conn
+        stats = pool.stats()
+        assert (stats['size'], stats['waits'], stats['checkouts']) == (1, 1, 2)
+        await pool.putconn(again)
+        await pool.close()
+
+    _run(main())
+
+
+def test_checkout_times_out_when_exhausted():
+    async def main():
+        pool = FakePool(min_size=0, max_size=1)
+        conn = await pool.getconn()
+        with pytest.raises(PoolError):
+            await pool.getconn(timeout=0.05)
+        assert pool.stats()['timeouts'] == 1
+        await pool.putconn(conn)
+        await pool.close()
+
+    _run(main())
+
+
+def test_connection_in_transaction_not_reused():
+    async def main():
+        pool = FakePool(min_size=0, max_size=1)
+        conn = await pool.getconn()
+        conn.status = extensions.TRANSACTION_STATUS_INTRANS
+        await pool.putconn(conn)
+        assert conn.closed
+        assert pool.stats()['size'] == 0
+        assert await pool.getconn() is not conn
+        await pool.close()
+
+    _run(main())
+
+
+def test_cancelled_query_discards_connection():
+    async def main():
+        pool = FakePool(min_size=0, max_size=1)
+
+        async def query():
+            async with pool.connection() as conn:
+                conn.hang = True
+                await _execute(conn, "SELECT pg_sleep(60)")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(query(), 0.05)
+        [conn] = pool.opened
+        assert conn.cancelled and conn.closed
+        assert pool.stats()['size'] == 0
+        # Место освободилось: следующий запрос получает новое соединение
+        async with pool.connection() as conn:
+            assert await _execute(conn, "SELECT 1", fetch='one') == (1,)
+        await pool.close()
+
+    _run(main())
+
+
+def _fake_database():
+    db = AsyncDatabase({}, min_size=0, max_size=2)
+    db.pool = FakePool(min_size=0, max_size=2)
+    return db
+
+
+def test_transaction_commits():
+    async def main():
+        db = _fake_database()
+        async with db.transaction() as tx:
+            await tx.execute("INSERT")
+            assert await tx.fetchone("SELECT") == (1,)
+        [conn] = db.pool.opened
+        assert conn.queries == ["BEGIN", "INSERT", "SELECT", "COMMIT"]
+        assert db.pool_stats()['idle'] == 1
+        await db.close()
+
+    _run(main())
+
+
+def test_transaction_rolled_back_on_error():
+    async def main():
+        db = _fake_database()
+        with pytest.raises(ValueError):
+            async with db.transaction() as tx:
+                await tx.execute("INSERT")
+                raise ValueError("ошибка")
+        [conn] = db.pool.opened
+        assert conn.queries == ["BEGIN", "INSERT", "ROLLBACK"]
+        # После отката соединение чистое и возвращается в пул
+        assert not conn.closed
+        assert db.pool_stats()['idle'] == 1
+        await db.close()
+
+    _run(main())
+
+
+def test_real_round_trips(dsn, conn):
+    async def main():
+        async with AsyncDatabase({'dsn': dsn}, min_size=1, max_size=3) as db:
+            count, statistics, artists = await asyncio.gather(
+                db.count_artists(), db.get_collection_statistics(), db.get_all_artists_for_select())
+            streamed = [row async for row in db.iter_media_items(page_size=500)]
+            page, after = await db.get_media_items_page(page_size=5)
+            return count, statistics, artists, streamed, page, after
+
+    count, statistics, artists, streamed, page, after = _run(main())
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM artists")
+        assert count == cursor.fetchone()[0]
+        cursor.execute(Database._ARTISTS_FOR_SELECT)
+        assert artists == cursor.fetchall()
+        cursor.execute(Database._COLLECTION_STATISTICS)
+        assert statistics == _collection_statistics(cursor.fetchall())
+        cursor.execute("SELECT count(*) FROM media_items")
+        media_count = cursor.fetchone()[0]
+    assert len(streamed) >= media_count
+    assert page == streamed[:5]
+    assert (after is None) == (len(streamed) <= 5)
+
+
+def test_real_transaction_rollback(dsn, conn):
+    async def main():
+        async with AsyncDatabase({'dsn': dsn}, min_size=1, max_size=1) as db:
+            with pytest.raises(ValueError):
+                async with db.transaction() as tx:
+                    await tx.execute("INSERT INTO genres (genre_name) VALUES (%s)", ("Тест отката",))
+                    raise ValueError("откат")
+            return db.pool_stats()
+
+    stats = _run(main())
+    assert stats['reconnects'] == 0
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM genres WHERE genre_name = %s", ("Тест отката",))
+        assert cursor.fetchone()[0] == 0
+
+
+def test_real_cancel_frees_connection(dsn):
+    async def main():
+        async with AsyncDatabase({'dsn': dsn}, min_size=0, max_size=1) as db:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(db._execute("SELECT pg_sleep(30)"), 0.2)
+            assert db.pool_stats()['size'] == 0
+            return await db._fetchone("SELECT 1")
+
+    assert _run(main()) == (1,)
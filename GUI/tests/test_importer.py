@@ -0,0 +1,101 @@
+# test_importer.py
+import pytest
+
+from database import Database
+from importer import DUPLICATE_CATALOG_NUMBER, CollectionImporter, _read_header
+
+
+def _write(tmp_path, text):
+    path = tmp_path / 'collection.csv'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_header_delimiter_detected(tmp_path):
+    path = _write(tmp_path, '\ufeff"catalog_number";release_title;artists\nA;B;C\n')
+    assert _read_header(path, None) == (['catalog_number', 'release_title', 'artists'], ';')
+    path = _write(tmp_path, 'catalog_number,release_title\nA,B\n')
+    assert _read_header(path, None) == (['catalog_number', 'release_title'], ',')
+
+
+@pytest.fixture
+def db(dsn):
+    database = Database({'dsn': dsn}, min_size=1, max_size=1)
+    yield database
+    database.close()
+
+
+def test_required_columns(tmp_path, db):
+    with pytest.raises(ValueError):
+        CollectionImporter(db).import_file(_write(tmp_path, 'catalog_number;notes\nA;B\n'), dry_run=True)
+
+
+def _one(db, query):
+    with db.cursor() as cursor:
+        cursor.execute(query)
+        row = cursor.fetchone()
+    if row is None:
+        pytest.skip("в тестовой базе нет данных коллекции")
+    return row[0]
+
+
+def test_rejects_by_record(tmp_path, db):
+    media_type = _one(db, "SELECT type_name FROM media_types ORDER BY media_type_id LIMIT 1")
+    existing = _one(db, "SELECT catalog_number FROM media_items ORDER BY media_item_id LIMIT 1")
+    path = _write(tmp_path, "\n".join([
+        "catalog_number;release_title;artists;media_type;purchase_price;purchase_date;release_year;notes",
+        f'TEST-IMP-1;Тестовый релиз;Тестовый артист;{media_type};1 200,50;01.02.2023;2001;"две\nстроки"',
+        f";Без номера;;{media_type};;;;",
+        f"TEST-IMP-3;;;{media_type};;;;",
+        "TEST-IMP-4;Релиз;;нет такого типа;;;;",
+        f"TEST-IMP-5;Релиз;;{media_type};дорого;;;",
+        f"TEST-IMP-6;Релиз;;{media_type};;31.02.2023;;",
+        f"TEST-IMP-7;Релиз;;{media_type};;;1800;",
+        f"TEST-IMP-1;Повтор;;{media_type};;;;",
+        f"{existing};Релиз;;{media_type};;;;",
+        f"TEST-IMP-10;{'x' * 256};;{media_type};;;;",
+    ]) + "\n")
+
+    result = CollectionImporter(db).import_file(path, dry_run=True)
+
+    # Номер записи не зависит от переводов строк внутри полей
+    assert result['rejects'] == [
+        (2, None, "нет каталожного номера"),
+        (3, 'TEST-IMP-3', "нет названия релиза"),
+        (4, 'TEST-IMP-4', "неизвестный тип носителя"),
+        (5, 'TEST-IMP-5', "неверная цена"),
+        (6, 'TEST-IMP-6', "неверная дата покупки"),
+        (7, 'TEST-IMP-7', "неверный год релиза"),
+        (8, 'TEST-IMP-1', "повтор каталожного номера в файле"),
+        (9, existing, "носитель уже есть в коллекции"),
+        (10, 'TEST-IMP-10', "слишком длинное значение"),
+    ]
+    assert (result['total'], result['accepted'], result['rejected']) == (10, 1, 9)
+
+
+def test_dry_run_keeps_collection(tmp_path, db):
+    media_type = _one(db, "SELECT type_name FROM media_types ORDER BY media_type_id LIMIT 1")
+    path = _write(tmp_path, f"catalog_number;release_title;media_type\nTEST-IMP-DRY;Релиз;{media_type}\n")
+    assert CollectionImporter(db).import_file(path, dry_run=True)['accepted'] == 1
+    assert _one(db, "SELECT count(*) FROM media_items WHERE catalog_number = 'TEST-IMP-DRY'") == 0
+
+
+def test_catalog_number_taken_during_import(tmp_path, db):
+    media_type = _one(db, "SELECT type_name FROM media_types ORDER BY media_type_id LIMIT 1")
+    path = _write(tmp_path, f"catalog_number;release_title;media_type\n"
+                            f"TEST-IMP-A;Релиз;{media_type}\nTEST-IMP-B;Релиз;{media_type}\n")
+    importer = CollectionImporter(db)
+    merge = importer._merge_media_items
+
+    def racing(cursor):
+        # Номер занят после проверки, как если бы его вставил другой клиент
+        cursor.execute("""
+            INSERT INTO media_items (catalog_number, media_type_id, release_id)
+            SELECT 'TEST-IMP-B', media_type_id, release_id FROM import_staging LIMIT 1
+        """)
+        return merge(cursor)
+
+    importer._merge_media_items = racing
+    result = importer.import_file(path, dry_run=True)
+    assert result['rejects'] == [(2, 'TEST-IMP-B', DUPLICATE_CATALOG_NUMBER)]
+    assert (result['accepted'], result['rejected']) == (1, 1)
@@ -0,0 +1,71 @@
+# test_instrumentation.py
+import pytest
+
+from instrumentation import HISTOGRAM_BOUNDS_MS, OTHER_QUERIES, QueryMetrics, QueryStats, estimate_bytes, normalize
+
+
+def test_normalize_collapses_whitespace():
+    assert normalize("SELECT  *\n  FROM t\tWHERE a = %s ") == "SELECT * FROM t WHERE a = %s"
+    assert normalize(b"SELECT  1") == "SELECT 1"
+    # Без literal значения в тексте остаются
+    assert normalize("SELECT 1 WHERE b = 'x'") == "SELECT 1 WHERE b = 'x'"
+
+
+def test_normalize_folds_literals():
+    assert (normalize("SELECT col1, t2.x FROM t2 WHERE $1 = 5 AND name = 'a b' AND v > 3.25", literal=True)
+            == "SELECT col1, t2.x FROM t2 WHERE $1 = ? AND name = ? AND v > ?")
+    # Кавычка внутри строки не обрывает литерал
+    assert normalize("SELECT 'it''s', 'x'", literal=True) == "SELECT ?, ?"
+
+
+def test_normalize_folds_values_list():
+    query = "INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'it''s'),\n (3.5, 'y')"
+    assert normalize(query, literal=True) == "INSERT INTO t (a, b) VALUES (?, ?), ..."
+    # Разное число строк VALUES дает один текст
+    assert normalize("INSERT INTO t (a) VALUES (1), (2)", literal=True) == \
+        normalize("INSERT INTO t (a) VALUES (7), (8), (9)", literal=True)
+
+
+def test_percentile_of_empty_stats():
+    assert QueryStats().percentile(0.5) == 0.0
+
+
+def test_percentile_is_bucket_bound_capped_by_max():
+    stats = QueryStats()
+    for elapsed_ms in [0.5] * 90 + [30] * 9 + [40]:
+        stats.add(elapsed_ms, 1, 0, False)
+    assert stats.percentile(0.5) == 1
+    assert stats.percentile(0.9) == 1
+    # Корзина до 50 мс, но медленнее 40 мс запросов не было
+    assert stats.percentile(0.95) == 40
+    assert stats.percentile(0.99) == 40
+
+
+def test_percentile_beyond_last_bucket():
+    stats = QueryStats()
+    stats.add(HISTOGRAM_BOUNDS_MS[-1] * 2, None, 0, True)
+    assert stats.buckets[-1] == 1
+    assert stats.percentile(0.5) == HISTOGRAM_BOUNDS_MS[-1] * 2
+    assert (stats.errors, stats.rows) == (1, 0)
+
+
+def test_estimate_bytes():
+    assert estimate_bytes([]) == 0
+    # Строки в байтах UTF-8, NULL - ноль, прочие значения - 8 байт
+    assert estimate_bytes([("ж", None, 1, b"abc")]) == 2 + 0 + 8 + 3
+    assert estimate_bytes([("ab",)] * 10) == 20
+
+
+def test_estimate_bytes_extrapolates_sample():
+    rows = [("a",)] * 4 + [("bbbbbbbb",)] * 4
+    assert estimate_bytes(rows, sample=4) == 8
+    assert estimate_bytes(rows, sample=8) == 36
+
+
+@pytest.mark.parametrize('literal', [False, True])
+def test_metrics_overflow_goes_to_other_queries(literal):
+    metrics = QueryMetrics(explain=False, max_queries=2)
+    for i in range(4):
+        metrics.record(metrics.label(f"SELECT x{i}", literal), 1.0)
+    calls = {query['query']: query['calls'] for query in metrics.snapshot()['queries']}
+    assert calls == {"SELECT x0": 1, "SELECT x1": 1, OTHER_QUERIES: 2}
@@ -0,0 +1,53 @@
+# test_pagination.py
+import random
+
+import pytest
+
+from database import _page_query, _page_result
+
+# Список с повторяющимся первым ключом сортировки: порядок уточняет id
+_ROWS = [(i, random.Random(i).choice(['a', 'b', 'c', 'd']), i * 10) for i in range(1, 48)]
+_QUERY = """
+    SELECT id, name, price, name AS sort_key_0, id AS sort_key_1
+    FROM (VALUES {}) AS v(id, name, price)
+    """.format(', '.join(['(%s, %s, %s)'] * len(_ROWS)))
+_PARAMS = [value for row in _ROWS for value in row]
+
+
+def _fetch(conn, query, params):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def test_first_page_query():
+    query, params = _page_query("SELECT 1", [7], 2, 50)
+    assert "WHERE" not in query
+    assert query.endswith("ORDER BY sort_key_0, sort_key_1 LIMIT %s")
+    assert params == [7, 50]
+
+
+def test_next_page_query():
+    query, params = _page_query("SELECT 1", [], 2, 50, ('b', 3))
+    assert "WHERE (sort_key_0, sort_key_1) > (%s, %s)" in query
+    assert params == ['b', 3, 50]
+
+
+def test_page_result_key_only_for_full_page():
+    rows = [(1, 'a', 'a', 1), (2, 'b', 'b', 2)]
+    assert _page_result(rows, 2, 2) == ([(1, 'a'), (2, 'b')], ('b', 2))
+    assert _page_result(rows, 2, 3) == ([(1, 'a'), (2, 'b')], None)
+
+
+@pytest.mark.parametrize('page_size', [1, 5, 47, 100])
+def test_pages_cover_list_once(conn, page_size):
+    expected = [row[:3] for row in sorted(_ROWS, key=lambda row: (row[1], row[0]))]
+    rows = []
+    after = None
+    while True:
+        page, after = _page_result(_fetch(conn, *_page_query(_QUERY, _PARAMS, 2, page_size, after)), 2, page_size)
+        assert len(page) <= page_size
+        rows += page
+        if after is None:
+            break
+    assert rows == expected
@@ -0,0 +1,142 @@
+# test_pool.py
+import threading
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    """Пул без сервера: соединения - заглушки"""
+
+    def _open(self):
+        return FakeConnection()
+
+
+def test_invalid_sizes():
+    with pytest.raises(ValueError):
+        FakePool({}, min_size=3, max_size=2)
+    with pytest.raises(ValueError):
+        FakePool({}, max_size=0)
+
+
+def test_min_size_opened_upfront():
+    pool = FakePool({}, min_size=2, max_size=4)
+    assert pool.stats()['size'] == 2
+    assert pool.stats()['idle'] == 2
+
+
+def test_failed_fill_closes_opened_connections():
+    opened = []
+
+    class FailingPool(FakePool):
+        def _open(self):
+            if len(opened) == 2:
+                raise psycopg2.OperationalError("нет соединения")
+            opened.append(super()._open())
+            return opened[-1]
+
+    with pytest.raises(psycopg2.OperationalError):
+        FailingPool({}, min_size=3, max_size=3)
+    assert len(opened) == 2
+    assert all(conn.closed for conn in opened)
+
+
+def test_checkout_reuses_returned_connection():
+    pool = FakePool({}, min_size=0, max_size=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert (stats['size'], stats['in_use'], stats['checkouts']) == (1, 1, 2)
+
+
+def test_checkout_times_out_when_exhausted():
+    pool = FakePool({}, min_size=0, max_size=2, timeout=5)
+    pool.getconn()
+    pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolError):
+        pool.getconn(timeout=0.05)
+    assert time.monotonic() - started < 1
+    assert pool.stats()['timeouts'] == 1
+    assert pool.stats()['size'] == 2
+
+
+def test_waiting_checkout_gets_released_connection():
+    pool = FakePool({}, min_size=0, max_size=1)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    assert pool.getconn(timeout=2) is conn
+    assert pool.stats()['waits'] == 1
+
+
+def test_broken_connection_frees_slot():
+    pool = FakePool({}, min_size=0, max_size=1)
+    conn = pool.getconn()
+    pool.putconn(conn, broken=True)
+    assert conn.closed
+    assert pool.stats()['size'] == 0
+    assert pool.getconn(timeout=0.05) is not conn
+
+
+def test_open_transaction_rolled_back_on_return():
+    pool = FakePool({}, min_size=0, max_size=1)
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_closed_idle_connection_reopened():
+    pool = FakePool({}, min_size=1, max_size=1)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.close()
+    assert pool.getconn() is not conn
+    assert pool.stats()['reconnects'] == 1
+
+
+def test_closed_pool_refuses_checkout():
+    pool = FakePool({}, min_size=1, max_size=1)
+    idle = pool._idle[0][0]
+    pool.close()
+    assert idle.closed
+    with pytest.raises(PoolError):
+        pool.getconn(timeout=0)
+
+
+def test_real_connections(dsn):
+    pool = ConnectionPool({'dsn': dsn}, min_size=1, max_size=2, timeout=1)
+    try:
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                assert cursor.fetchone() == (1,)
+        # Незавершенная транзакция откатывается при возврате
+        assert conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        assert pool.stats()['idle'] == 1
+    finally:
+        pool.close()
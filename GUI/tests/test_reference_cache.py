@@ -0,0 +1,92 @@
+# test_reference_cache.py
+import pytest
+
+import cache
+from cache import ReferenceCache
+
+
+class Loader:
+    def __init__(self, rows=('row',)):
+        self.rows = list(rows)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.rows
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_hit_until_ttl_expires(clock):
+    reference = ReferenceCache(ttl=10)
+    loader = Loader()
+    assert reference.get('genres', ['genres'], loader) is loader.rows
+    clock[0] += 9
+    reference.get('genres', ['genres'], loader)
+    assert loader.calls == 1
+    clock[0] += 1
+    reference.get('genres', ['genres'], loader)
+    assert loader.calls == 2
+    assert reference.stats()['hits'] == 1
+    assert reference.stats()['misses'] == 2
+
+
+def test_least_recently_used_evicted(clock):
+    reference = ReferenceCache(max_entries=2)
+    loaders = {key: Loader() for key in 'abc'}
+    reference.get('a', [], loaders['a'])
+    reference.get('b', [], loaders['b'])
+    reference.get('a', [], loaders['a'])
+    reference.get('c', [], loaders['c'])
+    reference.get('a', [], loaders['a'])
+    reference.get('b', [], loaders['b'])
+    assert (loaders['a'].calls, loaders['b'].calls, loaders['c'].calls) == (1, 2, 1)
+    assert reference.stats()['entries'] == 2
+
+
+def test_large_sets_not_cached(clock):
+    reference = ReferenceCache(max_rows=2)
+    loader = Loader(range(3))
+    reference.get('artists', ['artists'], loader)
+    reference.get('artists', ['artists'], loader)
+    assert loader.calls == 2
+    assert reference.stats()['entries'] == 0
+
+
+def test_invalidate_table_drops_dependent_sets(clock):
+    reference = ReferenceCache()
+    releases, genres = Loader(), Loader()
+    reference.get('releases', ['releases', 'artists'], releases)
+    reference.get('genres', ['genres'], genres)
+    reference.invalidate_table('artists')
+    reference.get('releases', ['releases', 'artists'], releases)
+    reference.get('genres', ['genres'], genres)
+    assert (releases.calls, genres.calls) == (2, 1)
+
+
+def test_change_during_load_not_cached(clock):
+    reference = ReferenceCache()
+
+    def loader():
+        # Уведомление пришло, пока набор читался
+        reference.invalidate_table('artists')
+        return ['old']
+
+    assert reference.get('artists', ['artists'], loader) == ['old']
+    assert reference.stats()['entries'] == 0
+
+
+def test_clear_during_load_not_cached(clock):
+    reference = ReferenceCache()
+
+    def loader():
+        reference.clear()
+        return ['old']
+
+    reference.get('genres', ['genres'], loader)
+    assert reference.stats()['entries'] == 0
@@ -0,0 +1,62 @@
+# test_report_cache.py
+from cache import ReportCache
+
+
+def test_hit_for_same_version():
+    reports = ReportCache()
+    loads = []
+    for _ in range(2):
+        assert reports.get('a', (1, 0), lambda: loads.append(1) or 'text') == 'text'
+    assert len(loads) == 1
+    assert reports.stats()['hits'] == 1
+
+
+def test_least_recently_used_evicted():
+    reports = ReportCache(max_entries=2)
+    for key in 'ab':
+        reports.get(key, 1, lambda key=key: key.upper())
+    reports.lookup('a', 1)
+    reports.get('c', 1, lambda: 'C')
+    assert reports.lookup('b', 1) is None
+    assert reports.lookup('a', 1) == 'A'
+    assert reports.lookup('c', 1) == 'C'
+    assert reports.stats()['evictions'] == 1
+
+
+def test_new_version_drops_all():
+    reports = ReportCache()
+    reports.get('a', 1, lambda: 'old')
+    assert reports.get('a', 2, lambda: 'new') == 'new'
+    assert reports.stats()['entries'] == 1
+    assert reports.lookup('a', 2) == 'new'
+
+
+def test_older_version_not_stored():
+    reports = ReportCache()
+    assert reports.lookup('a', 1) is None
+    # Отчет по версии 1 достроен после того, как версия сменилась
+    reports.lookup('b', 2)
+    reports.store('a', 1, 'stale')
+    assert reports.lookup('a', 2) is None
+    # Запрос с устаревшей версией не сбрасывает новые результаты
+    reports.store('b', 2, 'fresh')
+    assert reports.lookup('b', 1) is None
+    assert reports.lookup('b', 2) == 'fresh'
+
+
+def test_unknown_version_bypasses_cache():
+    reports = ReportCache()
+    loads = []
+    for _ in range(2):
+        reports.get('a', None, lambda: loads.append(1) or 'text')
+    assert len(loads) == 2
+    reports.clear()
+    reports.store('a', None, 'text')
+    assert reports.stats()['entries'] == 0
+
+
+def test_tuple_versions_ordered():
+    # Версия данных Database: (подключения слушателя, уведомления)
+    reports = ReportCache()
+    reports.get('a', (1, 5), lambda: 'before reconnect')
+    assert reports.get('a', (2, 0), lambda: 'after reconnect') == 'after reconnect'
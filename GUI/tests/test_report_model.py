@@ -0,0 +1,115 @@
+# test_report_model.py
+import csv
+import io
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from report_model import (Column, Report, ReportTable, export_format, export_report, text_lines,
+                          write_csv, write_json)
+
+
+def _table(rows):
+    columns = [
+        Column('artist', "Артист", width=10),
+        Column('items', "Носителей", 'int', total='sum'),
+        Column('value', "Стоимость", 'money', total='sum'),
+        Column('average', "Средняя", 'money', total=('ratio', 2, 1)),
+        Column('bought', "Куплен", 'date'),
+    ]
+    return ReportTable(columns, rows, title="По артистам", totals_label="Итого")
+
+
+ROWS = [
+    ('A', 2, Decimal('100.50'), Decimal('50.25'), date(2023, 2, 1)),
+    ('B', 1, None, None, None),
+    ('C', 3, Decimal('30.00'), Decimal('10.00'), date(2024, 12, 31)),
+]
+
+
+def _report(rows=ROWS):
+    return Report("Отчет", [_table(rows)], summary=[(Column('total', "Всего", 'int'), 6)],
+                  refreshed_at=datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+
+
+def test_totals_after_iteration():
+    table = _table(iter(ROWS))
+    assert list(table) == ROWS
+    # NULL пропускается в сумме; средняя - итог стоимости на итог носителей
+    assert table.totals() == ("Итого", 6, Decimal('130.50'), Decimal('130.50') / 6, None)
+
+
+def test_totals_recounted_on_each_iteration():
+    table = _table(ROWS)
+    assert list(table) == ROWS
+    assert list(table) == ROWS
+    assert table.totals()[1:3] == (6, Decimal('130.50'))
+
+
+def test_totals_of_empty_table():
+    table = _table([])
+    assert list(table) == []
+    assert table.totals() == ("Итого", 0, 0, 0, None)
+
+
+def test_no_totals_without_label():
+    table = ReportTable([Column('n', "N", 'int', total='sum')], [(1,)])
+    list(table)
+    assert table.totals() is None
+
+
+def test_csv():
+    f = io.StringIO()
+    write_csv(_report(iter(ROWS)), f)
+    rows = list(csv.reader(io.StringIO(f.getvalue()), delimiter=';'))
+    assert rows[0] == ["Всего", "6"]
+    assert rows[1] == []
+    assert rows[2] == ["По артистам"]
+    assert rows[3] == ["Артист", "Носителей", "Стоимость", "Средняя", "Куплен"]
+    assert rows[4] == ["A", "2", "100.50", "50.25", "2023-02-01"]
+    assert rows[5] == ["B", "1", "", "", ""]
+    assert rows[-1][:3] == ["Итого", "6", "130.50"]
+    assert len(rows) == 8
+
+
+def test_json():
+    f = io.StringIO()
+    write_json(_report(iter(ROWS)), f)
+    document = json.loads(f.getvalue())
+    assert document['title'] == "Отчет"
+    assert document['refreshed_at'] == "2026-01-02T03:04:05+00:00"
+    assert document['summary'] == {'total': 6}
+    [table] = document['tables']
+    assert [column['name'] for column in table['columns']] == ['artist', 'items', 'value', 'average', 'bought']
+    assert table['rows'][0] == {'artist': 'A', 'items': 2, 'value': 100.5, 'average': 50.25, 'bought': '2023-02-01'}
+    assert table['rows'][1]['value'] is None
+    assert table['totals']['items'] == 6
+    assert table['totals']['average'] == pytest.approx(21.75)
+
+
+def test_json_without_tables():
+    f = io.StringIO()
+    write_json(Report("Пусто"), f)
+    assert json.loads(f.getvalue()) == {'title': "Пусто", 'refreshed_at': None, 'summary': {}, 'tables': []}
+
+
+def test_text_has_totals_and_empty_text():
+    text = ''.join(text_lines(_report()))
+    assert "Всего: 6" in text
+    assert "130.50 ₽" in text
+    # Даты и строки форматируются своей колонкой, подпись итогов - как есть
+    assert "01.02.2023" in text
+    assert "Итого" in text
+    empty = ReportTable([Column('n', "N")], [], empty="Нет данных")
+    assert "Нет данных\n" in ''.join(text_lines(Report("Отчет", [empty])))
+
+
+def test_export_format_by_extension(tmp_path):
+    assert export_format('отчет.CSV') == 'csv'
+    with pytest.raises(ValueError):
+        export_format('отчет.pdf')
+    path = tmp_path / 'отчет.json'
+    export_report(_report(), str(path))
+    assert json.loads(path.read_text(encoding='utf-8'))['tables'][0]['rows'][2]['artist'] == 'C'
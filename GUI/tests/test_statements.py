@@ -0,0 +1,75 @@
+# test_statements.py
+from statements import PreparedStatements, to_positional
+
+
+def _prepared(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM pg_prepared_statements ORDER BY name")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_to_positional():
+    assert to_positional("SELECT %s, %s WHERE x LIKE 'a%%'") == ("SELECT $1, $2 WHERE x LIKE 'a%'", 2)
+    assert to_positional("SELECT 1") == ("SELECT 1", 0)
+    assert to_positional("SELECT %(name)s") == (None, 0)
+
+
+def test_prepared_once_then_executed(conn):
+    statements = PreparedStatements()
+    for value in (1, 2):
+        with conn.cursor() as cursor:
+            statements.execute(cursor, "SELECT %s::int + 1", (value,))
+            assert cursor.fetchone() == (value + 1,)
+    stats = statements.stats()
+    assert (stats['misses'], stats['hits'], stats['prepared']) == (1, 1, 1)
+    assert len(_prepared(conn)) == 1
+
+
+def test_unpreparable_query_falls_back(conn):
+    statements = PreparedStatements()
+    # Тип параметра не выводится из запроса: PREPARE не удается
+    for _ in range(2):
+        with conn.cursor() as cursor:
+            statements.execute(cursor, "SELECT %s IS NULL", ('x',))
+            assert cursor.fetchone() == (False,)
+    stats = statements.stats()
+    assert stats['unpreparable'] == 1
+    assert (stats['misses'], stats['hits'], stats['statements']) == (0, 0, 0)
+    assert _prepared(conn) == []
+
+
+def test_named_parameters_not_prepared(conn):
+    statements = PreparedStatements()
+    with conn.cursor() as cursor:
+        statements.execute(cursor, "SELECT %(value)s::int", {'value': 5})
+        assert cursor.fetchone() == (5,)
+    assert statements.stats()['misses'] == 0
+    assert _prepared(conn) == []
+
+
+def test_least_recently_used_deallocated(conn):
+    statements = PreparedStatements(max_per_connection=1)
+    with conn.cursor() as cursor:
+        statements.execute(cursor, "SELECT 1")
+        statements.execute(cursor, "SELECT 2")
+        assert cursor.fetchone() == (2,)
+    assert len(_prepared(conn)) == 1
+
+
+def test_invalidate_prepares_again(conn):
+    statements = PreparedStatements()
+    with conn.cursor() as cursor:
+        statements.execute(cursor, "SELECT 1")
+    statements.invalidate()
+    with conn.cursor() as cursor:
+        statements.execute(cursor, "SELECT 1")
+        assert cursor.fetchone() == (1,)
+    assert statements.stats()['misses'] == 2
+    assert len(_prepared(conn)) == 1
+
+
+def test_source_of_execute():
+    statements = PreparedStatements()
+    name, _, _ = statements._statement("SELECT %s::int", (1,))
+    assert statements.source(f"EXECUTE {name} (1)") == "SELECT %s::int"
+    assert statements.source("SELECT 1") is None
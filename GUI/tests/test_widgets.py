@@ -0,0 +1,379 @@
+# test_widgets.py
+import random
+
+import pytest
+
+from widgets import TreeBinding, WindowedSource, _stable_positions
+
+
+class FakeTree:
+    """Плоский Treeview без Tk: порядок строк, значения и счетчик операций"""
+
+    def __init__(self):
+        self.children = []
+        self.values = {}
+        self.selected = ()
+        self.top = 0.0
+        self.operations = {'insert': 0, 'item': 0, 'delete': 0, 'move': 0}
+        self._next = 0
+
+    def _place(self, iid, index):
+        if index == 'end':
+            self.children.append(iid)
+        else:
+            self.children.insert(index, iid)
+
+    def insert(self, parent, index, values=()):
+        self._next += 1
+        iid = f"I{self._next:03}"
+        self.values[iid] = tuple(values)
+        self._place(iid, index)
+        self.operations['insert'] += 1
+        return iid
+
+    def item(self, iid, values):
+        self.values[iid] = tuple(values)
+        self.operations['item'] += 1
+
+    def delete(self, *iids):
+        for iid in iids:
+            if iid in self.children:
+                self.children.remove(iid)
+            del self.values[iid]
+        self.selected = tuple(iid for iid in self.selected if iid in self.values)
+        self.operations['delete'] += len(iids)
+
+    def detach(self, *iids):
+        for iid in iids:
+            self.children.remove(iid)
+        self.selected = tuple(iid for iid in self.selected if iid not in iids)
+
+    def move(self, iid, parent, index):
+        if iid in self.children:
+            self.children.remove(iid)
+        self._place(iid, index)
+        self.operations['move'] += 1
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, items):
+        self.selected = tuple(items)
+
+    def yview(self):
+        return self.top, 1.0
+
+    def yview_moveto(self, fraction):
+        self.top = fraction
+
+    def rows(self):
+        return [self.values[iid] for iid in self.children]
+
+
+def _lis_length(sequence):
+    best = []
+    for i, value in enumerate(sequence):
+        best.append(1 + max([best[j] for j in range(i) if sequence[j] < value], default=0))
+    return max(best, default=0)
+
+
+def test_stable_positions_examples():
+    assert _stable_positions([]) == set()
+    assert _stable_positions([0, 1, 2]) == {0, 1, 2}
+    assert len(_stable_positions([2, 1, 0])) == 1
+    assert _stable_positions([3, 0, 1, 2]) == {1, 2, 3}
+
+
+def test_stable_positions_fuzz():
+    rng = random.Random(14)
+    for _ in range(300):
+        sequence = rng.sample(range(40), rng.randint(0, 12))
+        stable = sorted(_stable_positions(sequence))
+        values = [sequence[i] for i in stable]
+        assert values == sorted(values)
+        assert len(stable) == _lis_length(sequence)
+
+
+def _rows(rng):
+    """Случайный список: ключи 0..9 с повторами, значения меняются"""
+    return [(rng.randrange(10), rng.choice("abc")) for _ in range(rng.randint(0, 15))]
+
+
+def test_set_rows_fuzz():
+    rng = random.Random(2024)
+    tree = FakeTree()
+    binding = TreeBinding(tree)
+    for _ in range(300):
+        rows = _rows(rng)
+        before = dict(tree.operations)
+        kept = set(tree.children)
+        order = binding.set_rows(rows)
+        assert tree.rows() == rows
+        assert order == binding.order == tree.children
+        assert len(binding) == len(rows)
+        # Строки, оставшиеся в списке, не пересоздаются
+        assert tree.operations['insert'] - before['insert'] == len(set(order) - kept)
+
+
+def test_set_rows_moves_only_out_of_order_rows():
+    tree = FakeTree()
+    binding = TreeBinding(tree)
+    binding.set_rows([(i, "x") for i in range(6)])
+    tree.selected = (binding.order[0], binding.order[5])
+    binding.set_rows([(5, "x")] + [(i, "x") for i in range(5)])
+    assert [values[0] for values in tree.rows()] == [5, 0, 1, 2, 3, 4]
+    assert tree.operations['move'] == 1
+    assert tree.operations['insert'] == 6
+    # Перемещенная строка остается выделенной
+    assert set(tree.selected) == {tree.children[0], tree.children[1]}
+
+
+def test_set_rows_updates_changed_values_in_place():
+    tree = FakeTree()
+    binding = TreeBinding(tree)
+    first = binding.set_rows([(1, "a"), (2, "b")])
+    assert binding.set_rows([(1, "a"), (2, "B")]) == first
+    assert tree.operations['item'] == 1
+    assert tree.rows() == [(1, "a"), (2, "B")]
+
+
+def test_set_rows_keeps_top_row_in_view():
+    tree = FakeTree()
+    binding = TreeBinding(tree)
+    binding.set_rows([(i, "x") for i in range(10)])
+    tree.top = 0.5
+    # Над первой видимой строкой (5) вставлено 10 строк
+    binding.set_rows([(i, "x") for i in range(-10, 10)])
+    assert tree.top == pytest.approx(15 / 20)
+
+
+def test_delete_and_insert_fuzz():
+    rng = random.Random(7)
+    tree = FakeTree()
+    binding = TreeBinding(tree)
+    expected = []
+    for _ in range(300):
+        action = rng.random()
+        if action < 0.4:
+            values = (rng.randrange(10), rng.choice("abc"))
+            index = rng.randint(0, len(expected) + 2)
+            binding.insert(index, values)
+            expected.insert(index, values)
+        elif action < 0.7:
+            keys = set(rng.sample(range(10), rng.randint(1, 3)))
+            removed = binding.delete(keys)
+            assert len(removed) == sum(1 for values in expected if values[0] in keys)
+            expected = [values for values in expected if values[0] not in keys]
+        elif action < 0.9:
+            expected = _rows(rng)
+            binding.set_rows(expected)
+        else:
+            more = _rows(rng)
+            binding.append(more)
+            expected += more
+        assert tree.rows() == expected
+        assert binding.order == tree.children
+    binding.clear()
+    assert tree.children == [] and len(binding) == 0
+
+
+class Task:
+    def __init__(self, fn, args, on_done, on_error):
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeExecutor:
+    """submit() без потоков: задачи выполняются вызовом run()"""
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, fn, *args, on_done, on_error):
+        task = Task(fn, args, on_done, on_error)
+        self.tasks.append(task)
+        return task
+
+    def run(self, error=None):
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            if task.cancelled:
+                continue
+            if error is not None:
+                task.on_error(error)
+            else:
+                task.on_done(task.fn(*task.args))
+
+
+class Rows:
+    """Строки с id 0..count-1: значение и сортировочное значение;
+    ключ сортировки - (сортировочное значение, id)"""
+
+    def __init__(self, count):
+        self.values = {i: f"v{i}" for i in range(count)}
+        self.sort = {i: f"{i:02}" for i in range(count)}
+        self.changed = set()
+        self.windows = []
+
+    def _sorted(self):
+        """Пары (строка, ключ) в порядке ключа"""
+        return sorted((((i, self.values[i]), (self.sort[i], i)) for i in self.values), key=lambda row: row[1])
+
+    def window(self, offset, limit, order, after):
+        self.windows.append((offset, after))
+        rows = self._sorted()
+        if after is not None:
+            rows = [row for row in rows if row[1] > after]
+            offset = 0
+        return rows[offset:offset + limit]
+
+    def count(self):
+        return len(self.values)
+
+    def change(self, i, value=None, sort=None):
+        self.values[i] = value or self.values[i]
+        self.sort[i] = sort or self.sort[i]
+        self.changed.add(i)
+
+    def patch(self, loaded, visible, order):
+        affected = self.changed & set(loaded)
+        return affected, [row for row in self._sorted() if row[0][0] in affected & set(visible)]
+
+
+def _source(count=10, **options):
+    rows = Rows(count)
+    executor = FakeExecutor()
+    errors = []
+    source = WindowedSource(rows.window, rows.count, executor.submit, on_error=errors.append,
+                            block_size=3, **options)
+    notified = []
+    source.subscribe(lambda: notified.append(True))
+    return source, rows, executor, errors, notified
+
+
+def test_blocks_loaded_on_demand_by_key():
+    source, rows, executor, _, notified = _source()
+    source.reset()
+    source.ensure(0, 5)
+    assert source.row(0) is None
+    executor.run()
+    assert source.count == 10
+    assert [source.row(i)[0] for i in range(5)] == [0, 1, 2, 3, 4]
+    assert source.row(6) is None
+    source.ensure(6, 7)
+    executor.run()
+    # Блок после полностью загруженного читается по ключу его последней строки
+    assert rows.windows[-1] == (6, ("05", 5))
+    assert source.row(6)[0] == 6
+    assert notified
+
+
+def test_least_recently_used_block_evicted():
+    source, _, executor, _, _ = _source(max_blocks=2)
+    source.reset(10)
+    source.ensure(0, 6)
+    executor.run()
+    source.row(0)
+    source.ensure(6, 7)
+    executor.run()
+    assert source.row(0) is not None
+    assert source.row(3) is None
+
+
+def test_stale_results_ignored_after_reset():
+    source, _, executor, _, _ = _source()
+    source.reset(10)
+    source.ensure(0, 3)
+    [old] = executor.tasks
+    source.reset(10)
+    assert old.cancelled
+    old.on_done([((99, "x"), ("x", 99))])
+    assert source.row(0) is None
+
+
+def test_failed_block_reported_and_loaded_again():
+    source, _, executor, errors, _ = _source()
+    source.reset(10)
+    source.ensure(0, 3)
+    executor.run(error=RuntimeError("нет соединения"))
+    assert [str(error) for error in errors] == ["нет соединения"]
+    source.ensure(0, 3)
+    executor.run()
+    assert source.row(0)[0] == 0
+
+
+def test_refresh_shows_previous_rows_until_loaded():
+    source, rows, executor, _, _ = _source()
+    source.reset(10)
+    source.ensure(0, 3)
+    executor.run()
+    rows.change(0, sort="z")
+    source.refresh()
+    assert source.row(0) == (0, "v0")
+    source.ensure(0, 3)
+    executor.run()
+    assert source.row(0) == (1, "v1")
+
+
+def test_patch_updates_visible_rows_and_drops_far_blocks():
+    source, rows, executor, _, notified = _source(count=12)
+    source.reset(12)
+    source.ensure(0, 12)
+    executor.run()
+    # Значения меняются, место в списке - нет
+    rows.change(1, value="v1*")
+    rows.change(10, value="v10*")
+    notified.clear()
+    source.patch(rows.patch, 0, 3)
+    executor.run()
+    assert source.row(1) == (1, "v1*")
+    assert source.row(0) == (0, "v0")
+    # Блок с затронутой строкой вне видимых выгружен, остальные на месте
+    assert source.row(10) is None
+    assert source.row(7) == (7, "v7")
+    assert notified
+
+
+def test_patch_with_changed_sort_key_refreshes():
+    source, rows, executor, _, _ = _source()
+    source.reset(10)
+    source.ensure(0, 3)
+    executor.run()
+    rows.change(1, sort="z")
+    source.patch(rows.patch, 0, 3)
+    executor.run()
+    # Строка сменила место - список перечитывается, пока видны прежние строки
+    assert source.row(1) == (1, "v1")
+    assert any(task.fn == rows.count for task in executor.tasks)
+    source.ensure(0, 3)
+    executor.run()
+    assert source.row(1) == (2, "v2")
+
+
+def test_patch_while_loading_refreshes():
+    source, rows, executor, _, _ = _source()
+    source.reset(10)
+    source.ensure(0, 3)
+    executor.run()
+    source.ensure(3, 6)
+    pending = executor.tasks[0]
+    source.patch(rows.patch, 0, 3)
+    assert pending.cancelled
+    assert all(task.fn != rows.patch for task in executor.tasks)
+
+
+def test_patch_failure_reported():
+    source, rows, executor, errors, _ = _source()
+    source.reset(10)
+    source.ensure(0, 3)
+    executor.run()
+    source.patch(rows.patch, 0, 3)
+    executor.run(error=RuntimeError("отмена"))
+    assert [str(error) for error in errors] == ["отмена"]
+    assert source._patch_tasks == []
@@ -0,0 +1,90 @@
+# test_window.py
+import random
+
+import pytest
+
+from database import Database, _keyset_after, _window_query, _window_result
+
+# Список с NULL и повторами в колонках сортировки
+_RANDOM = random.Random(15)
+_ROWS = [(i, _RANDOM.choice(['a', 'b', 'c', None]), _RANDOM.choice([1999, 2005, None]))
+         for i in range(1, 41)]
+_QUERY = """
+    SELECT id, name, year, coalesce(name, '') AS sort_key_0, id AS sort_key_1
+    FROM (VALUES {}) AS v(id, name, year)
+    """.format(', '.join(['(%s, %s::text, %s::int)'] * len(_ROWS)))
+_PARAMS = [value for row in _ROWS for value in row]
+_COLUMNS = ('id', 'name', 'year')
+
+ORDERS = [None, (1, False), (1, True), (2, False), (2, True)]
+
+
+def _window(conn, offset=0, limit=1000, order=None, after=None):
+    query, params = _window_query(_QUERY, _PARAMS, 2, _COLUMNS, offset, limit, order, after)
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return _window_result(cursor.fetchall(), 2, order)
+
+
+def _expected(order):
+    if order is None:
+        return sorted(_ROWS, key=lambda row: (row[1] or '', row[0]))
+    index, descending = order
+    # NULL в конце при любом направлении, затем порядок по умолчанию
+    present = sorted((row for row in _ROWS if row[index] is not None),
+                     key=lambda row: row[index], reverse=descending)
+    result = []
+    for value in dict.fromkeys(row[index] for row in present):
+        result += sorted((row for row in present if row[index] == value), key=lambda row: (row[1] or '', row[0]))
+    return result + sorted((row for row in _ROWS if row[index] is None), key=lambda row: (row[1] or '', row[0]))
+
+
+def test_keyset_after_skips_null_columns():
+    condition, params = _keyset_after(['a', 'b'], [True, False], (None, 3))
+    assert condition == "(a IS NULL AND (b > %s OR b IS NULL))"
+    assert params == [3]
+
+
+def test_keyset_after_nothing_after_all_null_key():
+    assert _keyset_after(['a'], [False], (None,)) == ('FALSE', [])
+
+
+def test_window_result_puts_sort_value_first():
+    row = (1, 'x', 'sk0', 1, 'value')
+    assert _window_result([row], 2, (1, False)) == [((1, 'x'), ('value', 'sk0', 1))]
+    assert _window_result([row[:-1]], 2) == [((1, 'x'), ('sk0', 1))]
+
+
+@pytest.mark.parametrize('order', ORDERS)
+def test_full_window_order(conn, order):
+    assert [values for values, _ in _window(conn, order=order)] == _expected(order)
+
+
+@pytest.mark.parametrize('order', ORDERS)
+@pytest.mark.parametrize('limit', [1, 7, 40])
+def test_windows_by_key_match_offsets(conn, order, limit):
+    expected = _expected(order)
+    rows = []
+    after = None
+    while True:
+        window = _window(conn, len(rows), limit, order, after)
+        # Окно по ключу совпадает с окном по смещению
+        assert window == _window(conn, len(rows), limit, order)
+        rows += [values for values, _ in window]
+        if len(window) < limit:
+            break
+        after = window[-1][1]
+    assert rows == expected
+
+
+@pytest.mark.parametrize('order', ORDERS)
+def test_rows_by_id_match_window(dsn, order):
+    db = Database({'dsn': dsn}, min_size=1, max_size=1)
+    try:
+        window = db.get_artists_window(None, 0, 20, order)
+        ids = [values[0] for values, _ in window[::3]]
+        rows = db.get_artists_rows(None, ids, order)
+        assert {values[0]: (values, key) for values, key in rows} == \
+            {values[0]: (values, key) for values, key in window if values[0] in ids}
+    finally:
+        db.close()
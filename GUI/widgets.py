@@ -0,0 +1,601 @@
+# widgets.py
+from bisect import bisect_left
+from collections import OrderedDict
+from tkinter import ttk
+
+from config import PAGE_SIZE, WINDOW_BLOCKS
+
+
+def _stable_positions(sequence):
+    """Индексы наибольшей возрастающей подпоследовательности sequence.
+    Эти строки уже стоят в нужном порядке, двигать нужно только остальные."""
+    tails = []
+    tail_indexes = []
+    previous = [-1] * len(sequence)
+    for i, value in enumerate(sequence):
+        j = bisect_left(tails, value)
+        if j == len(tails):
+            tails.append(value)
+            tail_indexes.append(i)
+        else:
+            tails[j] = value
+            tail_indexes[j] = i
+        previous[i] = tail_indexes[j - 1] if j else -1
+
+    stable = set()
+    i = tail_indexes[-1] if tail_indexes else -1
+    while i >= 0:
+        stable.add(i)
+        i = previous[i]
+    return stable
+
+
+class TreeBinding:
+    """Связь плоского Treeview со списком строк, адресуемых ключом (обычно id).
+
+    set_rows() приводит дерево к новому списку минимальным набором вставок,
+    изменений, удалений и перемещений; выделение и прокрутка сохраняются.
+    Строки с одинаковым ключом допускаются (например, носитель с несколькими
+    артистами) и различаются порядковым номером.
+    """
+
+    def __init__(self, tree, key=lambda values: values[0]):
+        self.tree = tree
+        self.key = key
+        self.order = []
+        self._iids = {}
+        self._values = {}
+        self._item_keys = {}
+        self._counts = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def set_rows(self, rows):
+        """Показать rows (значения строк по порядку). Возвращает iid строк."""
+        top, top_offset = self._top_item()
+
+        desired = []
+        counts = {}
+        for values in rows:
+            values = tuple(values)
+            key = self.key(values)
+            n = counts.get(key, 0)
+            counts[key] = n + 1
+            desired.append(((key, n), values))
+
+        # Удаление строк, которых нет в новом списке
+        wanted = {item_key for item_key, _ in desired}
+        removed = [iid for item_key, iid in self._iids.items() if item_key not in wanted]
+        if removed:
+            self.tree.delete(*removed)
+            for iid in removed:
+                del self._iids[self._item_keys.pop(iid)]
+                del self._values[iid]
+
+        # Изменение значений оставшихся строк
+        positions = {iid: i for i, iid in enumerate(self.order) if iid in self._values}
+        existing = []
+        for item_key, values in desired:
+            iid = self._iids.get(item_key)
+            if iid is None:
+                continue
+            if self._values[iid] != values:
+                self.tree.item(iid, values=values)
+                self._values[iid] = values
+            existing.append(iid)
+
+        # Строки вне возрастающей подпоследовательности отцепляются и
+        # вставляются на место; остальные не трогаются
+        stable = _stable_positions([positions[iid] for iid in existing])
+        moved = [iid for i, iid in enumerate(existing) if i not in stable]
+        selection = self.tree.selection() if moved else ()
+        if moved:
+            self.tree.detach(*moved)
+        stable_left = len(stable)
+        moved = set(moved)
+
+        order = []
+        for index, (item_key, values) in enumerate(desired):
+            iid = self._iids.get(item_key)
+            at = 'end' if stable_left == 0 else index
+            if iid is None:
+                iid = self.tree.insert('', at, values=values)
+                self._iids[item_key] = iid
+                self._values[iid] = values
+                self._item_keys[iid] = item_key
+            elif iid in moved:
+                self.tree.move(iid, '', at)
+            else:
+                stable_left -= 1
+            order.append(iid)
+
+        self.order = order
+        self._counts = counts
+        # Отцепленные строки выпадают из выделения
+        if selection:
+            self.tree.selection_set(selection)
+        self._restore_top(top, top_offset)
+        return order
+
+    def append(self, rows):
+        """Добавить строки в конец. Возвращает iid добавленных строк."""
+        return [self.insert(len(self.order), values) for values in rows]
+
+    def insert(self, index, values):
+        """Вставить строку в позицию index. Возвращает ее iid."""
+        values = tuple(values)
+        key = self.key(values)
+        n = self._counts.get(key, 0)
+        self._counts[key] = n + 1
+        at = 'end' if index >= len(self.order) else index
+        iid = self.tree.insert('', at, values=values)
+        self._iids[(key, n)] = iid
+        self._values[iid] = values
+        self._item_keys[iid] = (key, n)
+        self.order.insert(index, iid)
+        return iid
+
+    def delete(self, keys):
+        """Удалить все строки с ключами keys. Возвращает iid удаленных строк."""
+        removed = []
+        for key in keys:
+            for n in range(self._counts.pop(key, 0)):
+                iid = self._iids.pop((key, n), None)
+                if iid is not None:
+                    removed.append(iid)
+        if removed:
+            self.tree.delete(*removed)
+            gone = set(removed)
+            self.order = [iid for iid in self.order if iid not in gone]
+            for iid in removed:
+                del self._values[iid]
+                del self._item_keys[iid]
+        return removed
+
+    def clear(self):
+        self.tree.delete(*self.order)
+        self.order = []
+        self._iids.clear()
+        self._values.clear()
+        self._item_keys.clear()
+        self._counts.clear()
+
+    def _top_item(self):
+        """Первая видимая строка и доля ее высоты, ушедшая за край"""
+        if not self.order:
+            return None, 0
+        position = float(self.tree.yview()[0]) * len(self.order)
+        index = min(int(position), len(self.order) - 1)
+        return self.order[index], position - index
+
+    def _restore_top(self, top, offset):
+        # Прокрутка по доле сдвигается, когда строки выше вставлены или удалены
+        if top is None or top not in self._values or not self.order:
+            return
+        index = self.order.index(top)
+        if index or offset:
+            self.tree.yview_moveto((index + offset) / len(self.order))
+
+
+class WindowedSource:
+    """Строки большого списка, загружаемые блоками по мере надобности.
+
+    fetch_window(offset, limit, order, after) возвращает пары (значения, ключ)
+    (см. Database._window), fetch_count() - число строк. Запросы идут через
+    submit(fn, *args, on_done=..., on_error=...) (DbExecutor.submit), результаты
+    принимаются в потоке Tk; ошибки запросов передаются в on_error(ошибка).
+    В памяти держится не больше max_blocks блоков; после каждой загрузки
+    вызываются обработчики subscribe().
+    """
+
+    def __init__(self, fetch_window, fetch_count, submit, on_error=None,
+                 block_size=PAGE_SIZE, max_blocks=WINDOW_BLOCKS):
+        self.fetch_window = fetch_window
+        self.fetch_count = fetch_count
+        self.submit = submit
+        self.on_error = on_error
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.count = 0
+        self.order = None
+        self._blocks = OrderedDict()
+        self._stale = {}
+        self._tasks = {}
+        self._count_task = None
+        self._patch_tasks = []
+        self._generation = 0
+        self._handlers = []
+
+    def subscribe(self, handler):
+        """Вызывать handler() после изменения данных"""
+        self._handlers.append(handler)
+
+    def row(self, index):
+        """Значения строки index или None, если ее блок не загружен.
+        Пока список перечитывается, возвращаются прежние значения."""
+        block_no, i = divmod(index, self.block_size)
+        block = self._blocks.get(block_no)
+        if block is not None:
+            self._blocks.move_to_end(block_no)
+        else:
+            block = self._stale.get(block_no)
+        if block is not None and i < len(block):
+            return block[i][0]
+        return None
+
+    def ensure(self, start, stop):
+        """Загрузить недостающие блоки строк start..stop-1"""
+        if stop <= start:
+            return
+        for block_no in range(start // self.block_size, (stop - 1) // self.block_size + 1):
+            if block_no not in self._blocks:
+                self._load(block_no)
+
+    def reset(self, count=None, rows=None):
+        """Начать список заново (новый поиск, сортировка).
+        count и rows - уже полученные число строк и первый блок."""
+        self._restart()
+        self._stale.clear()
+        if count is None:
+            self.count = 0
+            self._load_count()
+        else:
+            self.count = count
+        if rows is not None:
+            self._store(0, rows)
+        self._notify()
+
+    def refresh(self):
+        """Перечитать список; до прихода новых данных видны прежние"""
+        self._stale.update(self._blocks)
+        self._restart()
+        self._load_count()
+        self._notify()
+
+    def patch(self, fetch, start, stop, id_index=0):
+        """Обновить на месте загруженные строки, затронутые изменением.
+        fetch(id загруженных строк, id строк блоков start..stop-1, сортировка)
+        выполняется в фоне и возвращает (id затронутых строк, пары (строка,
+        ключ) тех из них, что в блоках start..stop-1). Остальные блоки с
+        затронутыми строками выгружаются и загрузятся при прокрутке. Если
+        строка пропала из списка или сменила ключ сортировки (место),
+        список перечитывается."""
+        if self._tasks or self._count_task is not None or self._stale:
+            # Загружаемые сейчас блоки могли быть прочитаны до изменения
+            self.refresh()
+            return
+        near = set(range(start // self.block_size, (stop - 1) // self.block_size + 1)) if stop > start else set()
+        loaded = {values[id_index] for block in self._blocks.values() for values, _ in block}
+        if not loaded:
+            return
+        visible = {values[id_index] for block_no in near & set(self._blocks)
+                   for values, _ in self._blocks[block_no]}
+
+        generation = self._generation
+        task = self.submit(
+            fetch, loaded, visible, self.order,
+            on_done=lambda result: self._patched(generation, task, near, id_index, *result),
+            on_error=lambda error: self._patch_failed(generation, task, error))
+        self._patch_tasks.append(task)
+
+    def _patched(self, generation, task, near, id_index, affected, rows):
+        if generation != self._generation:
+            return
+        self._patch_tasks.remove(task)
+        rows = {values[id_index]: (values, key) for values, key in rows}
+        for block_no in list(self._blocks):
+            block = self._blocks[block_no]
+            changed = [i for i, (values, _) in enumerate(block) if values[id_index] in affected]
+            if not changed:
+                continue
+            if block_no not in near:
+                del self._blocks[block_no]
+                continue
+            for i in changed:
+                row = rows.get(block[i][0][id_index])
+                if row is None or row[1] != block[i][1]:
+                    self.refresh()
+                    return
+                block[i] = row
+        self._notify()
+
+    def _patch_failed(self, generation, task, error):
+        if generation != self._generation:
+            return
+        self._patch_tasks.remove(task)
+        if self.on_error:
+            self.on_error(error)
+
+    def set_order(self, order):
+        """Сортировка (индекс колонки, по убыванию) или None - порядок по умолчанию"""
+        self.order = order
+        self.reset(self.count)
+
+    def _restart(self):
+        self._generation += 1
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        if self._count_task is not None:
+            self._count_task.cancel()
+            self._count_task = None
+        for task in self._patch_tasks:
+            task.cancel()
+        self._patch_tasks.clear()
+        self._blocks.clear()
+
+    def _load(self, block_no):
+        if block_no in self._tasks:
+            return
+        # Следующий блок удобнее читать по ключу, чем пропускать строки через OFFSET
+        after = None
+        previous = self._blocks.get(block_no - 1)
+        if previous is not None and len(previous) == self.block_size:
+            after = previous[-1][1]
+
+        generation = self._generation
+        self._tasks[block_no] = self.submit(
+            self.fetch_window, block_no * self.block_size, self.block_size, self.order, after,
+            on_done=lambda rows: self._loaded(generation, block_no, rows),
+            on_error=lambda error: self._failed(generation, block_no, error))
+
+    def _loaded(self, generation, block_no, rows):
+        if generation != self._generation:
+            return
+        del self._tasks[block_no]
+        self._store(block_no, rows)
+        self._notify()
+
+    def _failed(self, generation, block_no, error):
+        if generation != self._generation:
+            return
+        del self._tasks[block_no]
+        if self.on_error:
+            self.on_error(error)
+
+    def _load_count(self):
+        generation = self._generation
+
+        def done(count):
+            if generation == self._generation:
+                self._count_task = None
+                self.count = count
+                self._notify()
+
+        def failed(error):
+            if generation == self._generation:
+                self._count_task = None
+                if self.on_error:
+                    self.on_error(error)
+
+        self._count_task = self.submit(self.fetch_count, on_done=done, on_error=failed)
+
+    def _store(self, block_no, rows):
+        self._blocks[block_no] = rows
+        self._blocks.move_to_end(block_no)
+        self._stale.pop(block_no, None)
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+    def _notify(self):
+        for handler in self._handlers:
+            handler()
+
+
+class VirtualTable:
+    """Treeview, в котором существуют только видимые строки.
+
+    Строки берутся из WindowedSource по позиции, поэтому память и время
+    отрисовки не зависят от длины списка. Полоса прокрутки, колесо мыши и
+    клавиши двигают окно. Выделение хранится по id строки (колонка id_index)
+    и сохраняется при прокрутке, обновлении и сортировке. Щелчок по
+    заголовку сортирует список по колонке, повторный - в обратном порядке.
+    """
+
+    PLACEHOLDER = ('…',)
+
+    def __init__(self, tree, scrollbar, source, id_index=0, prefetch=1.0):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.source = source
+        self.id_index = id_index
+        self.prefetch = prefetch
+        self.offset = 0
+        self.cursor = None
+        self.anchor = None
+        self.selected = OrderedDict()
+        self._items = []
+        self._shown = []
+        self._select_cursor = False
+        self._render_pending = False
+        self._row_height = int(ttk.Style(tree).lookup('Treeview', 'rowheight') or 20)
+        self._header_height = self._row_height
+
+        self._headings = {}
+        for index, column in enumerate(tree['columns']):
+            self._headings[column] = tree.heading(column, 'text')
+            tree.heading(column, command=lambda index=index: self.sort_by(index))
+
+        scrollbar.configure(command=self._on_scrollbar)
+        tree.configure(yscrollcommand='')
+        tree.bind('<Configure>', lambda event: self.schedule_render())
+        tree.bind('<Button-1>', self._on_click)
+        tree.bind('<Control-Button-1>', lambda event: self._on_click(event, toggle=True))
+        tree.bind('<Shift-Button-1>', lambda event: self._on_click(event, extend=True))
+        tree.bind('<MouseWheel>', lambda event: self._scroll_by(-3 if event.delta > 0 else 3))
+        tree.bind('<Button-4>', lambda event: self._scroll_by(-3))
+        tree.bind('<Button-5>', lambda event: self._scroll_by(3))
+        tree.bind('<Up>', lambda event: self._move_cursor(-1))
+        tree.bind('<Down>', lambda event: self._move_cursor(1))
+        tree.bind('<Prior>', lambda event: self._move_cursor(-self._visible_rows()))
+        tree.bind('<Next>', lambda event: self._move_cursor(self._visible_rows()))
+        tree.bind('<Home>', lambda event: self._move_cursor(-self.source.count))
+        tree.bind('<End>', lambda event: self._move_cursor(self.source.count))
+        source.subscribe(self.schedule_render)
+
+    def refresh(self):
+        """Перечитать список, сохранив позицию и выделение"""
+        self.source.refresh()
+
+    def patch(self, fetch):
+        """Обновить видимые строки, затронутые изменением, не перечитывая
+        окно (см. WindowedSource.patch)"""
+        start = max(0, self.offset)
+        self.source.patch(fetch, start, min(self.source.count, start + self._visible_rows()), self.id_index)
+
+    def reset(self, count=None, rows=None):
+        """Показать новый список (например, результат поиска) с начала"""
+        self.offset = 0
+        self.cursor = self.anchor = None
+        self.source.reset(count, rows)
+
+    def sort_by(self, index):
+        order = self.source.order
+        descending = order is not None and order[0] == index and not order[1]
+        for i, column in enumerate(self.tree['columns']):
+            text = self._headings[column]
+            if i == index:
+                text += ' ▼' if descending else ' ▲'
+            self.tree.heading(column, text=text)
+        self.offset = 0
+        self.cursor = self.anchor = None
+        self.source.set_order((index, descending))
+
+    def selected_rows(self):
+        """Значения выделенных строк"""
+        return list(self.selected.values())
+
+    def deselect(self, ids):
+        for row_id in ids:
+            self.selected.pop(row_id, None)
+        self.schedule_render()
+
+    def schedule_render(self):
+        if not self._render_pending:
+            self._render_pending = True
+            self.tree.after_idle(self.render)
+
+    def render(self):
+        """Показать строки окна: меняются только отличающиеся значения"""
+        self._render_pending = False
+        count = self.source.count
+        visible = self._visible_rows()
+        self.offset = max(0, min(self.offset, count - visible))
+        shown = max(0, min(visible, count - self.offset))
+
+        while len(self._items) < shown:
+            self._items.append(self.tree.insert('', 'end', values=self.PLACEHOLDER))
+            self._shown.append(self.PLACEHOLDER)
+        if len(self._items) > shown:
+            self.tree.delete(*self._items[shown:])
+            del self._items[shown:]
+            del self._shown[shown:]
+
+        ahead = int(visible * self.prefetch)
+        self.source.ensure(max(0, self.offset - ahead), min(count, self.offset + visible + ahead))
+
+        if self._select_cursor and self.cursor is not None:
+            values = self.source.row(self.cursor)
+            if values is not None:
+                self._select_cursor = False
+                self.selected = OrderedDict([(values[self.id_index], values)])
+                self.anchor = self.cursor
+
+        selection = []
+        for i, iid in enumerate(self._items):
+            values = self.source.row(self.offset + i)
+            if values is None:
+                values = self.PLACEHOLDER
+            elif values[self.id_index] in self.selected:
+                self.selected[values[self.id_index]] = values
+                selection.append(iid)
+            if values != self._shown[i]:
+                self.tree.item(iid, values=values)
+                self._shown[i] = values
+        if set(selection) != set(self.tree.selection()):
+            self.tree.selection_set(selection)
+        if self.cursor is not None and 0 <= self.cursor - self.offset < len(self._items):
+            self.tree.focus(self._items[self.cursor - self.offset])
+
+        if count:
+            self.scrollbar.set(self.offset / count, min(1.0, (self.offset + visible) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+        # Высота строки и заголовка уточняется по первой показанной строке
+        if self._items:
+            bbox = self.tree.bbox(self._items[0])
+            if bbox and (bbox[1], bbox[3]) != (self._header_height, self._row_height):
+                self._header_height, self._row_height = bbox[1], bbox[3]
+                self.schedule_render()
+
+    def _visible_rows(self):
+        if not self.tree.winfo_ismapped():
+            return int(self.tree.cget('height'))
+        return max(1, (self.tree.winfo_height() - self._header_height) // self._row_height)
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(offset, self.source.count - self._visible_rows()))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        return 'break'
+
+    def _scroll_by(self, rows):
+        return self._scroll_to(self.offset + rows)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._scroll_to(round(float(amount) * self.source.count))
+        elif action == 'scroll':
+            step = self._visible_rows() if unit == 'pages' else 1
+            self._scroll_by(int(amount) * step)
+
+    def _on_click(self, event, toggle=False, extend=False):
+        # Заголовки и границы колонок обрабатывает сам Treeview
+        if self.tree.identify_region(event.x, event.y) not in ('cell', 'tree'):
+            return None
+        self.tree.focus_set()
+        iid = self.tree.identify_row(event.y)
+        if iid not in self._items:
+            return 'break'
+        index = self.offset + self._items.index(iid)
+        values = self.source.row(index)
+        if values is None:
+            return 'break'
+
+        row_id = values[self.id_index]
+        if toggle:
+            if self.selected.pop(row_id, None) is None:
+                self.selected[row_id] = values
+            self.anchor = index
+        elif extend and self.anchor is not None:
+            # Диапазон берется из загруженных строк
+            self.selected = OrderedDict()
+            for i in range(min(self.anchor, index), max(self.anchor, index) + 1):
+                row = self.source.row(i)
+                if row is not None:
+                    self.selected[row[self.id_index]] = row
+        else:
+            self.selected = OrderedDict([(row_id, values)])
+            self.anchor = index
+        self.cursor = index
+        self._select_cursor = False
+        self.render()
+        return 'break'
+
+    def _move_cursor(self, rows):
+        count = self.source.count
+        if not count:
+            return 'break'
+        cursor = self.offset if self.cursor is None else self.cursor
+        self.cursor = max(0, min(cursor + rows, count - 1))
+        self._select_cursor = True
+        visible = self._visible_rows()
+        if self.cursor < self.offset:
+            self.offset = self.cursor
+        elif self.cursor >= self.offset + visible:
+            self.offset = self.cursor - visible + 1
+        self.render()
+        return 'break'